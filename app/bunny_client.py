@@ -1,9 +1,18 @@
+import io
 import os
+import queue
+import socket
+import hashlib
+import threading
+import contextvars
 import aiohttp
 import requests
 from dotenv import load_dotenv
 load_dotenv()
 
+from .cancellation import check_cancelled, on_cancel
+from .transfer_scheduler import transfer_scheduler, CHUNK_SIZE
+
 SRC_KEY = os.getenv("SOURCE_BUNNY_API_KEY")
 SRC_ZONE = os.getenv("SOURCE_BUNNY_STORAGE_ZONE")
 SRC_HOST = os.getenv("SOURCE_BUNNY_STORAGE_HOST")
@@ -12,6 +21,67 @@ DST_KEY = os.getenv("DEST_BUNNY_API_KEY")
 DST_ZONE = os.getenv("DEST_BUNNY_STORAGE_ZONE")
 DST_HOST = os.getenv("DEST_BUNNY_STORAGE_HOST")
 
+# Override with 'http' to point the client at a local stand-in (see benchmarks/fake_bunny.py)
+STORAGE_SCHEME = os.getenv("BUNNY_STORAGE_SCHEME", "https")
+
+# Seconds without receiving data before a transfer socket read gives up
+TRANSFER_READ_TIMEOUT = float(os.getenv("TRANSFER_READ_TIMEOUT", "60"))
+# Seconds to wait for storage to acknowledge a fully sent upload
+UPLOAD_RESPONSE_TIMEOUT = float(os.getenv("UPLOAD_RESPONSE_TIMEOUT", "300"))
+
+# Chunks buffered per destination in a fan-out upload, so one slow link does not hold back the others
+FANOUT_BUFFER_CHUNKS = int(os.getenv("FANOUT_BUFFER_CHUNKS", "64"))
+
+
+class ProgressReader:
+    """File wrapper that hashes and reports bytes read, so requests can stream it with a Content-Length
+
+    urllib3 rewinds the body through tell()/seek() before retrying a request,
+    so the digest and accounting start over with it.
+    """
+
+    def __init__(self, f, size, progress_callback=None, transfer=None):
+        self._f = f
+        self.len = size
+        self.bytes_read = 0
+        self.progress_callback = progress_callback
+        self.transfer = transfer
+        self.sha256 = hashlib.sha256()
+
+    def read(self, size=-1):
+        chunk = self._f.read(size)
+        if self.transfer and chunk:
+            self.transfer.consume(len(chunk))
+        self.bytes_read += len(chunk)
+        self.sha256.update(chunk)
+        if self.progress_callback:
+            self.progress_callback(self.bytes_read)
+        return chunk
+
+    def tell(self):
+        return self.bytes_read
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if (offset, whence) != (0, os.SEEK_SET):
+            raise io.UnsupportedOperation("ProgressReader can only rewind to the start")
+        self._f.seek(0)
+        self.bytes_read = 0
+        self.sha256 = hashlib.sha256()
+        if self.transfer:
+            self.transfer.restart()
+        if self.progress_callback:
+            self.progress_callback(0)
+        return 0
+
+def file_sha256(path):
+    """SHA-256 hex digest of a local file"""
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            check_cancelled()
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
 async def list_files(path=""):
     if not all([SRC_KEY, SRC_ZONE, SRC_HOST]):
         raise ValueError("Missing source Bunny CDN configuration. Check your .env file.")
@@ -22,7 +92,7 @@ async def list_files(path=""):
     if path.startswith('/'):
         path = path[1:]
     
-    url = f"https://{SRC_HOST}/{SRC_ZONE}/{path}"
+    url = f"{STORAGE_SCHEME}://{SRC_HOST}/{SRC_ZONE}/{path}"
     headers = {"AccessKey": SRC_KEY}
     
     async with aiohttp.ClientSession() as session:
@@ -41,7 +111,8 @@ async def list_files(path=""):
                     directories.append({
                         'name': item['ObjectName'],
                         'path': path + item['ObjectName'],
-                        'type': 'directory'
+                        'type': 'directory',
+                        'last_modified': item.get('LastChanged', '')
                     })
                 else:
                     # Filter for video files
@@ -52,7 +123,8 @@ async def list_files(path=""):
                             'path': path + name,
                             'size': item.get('Length', 0),
                             'type': 'file',
-                            'last_modified': item.get('LastChanged', '')
+                            'last_modified': item.get('LastChanged', ''),
+                            'checksum': (item.get('Checksum') or '').lower() or None
                         })
             
             return {
@@ -62,36 +134,86 @@ async def list_files(path=""):
                 'files': video_files
             }
 
-def download_file(file_path, dest):
+def _shutdown_response(response):
+    """Unblock a thread reading a streamed response; closing alone does not interrupt a blocked recv"""
+    sock = getattr(getattr(response.raw, '_connection', None), 'sock', None)
+    if sock:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+def source_request(file_path):
+    """URL and auth headers for an object in the source zone"""
+    return f"{STORAGE_SCHEME}://{SRC_HOST}/{SRC_ZONE}/{file_path}", {"AccessKey": SRC_KEY}
+
+def download_file(file_path, dest, progress_callback=None, expected_sha256=None):
+    """Download a file, returning the SHA-256 hex digest computed while streaming"""
     if not all([SRC_KEY, SRC_ZONE, SRC_HOST]):
         raise ValueError("Missing source Bunny CDN configuration. Check your .env file.")
     
     # file_path now includes the full path within the storage zone
-    url = f"https://{SRC_HOST}/{SRC_ZONE}/{file_path}"
-    headers = {"AccessKey": SRC_KEY}
+    url, headers = source_request(file_path)
     
     # Ensure destination directory exists
     os.makedirs(os.path.dirname(dest), exist_ok=True)
     
+    # Write to a partial file and rename once complete, so a crash never leaves
+    # a truncated file that looks like a finished download
+    partial = dest + ".part"
     try:
-        with requests.get(url, headers=headers, stream=True) as r:
+        with transfer_scheduler.transfer('download', SRC_HOST) as transfer, \
+                requests.get(url, headers=headers, stream=True, timeout=(30, TRANSFER_READ_TIMEOUT)) as r, \
+                on_cancel(lambda: _shutdown_response(r)):
+            if r.status_code == 429:
+                transfer_scheduler.throttle(SRC_HOST, r.headers.get('Retry-After'))
             r.raise_for_status()
-            with open(dest, "wb") as f:
-                for chunk in r.iter_content(chunk_size=8192):
+            transfer.total_bytes = int(r.headers.get('Content-Length', 0)) or None
+            received = 0
+            sha256 = hashlib.sha256()
+            with open(partial, "wb") as f:
+                for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
                     if chunk:  # Filter out keep-alive chunks
+                        transfer.consume(len(chunk))
                         f.write(chunk)
+                        sha256.update(chunk)
+                        received += len(chunk)
+                        if progress_callback:
+                            progress_callback(received)
+            # A shut-down socket reads as a truncated body; report it as the cancellation it was
+            check_cancelled()
+        
+        digest = sha256.hexdigest()
+        if expected_sha256 and digest != expected_sha256.lower():
+            raise Exception(f"Checksum mismatch for '{file_path}': expected {expected_sha256.lower()}, got {digest}")
+        os.replace(partial, dest)
+        return digest
     except requests.exceptions.RequestException as e:
+        check_cancelled()
         raise Exception(f"Failed to download file '{file_path}': {str(e)}")
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+
+def upload_file(path, dest_name, progress_callback=None, checksum=None, destination=None):
+    """Upload a file, returning the SHA-256 hex digest of the bytes sent.
 
-def upload_file(path, dest_name):
-    if not all([DST_KEY, DST_ZONE, DST_HOST]):
+    The checksum goes in Bunny's Checksum header, so storage rejects a body
+    that arrives corrupted. It is computed from the file first unless the
+    caller already knows it (e.g. hashed after validation, or an earlier attempt).
+    `destination` (api_key, zone, host) defaults to the DEST_BUNNY_* zone.
+    """
+    key, zone, host = (destination.api_key, destination.zone, destination.host) if destination \
+        else (DST_KEY, DST_ZONE, DST_HOST)
+    if not all([key, zone, host]):
         raise ValueError("Missing destination Bunny CDN configuration. Check your .env file.")
     
     if not os.path.exists(path):
         raise FileNotFoundError(f"File to upload not found: {path}")
     
-    url = f"https://{DST_HOST}/{DST_ZONE}/{dest_name}"
-    headers = {"AccessKey": DST_KEY}
+    url = f"{STORAGE_SCHEME}://{host}/{zone}/{dest_name}"
+    checksum = checksum or file_sha256(path)
+    headers = {"AccessKey": key, "Checksum": checksum.upper()}
     
     # Get file size for progress tracking
     file_size = os.path.getsize(path)
@@ -112,38 +234,45 @@ def upload_file(path, dest_name):
         total=3,
         backoff_factor=1,
         status_forcelist=[429, 500, 502, 503, 504],
-        allowed_methods=["PUT"]
+        allowed_methods=["PUT"],
+        raise_on_status=False  # Hand back the last response, so a final 429 can pause the host
     )
     
     adapter = HTTPAdapter(max_retries=retry_strategy)
-    session.mount("https://", adapter)
+    session.mount(f"{STORAGE_SCHEME}://", adapter)
     
     try:
-        with open(path, "rb") as f:
+        with open(path, "rb") as f, transfer_scheduler.transfer('upload', host, file_size) as transfer:
+            reader = ProgressReader(f, file_size, progress_callback, transfer)
             # Use session with timeout and SSL verification disabled for problematic connections
             resp = session.put(
                 url, 
                 headers=headers, 
-                data=f,
-                timeout=(30, 300),  # Connect timeout 30s, read timeout 5min
+                data=reader,
+                timeout=(30, UPLOAD_RESPONSE_TIMEOUT),
                 verify=True  # Keep SSL verification but handle errors gracefully
             )
+            if resp.status_code == 429:
+                transfer_scheduler.throttle(host, resp.headers.get('Retry-After'))
             resp.raise_for_status()
-            return True
+            return reader.sha256.hexdigest()
             
     except requests.exceptions.SSLError as e:
         # Try again with SSL verification disabled
         try:
-            with open(path, "rb") as f:
+            with open(path, "rb") as f, transfer_scheduler.transfer('upload', host, file_size) as transfer:
+                reader = ProgressReader(f, file_size, progress_callback, transfer)
                 resp = session.put(
                     url, 
                     headers=headers, 
-                    data=f,
-                    timeout=(30, 300),
+                    data=reader,
+                    timeout=(30, UPLOAD_RESPONSE_TIMEOUT),
                     verify=False  # Disable SSL verification as fallback
                 )
+                if resp.status_code == 429:
+                    transfer_scheduler.throttle(host, resp.headers.get('Retry-After'))
                 resp.raise_for_status()
-                return True
+                return reader.sha256.hexdigest()
         except requests.exceptions.RequestException as retry_e:
             raise Exception(f"Failed to upload file '{dest_name}' after SSL retry: {str(retry_e)}")
             
@@ -152,3 +281,115 @@ def upload_file(path, dest_name):
     
     finally:
         session.close()
+
+
+class FanOutBranch:
+    """One destination's view of a file that upload_fanout reads once; requests streams it like a file"""
+
+    def __init__(self, size, transfer):
+        self.len = size
+        self.transfer = transfer
+        self.chunks = queue.Queue(maxsize=FANOUT_BUFFER_CHUNKS)
+        self.error = None  # Set once the destination failed; the reader stops feeding it
+        self.aborted = False
+
+    def read(self, size=-1):
+        # Chunks come in the reader's size; http.client sends whatever it is handed
+        while True:
+            try:
+                chunk = self.chunks.get(timeout=0.5)
+                break
+            except queue.Empty:
+                if self.aborted:
+                    raise Exception("Upload aborted")
+        if chunk:
+            self.transfer.consume(len(chunk))
+        return chunk
+
+def upload_fanout(path, uploads, progress_callback=None, checksum=None):
+    """Upload one file to several destinations at once, reading it a single time.
+
+    `uploads` is a list of (destination, dest_name). Returns the SHA-256 hex digest
+    and, per upload, None on success or the exception that failed it. Each
+    destination streams from its own bounded buffer; one that falls more than
+    TRANSFER_READ_TIMEOUT behind is dropped instead of stalling the rest. Every
+    destination verifies the body against the Checksum header, computed first
+    when not passed in.
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"File to upload not found: {path}")
+    
+    file_size = os.path.getsize(path)
+    checksum = checksum or file_sha256(path)
+    
+    def send(destination, dest_name, branch):
+        url = f"{STORAGE_SCHEME}://{destination.host}/{destination.zone}/{dest_name}"
+        headers = {"AccessKey": destination.api_key, "Checksum": checksum.upper()}
+        try:
+            # No transport retries: the body is a one-shot stream, so retries happen per destination
+            with requests.Session() as session, \
+                    transfer_scheduler.transfer('upload', destination.host, file_size) as transfer:
+                branch.transfer = transfer
+                resp = session.put(url, headers=headers, data=branch, timeout=(30, UPLOAD_RESPONSE_TIMEOUT))
+                if resp.status_code == 429:
+                    transfer_scheduler.throttle(destination.host, resp.headers.get('Retry-After'))
+                resp.raise_for_status()
+        except Exception as e:
+            branch.error = branch.error or e
+    
+    branches = []
+    threads = []
+    for destination, dest_name in uploads:
+        branch = FanOutBranch(file_size, None)
+        branches.append(branch)
+        if not all([destination.api_key, destination.zone, destination.host]):
+            branch.error = ValueError(f"Missing configuration for destination '{destination.name}'")
+            continue
+        # Copy the context so transfer stats and log records carry the job ID
+        context = contextvars.copy_context()
+        thread = threading.Thread(target=context.run, args=(send, destination, dest_name, branch),
+                                  name=f"upload-{destination.name}", daemon=True)
+        threads.append(thread)
+        thread.start()
+    
+    sha256 = hashlib.sha256()
+    sent = 0
+    try:
+        with open(path, "rb") as f:
+            while True:
+                check_cancelled()
+                chunk = f.read(CHUNK_SIZE)
+                live = [b for b in branches if b.error is None]
+                if not live:
+                    break
+                for branch in live:
+                    _feed(branch, chunk)  # An empty chunk marks the end of the body
+                if not chunk:
+                    break
+                sha256.update(chunk)
+                sent += len(chunk)
+                if progress_callback:
+                    progress_callback(sent)
+    except BaseException:
+        for branch in branches:
+            branch.aborted = True
+        raise
+    finally:
+        for thread in threads:
+            thread.join(timeout=UPLOAD_RESPONSE_TIMEOUT + 30)
+    
+    return sha256.hexdigest(), [branch.error for branch in branches]
+
+def _feed(branch, chunk):
+    """Queue a chunk for a destination, dropping the destination if it stops draining its buffer"""
+    waited = 0.0
+    while branch.error is None:
+        check_cancelled()
+        try:
+            branch.chunks.put(chunk, timeout=0.5)
+            return
+        except queue.Full:
+            waited += 0.5
+            if waited >= TRANSFER_READ_TIMEOUT:
+                branch.error = Exception(f"No upload progress for {int(waited)}s")
+                branch.aborted = True
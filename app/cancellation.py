@@ -0,0 +1,127 @@
+import logging
+import threading
+import subprocess
+import contextvars
+from contextlib import contextmanager
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Seconds a stopped process gets to exit on SIGTERM before it is killed
+STOP_GRACE_SECONDS = 5.0
+
+
+class JobCancelled(Exception):
+    """Raised inside a stage (or its threads) once the job's cancel token is set"""
+
+
+class CancelToken:
+    """Cancellation signal for one job, shared by its task and every thread working for it
+
+    Setting it never blocks: stages poll it between chunks, and anything that
+    can sit in a blocking call (a socket read, a child process) registers a
+    callback that unblocks it, which runs on the cancelling thread.
+    """
+
+    def __init__(self):
+        self.reason: Optional[str] = None
+        self._event = threading.Event()
+        self._callbacks: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "Cancelled"):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"Cancellation callback failed: {e}")
+
+    def check(self):
+        """Raise JobCancelled if the token is set"""
+        if self._event.is_set():
+            raise JobCancelled(self.reason)
+
+    @contextmanager
+    def on_cancel(self, callback: Callable[[], None]):
+        """Run `callback` if the token is set while the block runs (at once if it already is)"""
+        with self._lock:
+            registered = not self._event.is_set()
+            if registered:
+                self._callbacks.append(callback)
+        if not registered:
+            callback()
+        try:
+            yield
+        finally:
+            with self._lock:
+                if callback in self._callbacks:
+                    self._callbacks.remove(callback)
+
+
+# Token of the job the current task or transfer thread works for; like
+# current_job_id, asyncio tasks and asyncio.to_thread inherit it
+current_cancel_token: contextvars.ContextVar[Optional[CancelToken]] = contextvars.ContextVar(
+    'current_cancel_token', default=None
+)
+
+
+def check_cancelled():
+    """Raise JobCancelled if the current job was cancelled"""
+    token = current_cancel_token.get()
+    if token:
+        token.check()
+
+
+@contextmanager
+def on_cancel(callback: Callable[[], None]):
+    """Run `callback` if the current job is cancelled during the block; no-op outside a job"""
+    token = current_cancel_token.get()
+    if token is None:
+        yield
+        return
+    with token.on_cancel(callback):
+        yield
+
+
+def stop_process(process: subprocess.Popen, grace_period: float = STOP_GRACE_SECONDS):
+    """SIGTERM a child process, then SIGKILL it if it is still there after the grace period"""
+    if process.poll() is not None:
+        return
+    try:
+        process.terminate()
+    except ProcessLookupError:
+        return
+
+    def kill():
+        if process.poll() is None:
+            process.kill()
+
+    timer = threading.Timer(grace_period, kill)
+    timer.daemon = True
+    timer.start()
+
+
+def run_process(cmd: List[str], timeout: Optional[float] = None,
+                preexec_fn: Optional[Callable[[], None]] = None) -> subprocess.CompletedProcess:
+    """subprocess.run with captured text output that the current job's cancellation stops"""
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                          preexec_fn=preexec_fn) as process:
+        with on_cancel(lambda: stop_process(process)):
+            try:
+                stdout, stderr = process.communicate(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.communicate()
+                raise
+    check_cancelled()
+    return subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
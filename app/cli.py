@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Headless batch mode: encode every entry of a manifest through the job queue
+without starting the web server.
+
+    python -m app.cli manifest.csv --parallel 2 --codec x265 --results results.json
+
+The manifest is JSON (a list, or {"jobs": [...]}) or CSV with a header row.
+Each entry is a remote path in the source zone or a local file, either as a
+bare string or with optional columns: path, codec, destination,
+target_size_mb, target_bitrate_kbps. Local files are never deleted. Remote
+entries are probed before queueing and rejected ones count as failures.
+
+Exit status is 0 when every job completed, 1 when any failed and 130 when
+interrupted.
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import asyncio
+import argparse
+from typing import Dict, List, Optional, Any
+
+from dotenv import load_dotenv
+
+FINISHED = ('completed', 'failed', 'cancelled')
+RESULT_FIELDS = ['path', 'job_id', 'status', 'codec', 'destination', 'size_before', 'size_after',
+                 'duration', 'error_message']
+
+
+def load_manifest(path: str) -> List[Dict[str, Any]]:
+    """Read manifest entries as dicts with at least a 'path'"""
+    with open(path, newline='') as f:
+        if path.lower().endswith('.json'):
+            data = json.load(f)
+            rows = data.get('jobs', []) if isinstance(data, dict) else data
+        else:
+            first_line = f.readline()
+            f.seek(0)
+            if 'path' in [column.strip().lower() for column in first_line.split(',')]:
+                rows = list(csv.DictReader(f))
+            else:
+                rows = [row[0] for row in csv.reader(f) if row and row[0].strip()]
+
+    entries = []
+    for number, row in enumerate(rows, 1):
+        entry = {'path': row} if isinstance(row, str) else {k.strip(): v for k, v in row.items() if v not in (None, '')}
+        entry['path'] = str(entry.get('path', '')).strip()
+        if not entry['path']:
+            raise ValueError(f"Manifest entry {number} has no path")
+        entries.append(entry)
+    return entries
+
+
+async def fetch_listing_metadata(paths: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Source sizes and checksums from the storage listing, one request per folder"""
+    from .bunny_client import list_files
+
+    metadata = {}
+    for folder in {p.rsplit('/', 1)[0] if '/' in p else '' for p in paths}:
+        try:
+            for file_info in (await list_files(folder))['files']:
+                metadata[file_info['path']] = file_info
+        except Exception as e:
+            print(f"warning: could not list {folder or '/'}: {e}", file=sys.stderr)
+    return metadata
+
+
+async def inspect_remote(paths: List[str]):
+    """Listing metadata and pre-flight probe results for remote entries"""
+    from .preflight import preflight_sources
+
+    metadata = await fetch_listing_metadata(paths)
+    preflight = await preflight_sources(paths, {p: metadata.get(p, {}).get('size') for p in paths})
+    return metadata, preflight
+
+
+def enqueue(entries: List[Dict[str, Any]], default_codec: str):
+    """Add every entry that passes pre-flight to the queue; returns job id -> entry, and rejected entries"""
+    from .queue_manager import add_encoding_job
+
+    remote = [e['path'].lstrip('/') for e in entries if not os.path.isfile(e['path'])]
+    metadata, preflight = asyncio.run(inspect_remote(remote)) if remote else ({}, {})
+
+    jobs = {}
+    rejected = []
+    for entry in entries:
+        path = entry['path']
+        check = preflight.get(path.lstrip('/'))
+        if check is not None and not check.ok:
+            rejected.append((entry, check.reason))
+            continue
+        filename = os.path.basename(path)
+        output_path = f"./output/{filename.rsplit('.', 1)[0]}.mp4"
+        target_size = int(float(entry['target_size_mb']) * 1024 * 1024) if entry.get('target_size_mb') else None
+        target_bitrate = int(float(entry['target_bitrate_kbps']) * 1000) if entry.get('target_bitrate_kbps') else None
+
+        if os.path.isfile(path):
+            job_id = add_encoding_job(
+                path, output_path, entry.get('codec', default_codec),
+                target_size=target_size, target_bitrate=target_bitrate,
+                upload_path=entry.get('destination'), keep_source=True
+            )
+        else:
+            info = metadata.get(path.lstrip('/'), {})
+            job_id = add_encoding_job(
+                f"./input/{filename}", output_path, entry.get('codec', default_codec),
+                remote_path=path.lstrip('/'),
+                source_size=info.get('size'),
+                source_checksum=info.get('checksum'),
+                target_size=target_size, target_bitrate=target_bitrate,
+                upload_path=entry.get('destination'),
+                media_info=check.media_info() if check else None
+            )
+        jobs[job_id] = entry
+    return jobs, rejected
+
+
+def format_eta(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "—"
+    seconds = int(seconds)
+    if seconds < 3600:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+
+
+class ProgressPrinter:
+    """One line per finished job plus a status line (redrawn in place on a terminal)"""
+
+    def __init__(self, total: int, quiet: bool = False):
+        self.total = total
+        self.quiet = quiet
+        self.interactive = sys.stdout.isatty()
+        self.last_status = 0.0
+
+    def finished(self, entry: Dict[str, Any], log: Dict[str, Any]):
+        if self.interactive:
+            sys.stdout.write('\r\033[K')
+        if log['status'] == 'completed':
+            size = f"{log.get('size_before', '?')} -> {log.get('size_after', '?')}"
+            print(f"ok     {entry['path']}  ({size}, {log.get('duration', '?')})")
+        else:
+            print(f"{log['status']:<6} {entry['path']}: {log.get('error_message') or ''}")
+
+    def status(self, done: int, failed: int, queue_status: Dict[str, Any], interval: float):
+        now = time.monotonic()
+        if self.quiet or (not self.interactive and now - self.last_status < interval):
+            return
+        self.last_status = now
+        forecast = queue_status.get('forecast') or {}
+        line = (f"[{done}/{self.total}] {queue_status['running']} running, {queue_status['pending']} pending, "
+                f"{failed} failed, ETA {format_eta(forecast.get('backlog_seconds') if done < self.total else 0)}")
+        if self.interactive:
+            sys.stdout.write('\r\033[K' + line)
+            sys.stdout.flush()
+        else:
+            print(line, flush=True)
+
+
+def write_results(path: str, rows: List[Dict[str, Any]]):
+    if path.lower().endswith('.csv'):
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(rows)
+    else:
+        with open(path, 'w') as f:
+            json.dump(rows, f, indent=2)
+
+
+def run(args) -> int:
+    from .queue_manager import encoding_queue, get_job, get_queue_status
+
+    entries = load_manifest(args.manifest)
+    if not entries:
+        print("Manifest is empty", file=sys.stderr)
+        return 0
+
+    encoding_queue.max_concurrent_jobs = args.parallel
+    jobs, rejected = enqueue(entries, args.codec)
+    printer = ProgressPrinter(len(jobs), args.quiet)
+    for entry, reason in rejected:
+        printer.finished(entry, {'status': 'rejected', 'error_message': reason})
+    results: Dict[str, Dict[str, Any]] = {}
+    interrupted = False
+
+    try:
+        while len(results) < len(jobs):
+            for job_id, entry in jobs.items():
+                if job_id in results:
+                    continue
+                job = get_job(job_id)
+                if job is None or job.status.value not in FINISHED or job_id in encoding_queue.jobs:
+                    continue
+                log = job.to_log_entry()
+                results[job_id] = log
+                printer.finished(entry, log)
+            failed = sum(r['status'] != 'completed' for r in results.values())
+            printer.status(len(results), failed, get_queue_status(), args.interval)
+            if len(results) < len(jobs):
+                time.sleep(0.5)
+    except KeyboardInterrupt:
+        interrupted = True
+        print("\nInterrupted, cancelling remaining jobs...", file=sys.stderr)
+        for job_id in list(encoding_queue.pending_jobs) + list(encoding_queue.running_jobs):
+            encoding_queue.cancel_job(job_id)
+        while encoding_queue.running_jobs:
+            time.sleep(0.2)
+
+    encoding_queue.is_processing = False
+    if encoding_queue.worker_thread:
+        encoding_queue.worker_thread.join(timeout=5)
+    if printer.interactive and not args.quiet:
+        print()
+
+    rows = [
+        {'path': entry['path'], 'status': 'rejected', 'codec': entry.get('codec', args.codec),
+         'error_message': reason}
+        for entry, reason in rejected
+    ]
+    for job_id, entry in jobs.items():
+        log = results.get(job_id) or {'status': 'cancelled'}
+        rows.append({
+            'path': entry['path'],
+            'job_id': job_id,
+            'status': log['status'],
+            'codec': log.get('codec', entry.get('codec', args.codec)),
+            'destination': getattr(get_job(job_id), 'upload_path', None),
+            'size_before': log.get('size_before'),
+            'size_after': log.get('size_after'),
+            'duration': log.get('duration'),
+            'error_message': log.get('error_message'),
+            'stage_seconds': log.get('stage_seconds'),
+            'output_sha256': log.get('output_sha256')
+        })
+    if args.results:
+        write_results(args.results, rows)
+
+    completed = sum(r['status'] == 'completed' for r in rows)
+    print(f"{completed}/{len(rows)} completed, {len(rows) - completed} failed, rejected or cancelled")
+    if interrupted:
+        return 130
+    return 0 if completed == len(rows) else 1
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Encode a manifest of videos without the web server")
+    parser.add_argument('manifest', help="JSON or CSV manifest of remote paths or local files")
+    parser.add_argument('--parallel', type=int, default=int(os.getenv("MAX_CONCURRENT_JOBS", "1")),
+                        help="Jobs to run at once")
+    parser.add_argument('--codec', default='x265', help="Codec for entries that do not set one")
+    parser.add_argument('--results', help="Write per-job results to this .json or .csv file")
+    parser.add_argument('--interval', type=float, default=10.0,
+                        help="Seconds between status lines when not on a terminal")
+    parser.add_argument('--quiet', action='store_true', help="Only print finished jobs")
+    parser.add_argument('--verbose', action='store_true', help="Show the application log on the console")
+    args = parser.parse_args(argv)
+
+    # Configuration must be in place before the queue and storage modules read it
+    load_dotenv()
+    os.environ.setdefault("LOG_LEVEL", "INFO" if args.verbose else "WARNING")
+    from .log_config import configure_logging
+    configure_logging()
+
+    return run(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,347 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Any, Tuple
+
+from .cpu_allocator import cpu_allocator
+from .ffmpeg_worker import ffmpeg_worker
+from .telemetry import telemetry_sampler
+from .transfer_scheduler import transfer_scheduler
+from .watchdog import stall_watchdog
+
+logger = logging.getLogger(__name__)
+
+# Pipeline stages with their own admission limit, in job order
+STAGES = ('download', 'encode', 'upload')
+
+# What each stage's throughput counts (the stall watchdog's progress units)
+STAGE_UNITS = {'download': 'bytes/s', 'encode': 'media s/s', 'upload': 'bytes/s'}
+
+# Limit changes kept for the status endpoint
+CHANGE_HISTORY = 100
+
+
+class StageLimit:
+    """How many jobs one stage admits at once, and the controller's view of it
+
+    Lives on the queue's event loop: jobs wait in `acquire` for a free slot,
+    and a raised limit wakes them.
+    """
+
+    def __init__(self, stage: str, limit: int, maximum: int, minimum: int = 1, settle: int = 2):
+        self.stage = stage
+        self.minimum = minimum
+        self.maximum = max(maximum, minimum)
+        self.limit = min(max(limit, self.minimum), self.maximum)
+        self.active = 0
+        self.waiting = 0
+        self.rates: deque = deque(maxlen=settle)  # Throughput samples since the last change
+        self.utilization: Optional[float] = None
+        self.resource: Optional[str] = None
+        self.reason = "initial limit"
+        self.settling = 0  # Samples left before the last change is judged
+        self.baseline: Optional[float] = None  # Throughput before a raise that is being judged
+        # After a raise that did not pay off the limit stays below it until ceiling_until
+        self.ceiling: Optional[int] = None
+        self.ceiling_until = 0.0
+        self._changed: Optional[asyncio.Event] = None
+
+    def bind(self):
+        """Start over on a new event loop"""
+        self.active = 0
+        self.waiting = 0
+        self._changed = asyncio.Event()
+
+    async def acquire(self, wait: bool = True):
+        """Take a slot, waiting while the stage is full (unless told not to)"""
+        if wait and self.active >= self.limit:
+            self.waiting += 1
+            try:
+                while self.active >= self.limit:
+                    self._changed.clear()
+                    await self._changed.wait()
+            finally:
+                self.waiting -= 1
+        self.active += 1
+
+    def release(self):
+        self.active -= 1
+        self._changed.set()
+
+    def set_limit(self, limit: int, reason: str):
+        self.limit = limit
+        self.reason = reason
+        self.rates.clear()
+        if self._changed:
+            self._changed.set()
+
+    @property
+    def rate(self) -> Optional[float]:
+        return sum(self.rates) / len(self.rates) if self.rates else None
+
+    def get_status(self) -> Dict[str, Any]:
+        rate = self.rate
+        return {
+            'limit': self.limit,
+            'min': self.minimum,
+            'max': self.maximum,
+            'active': self.active,
+            'waiting': self.waiting,
+            'throughput': round(rate, 3) if rate is not None else None,
+            'unit': STAGE_UNITS[self.stage],
+            'utilization': self.utilization,
+            'resource': self.resource,
+            'ceiling': self.ceiling,
+            'reason': self.reason
+        }
+
+
+def _format_rate(stage: str, rate: Optional[float]) -> str:
+    if rate is None:
+        return "n/a"
+    if STAGE_UNITS[stage] == 'bytes/s':
+        return f"{rate * 8 / 1000 / 1000:.1f} Mbit/s"
+    return f"{rate:.2f}x"
+
+
+class ConcurrencyController:
+    """Sizes each pipeline stage from measured throughput and resource utilization
+
+    Every interval it takes each stage's aggregate rate from the stall
+    watchdog's progress trackers (bytes per second for transfers, media
+    seconds per second for encodes), and the utilization of the resource the
+    stage is bound by from the telemetry sampler: CPU or NVENC for encodes,
+    the configured bandwidth cap for transfers. A stage with jobs waiting and
+    an unsaturated resource gets one more slot. If that does not raise its
+    throughput by the minimum gain, the slot is taken back and the stage
+    stays below that level for the hold period before probing again. Disk
+    stalls and storage rate limiting take slots away. Nothing changes until
+    the previous change has had `settle` samples to show its effect.
+    """
+
+    def __init__(self, enabled: bool = False, interval: float = 15.0, maxima: Optional[Dict[str, int]] = None,
+                 max_jobs: Optional[int] = None, target_utilization: float = 85.0,
+                 io_pressure_limit: float = 40.0, min_gain: float = 0.05, settle: int = 2,
+                 hold_seconds: float = 600.0):
+        self.enabled = enabled
+        self.interval = interval
+        maxima = maxima or {}
+        self.stages = {
+            stage: StageLimit(stage, 1, maxima.get(stage, 4), settle=settle) for stage in STAGES
+        }
+        self.max_jobs = max_jobs or sum(limit.maximum for limit in self.stages.values())
+        self.target_utilization = target_utilization
+        self.io_pressure_limit = io_pressure_limit
+        self.min_gain = min_gain
+        self.settle = settle
+        self.hold_seconds = hold_seconds
+        self.encode_speeds: Dict[str, float] = {}  # job id -> media seconds per second, last sample
+        self.changes: deque = deque(maxlen=CHANGE_HISTORY)
+        self.last_sample: Optional[float] = None
+        self._progress: Dict[Tuple[str, str, int], float] = {}
+
+    @classmethod
+    def from_env(cls) -> 'ConcurrencyController':
+        """Build from CONCURRENCY_ADAPTIVE and the CONCURRENCY_* bounds and thresholds"""
+        cores = len(cpu_allocator.available_cores)
+        return cls(
+            enabled=os.getenv("CONCURRENCY_ADAPTIVE", "false").lower() in ("1", "true", "yes"),
+            interval=float(os.getenv("CONCURRENCY_INTERVAL_SECONDS", "15")),
+            maxima={
+                'download': int(os.getenv("CONCURRENCY_MAX_DOWNLOADS", "4")),
+                # Each CPU encode should keep at least two cores
+                'encode': int(os.getenv("CONCURRENCY_MAX_ENCODES", "0")) or max(2, cores // 2),
+                'upload': int(os.getenv("CONCURRENCY_MAX_UPLOADS", "4"))
+            },
+            max_jobs=int(os.getenv("CONCURRENCY_MAX_JOBS", "0")) or None,
+            target_utilization=float(os.getenv("CONCURRENCY_TARGET_UTILIZATION", "85")),
+            io_pressure_limit=float(os.getenv("CONCURRENCY_IO_PRESSURE_LIMIT", "40")),
+            min_gain=float(os.getenv("CONCURRENCY_MIN_GAIN", "0.05")),
+            settle=int(os.getenv("CONCURRENCY_SETTLE_SAMPLES", "2")),
+            hold_seconds=float(os.getenv("CONCURRENCY_HOLD_SECONDS", "600"))
+        )
+
+    def job_limit(self) -> int:
+        """Jobs admitted at once: enough to fill every stage, within the overall bound"""
+        return min(sum(limit.limit for limit in self.stages.values()), self.max_jobs)
+
+    def bind(self):
+        """Attach the stage gates to the queue's (new) event loop"""
+        for limit in self.stages.values():
+            limit.bind()
+        self._progress = {}
+
+    @asynccontextmanager
+    async def slot(self, stage: str, job=None, wait: bool = True):
+        """Hold one of the stage's slots for the block; a no-op unless the controller is enabled"""
+        if not self.enabled:
+            yield
+            return
+        limit = self.stages[stage]
+        queued = wait and limit.active >= limit.limit and job is not None
+        if queued:
+            job.progress = {'stage': 'waiting', 'next': stage}
+        await limit.acquire(wait)
+        if queued:
+            job.progress = {'stage': stage}
+        try:
+            yield
+        finally:
+            limit.release()
+
+    async def run(self):
+        """Sample and adjust every interval until cancelled (runs on the queue's loop)"""
+        telemetry_sampler.start()
+        last = time.monotonic()
+        while True:
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            try:
+                self.adjust(now - last)
+            except Exception as e:
+                logger.error(f"Concurrency controller sample failed: {e}")
+            last = now
+
+    def _sample_rates(self, elapsed: float) -> Dict[str, float]:
+        """Aggregate progress per stage since the last sample, from the watchdog's trackers"""
+        rates = {stage: 0.0 for stage in STAGES}
+        speeds = {}
+        progress = {}
+        for job_id, tracker in list(stall_watchdog.trackers.items()):
+            if tracker.stage not in rates:
+                continue
+            key = (job_id, tracker.stage, tracker.attempt)
+            progress[key] = tracker.value
+            # Trackers that appeared since the last sample started from zero
+            rate = max(tracker.value - self._progress.get(key, 0.0), 0.0) / elapsed
+            rates[tracker.stage] += rate
+            if tracker.stage == 'encode':
+                speeds[job_id] = round(rate, 3)
+        self._progress = progress
+        self.encode_speeds = speeds
+        return rates
+
+    def _utilization(self, rates: Dict[str, float]) -> Dict[str, Tuple[Optional[float], Optional[str]]]:
+        """(percent, resource) each stage is bound by, averaged over the last interval"""
+        samples = telemetry_sampler.history(self.interval)
+        cpu = [s.cpu_percent for s in samples if s.cpu_percent is not None]
+        nvenc = [max(g['encoder_utilization'] for g in s.gpus if g['encoder_utilization'] is not None)
+                 for s in samples if any(g['encoder_utilization'] is not None for g in s.gpus)]
+
+        # Encodes without a CPU allocation run on the GPU (samples and evaluations have their own)
+        cpu_encodes = sum(1 for process_id in list(ffmpeg_worker.processes) if process_id in cpu_allocator.allocations)
+        gpu_encodes = len(ffmpeg_worker.processes) - cpu_encodes
+        encode = []
+        if cpu_allocator.allocations and cpu:
+            encode.append((sum(cpu) / len(cpu), 'CPU'))
+        if gpu_encodes > 0 and nvenc:
+            encode.append((sum(nvenc) / len(nvenc), 'NVENC'))
+        if not encode and cpu:
+            encode.append((sum(cpu) / len(cpu), 'CPU'))
+
+        utilization = {'encode': max(encode) if encode else (None, None)}
+        for direction in ('download', 'upload'):
+            # Only a configured cap gives the link a known size
+            bucket = transfer_scheduler.directions.get(direction) or transfer_scheduler.total
+            if bucket and bucket.rate:
+                utilization[direction] = (rates[direction] / bucket.rate * 100, 'bandwidth cap')
+            else:
+                utilization[direction] = (None, 'network')
+        return {
+            stage: (round(value, 1) if value is not None else None, resource)
+            for stage, (value, resource) in utilization.items()
+        }
+
+    def _io_pressure(self) -> Optional[float]:
+        values = [s.io_pressure for s in telemetry_sampler.history(self.interval) if s.io_pressure is not None]
+        return sum(values) / len(values) if values else None
+
+    def _decide(self, limit: StageLimit, io_pressure: Optional[float], throttled: bool) -> Optional[Tuple[int, str]]:
+        """The stage's next limit and why, or None to keep it"""
+        stage, rate = limit.stage, limit.rate or 0.0
+        if limit.ceiling is not None and time.monotonic() >= limit.ceiling_until:
+            limit.ceiling = None
+
+        # Let the last change show its effect before judging or changing again
+        if limit.settling:
+            limit.settling -= 1
+            if limit.settling:
+                return None
+            if limit.baseline is not None:
+                baseline, limit.baseline = limit.baseline, None
+                if rate < baseline * (1 + self.min_gain):
+                    limit.ceiling = limit.limit - 1
+                    limit.ceiling_until = time.monotonic() + self.hold_seconds
+                    return limit.limit - 1, (
+                        f"{limit.limit} at once moved {_format_rate(stage, rate)} against "
+                        f"{_format_rate(stage, baseline)} with {limit.limit - 1}, not worth the slot"
+                    )
+                limit.reason = (
+                    f"{limit.limit} at once raised throughput to {_format_rate(stage, rate)} "
+                    f"from {_format_rate(stage, baseline)}"
+                )
+            return None
+
+        if limit.limit > limit.minimum:
+            if io_pressure is not None and io_pressure >= self.io_pressure_limit:
+                return limit.limit - 1, f"disk stalled {io_pressure:.0f}% of the time"
+            if throttled and stage != 'encode':
+                return limit.limit - 1, "storage is rate limiting (429)"
+
+        full = limit.waiting and limit.active >= limit.limit
+        below_ceiling = limit.ceiling is None or limit.limit < limit.ceiling
+        if full and limit.limit < limit.maximum and below_ceiling and not (throttled and stage != 'encode'):
+            if limit.utilization is not None and limit.utilization >= self.target_utilization:
+                return None
+            limit.baseline = rate
+            busy = f"{limit.resource} at {limit.utilization:.0f}%" if limit.utilization is not None \
+                else f"at {_format_rate(stage, rate)}"
+            return limit.limit + 1, f"{limit.waiting} job(s) waiting, {busy}"
+        return None
+
+    def adjust(self, elapsed: float):
+        """Take one sample and move each stage's limit by at most one step"""
+        rates = self._sample_rates(elapsed)
+        utilization = self._utilization(rates)
+        io_pressure = self._io_pressure()
+        now = time.monotonic()
+        throttled = any(bucket.paused_until > now for bucket in list(transfer_scheduler.hosts.values()))
+        self.last_sample = time.time()
+
+        for stage, limit in self.stages.items():
+            limit.rates.append(rates[stage])
+            limit.utilization, limit.resource = utilization[stage]
+            decision = self._decide(limit, io_pressure, throttled)
+            if decision is None:
+                continue
+            new_limit, reason = decision
+            previous = limit.limit
+            limit.set_limit(new_limit, reason)
+            limit.settling = self.settle
+            self.changes.append({'time': self.last_sample, 'stage': stage, 'from': previous,
+                                 'to': new_limit, 'reason': reason})
+            logger.info(f"Concurrency: {stage} {previous} -> {new_limit} ({reason})")
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            'enabled': self.enabled,
+            'interval_seconds': self.interval,
+            'job_limit': self.job_limit(),
+            'max_jobs': self.max_jobs,
+            'target_utilization': self.target_utilization,
+            'io_pressure_limit': self.io_pressure_limit,
+            'stages': {stage: limit.get_status() for stage, limit in self.stages.items()},
+            'encode_speeds': dict(self.encode_speeds),
+            'last_sample': self.last_sample,
+            'changes': list(reversed(self.changes))[:20]
+        }
+
+# Global instance
+concurrency_controller = ConcurrencyController.from_env()
+
+def get_concurrency_status() -> Dict[str, Any]:
+    """Get per-stage limits, what they are based on and the latest changes"""
+    return concurrency_controller.get_status()
@@ -0,0 +1,222 @@
+import os
+import glob
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Any
+
+logger = logging.getLogger(__name__)
+
+
+def parse_cpu_list(text: str) -> List[int]:
+    """Parse a kernel CPU list such as '0-3,8-11' into core ids"""
+    cores = []
+    for part in text.strip().split(','):
+        if not part:
+            continue
+        if '-' in part:
+            start, end = part.split('-', 1)
+            cores.extend(range(int(start), int(end) + 1))
+        else:
+            cores.append(int(part))
+    return cores
+
+
+def detect_numa_nodes(available: List[int]) -> List[List[int]]:
+    """Usable cores grouped by NUMA node (a single group on non-NUMA machines)"""
+    nodes = []
+    for path in sorted(glob.glob('/sys/devices/system/node/node[0-9]*/cpulist'),
+                       key=lambda p: int(p.split('/node')[-1].split('/')[0])):
+        try:
+            with open(path) as f:
+                cores = [c for c in parse_cpu_list(f.read()) if c in available]
+        except (OSError, ValueError):
+            continue
+        nodes.append(cores)
+
+    if not any(nodes):
+        return [sorted(available)]
+    return nodes
+
+
+def x265_frame_threads(threads: int) -> int:
+    """Frame threads matching x265's own auto-detection for a given thread budget"""
+    if threads >= 32:
+        return 6
+    if threads >= 16:
+        return 4
+    if threads >= 8:
+        return 3
+    if threads >= 4:
+        return 2
+    return 1
+
+
+@dataclass
+class CpuAllocation:
+    job_id: str
+    cores: List[int] = field(default_factory=list)
+    numa_nodes: List[int] = field(default_factory=list)
+    pid: Optional[int] = None
+
+    @property
+    def threads(self) -> int:
+        return max(len(self.cores), 1)
+
+
+class CpuAllocator:
+    def __init__(self, reserved_cores: int = 0, pinning: bool = True):
+        available = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else list(range(os.cpu_count() or 1))
+        if reserved_cores and len(available) > reserved_cores:
+            # Leave the first cores to the web server and the OS
+            available = available[reserved_cores:]
+
+        self.available_cores = available
+        # Indexed by physical node id; nodes whose cores are all reserved stay as empty lists
+        self.numa_nodes = detect_numa_nodes(available)
+        self.pinning = pinning
+        self.allocations: Dict[str, CpuAllocation] = {}
+        self._order: List[str] = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> 'CpuAllocator':
+        """Build the allocator from CPU_RESERVED_CORES and CPU_PINNING
+
+        Thread counts are fixed when an encode starts, so pinning is what
+        shrinks a running encode onto its new share when another one starts.
+        """
+        return cls(
+            reserved_cores=int(os.getenv("CPU_RESERVED_CORES", "0")),
+            pinning=os.getenv("CPU_PINNING", "true").lower() in ("1", "true", "yes")
+        )
+
+    def allocate(self, job_id: str) -> CpuAllocation:
+        """Give a CPU encode a share of the cores, shrinking the shares of running encodes"""
+        with self._lock:
+            if job_id not in self.allocations:
+                self.allocations[job_id] = CpuAllocation(job_id)
+                self._order.append(job_id)
+                self._rebalance()
+            return self.allocations[job_id]
+
+    def release(self, job_id: str):
+        """Return a finished encode's cores to the jobs still running"""
+        with self._lock:
+            if self.allocations.pop(job_id, None):
+                self._order.remove(job_id)
+                self._rebalance()
+
+    def attach_process(self, job_id: str, pid: int):
+        """Remember the ffmpeg pid so later rebalances can re-pin it"""
+        with self._lock:
+            allocation = self.allocations.get(job_id)
+            if allocation:
+                allocation.pid = pid
+                self._apply_affinity(allocation)
+
+    def _rebalance(self):
+        """Split cores across active jobs, keeping each job on as few NUMA nodes as possible"""
+        jobs = [self.allocations[job_id] for job_id in self._order]
+        if not jobs:
+            return
+
+        usable_nodes = [n for n, cores in enumerate(self.numa_nodes) if cores]
+        node_count = len(usable_nodes)
+        if len(jobs) <= node_count:
+            # Fewer jobs than nodes: each job gets whole nodes
+            for i, allocation in enumerate(jobs):
+                node_ids = usable_nodes[i::len(jobs)]
+                allocation.numa_nodes = node_ids
+                allocation.cores = [c for n in node_ids for c in self.numa_nodes[n]]
+        else:
+            # More jobs than nodes: spread jobs over nodes, then split each node's cores
+            for i, node_id in enumerate(usable_nodes):
+                node_cores = self.numa_nodes[node_id]
+                node_jobs = jobs[i::node_count]
+                for j, allocation in enumerate(node_jobs):
+                    share = len(node_cores) / len(node_jobs)
+                    start, end = int(j * share), int((j + 1) * share)
+                    allocation.numa_nodes = [node_id]
+                    # Oversubscribed nodes (more jobs than cores) share a single core
+                    allocation.cores = node_cores[start:max(end, start + 1)] or node_cores[-1:]
+
+        for allocation in jobs:
+            self._apply_affinity(allocation)
+
+        logger.info(
+            "CPU allocation: " + ", ".join(f"{a.job_id[:8]}={a.threads} cores" for a in jobs)
+        )
+
+    def _apply_affinity(self, allocation: CpuAllocation):
+        """Pin every thread of a running ffmpeg process to its allocated cores"""
+        if not self.pinning or not allocation.pid or not hasattr(os, 'sched_setaffinity'):
+            return
+
+        task_ids = [allocation.pid]
+        try:
+            task_ids = [int(t) for t in os.listdir(f"/proc/{allocation.pid}/task")]
+        except OSError:
+            pass
+
+        for task_id in task_ids:
+            try:
+                os.sched_setaffinity(task_id, allocation.cores)
+            except OSError:
+                # The thread (or process) exited between listing and pinning
+                pass
+
+    def get_ffmpeg_options(self, allocation: CpuAllocation, encoder: str) -> Dict[str, List[str]]:
+        """FFmpeg input and encoder options matching an allocation"""
+        options = {
+            'input': ['-threads', str(allocation.threads)],
+            'encoder': []
+        }
+        if encoder == 'libx265':
+            # One x265 pool entry per NUMA node: our thread count there, '-' for none
+            pools = ','.join(
+                str(len(set(allocation.cores) & set(node_cores))) if n in allocation.numa_nodes else '-'
+                for n, node_cores in enumerate(self.numa_nodes)
+            )
+            options['encoder'] = [
+                '-x265-params',
+                f"pools={pools}:frame-threads={x265_frame_threads(allocation.threads)}"
+            ]
+        elif encoder == 'libsvtav1':
+            # SVT-AV1 sizes its own thread pools from the logical processor count
+            options['encoder'] = ['-svtav1-params', f"lp={allocation.threads}"]
+        elif encoder.startswith('lib'):
+            options['encoder'] = ['-threads', str(allocation.threads)]
+        return options
+
+    def get_preexec_fn(self, allocation: CpuAllocation):
+        """Return a preexec_fn that pins the child before exec, so all its threads inherit the mask"""
+        if not self.pinning or not hasattr(os, 'sched_setaffinity'):
+            return None
+        cores = list(allocation.cores)
+        return lambda: os.sched_setaffinity(0, cores)
+
+    def get_status(self) -> Dict[str, Any]:
+        """Get the current core split"""
+        with self._lock:
+            return {
+                'available_cores': len(self.available_cores),
+                'numa_nodes': len(self.numa_nodes),
+                'pinning': self.pinning,
+                'allocations': [
+                    {
+                        'job_id': a.job_id,
+                        'threads': a.threads,
+                        'numa_nodes': a.numa_nodes,
+                        'pid': a.pid
+                    }
+                    for a in (self.allocations[job_id] for job_id in self._order)
+                ]
+            }
+
+# Global instance
+cpu_allocator = CpuAllocator.from_env()
+
+def get_cpu_allocation_status() -> Dict[str, Any]:
+    """Get CPU allocation status"""
+    return cpu_allocator.get_status()
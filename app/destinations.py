@@ -0,0 +1,157 @@
+import os
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Any
+
+from .cancellation import JobCancelled
+from .sidecars import SidecarGenerator
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Destination:
+    """A storage zone encoded outputs are uploaded to"""
+    name: str
+    api_key: Optional[str]
+    zone: Optional[str]
+    host: Optional[str]
+    # Fields: {upload_path} (the job's path in the primary zone), {filename}, {stem}, {codec}, {job_id}
+    path_template: str = '{upload_path}'
+
+    def render_path(self, job) -> str:
+        filename = os.path.basename(job.upload_path)
+        return self.path_template.format(
+            upload_path=job.upload_path,
+            filename=filename,
+            stem=filename.rsplit('.', 1)[0],
+            codec=job.codec,
+            job_id=job.id
+        ).lstrip('/')
+
+
+class UploadDestinations:
+    """The primary destination zone plus replicas every output is also uploaded to"""
+
+    def __init__(self, destinations: List[Destination]):
+        self.destinations = {d.name: d for d in destinations}
+
+    @classmethod
+    def from_env(cls) -> 'UploadDestinations':
+        """The DEST_BUNNY_* zone as 'primary', then each name in UPLOAD_REPLICAS from DEST_<NAME>_BUNNY_*"""
+        destinations = [Destination(
+            'primary',
+            os.getenv("DEST_BUNNY_API_KEY"),
+            os.getenv("DEST_BUNNY_STORAGE_ZONE"),
+            os.getenv("DEST_BUNNY_STORAGE_HOST"),
+            os.getenv("DEST_PATH_TEMPLATE", "{upload_path}")
+        )]
+        for name in (n.strip() for n in os.getenv("UPLOAD_REPLICAS", "").split(',')):
+            if not name:
+                continue
+            prefix = f"DEST_{name.upper()}_"
+            destinations.append(Destination(
+                name,
+                os.getenv(prefix + "BUNNY_API_KEY"),
+                os.getenv(prefix + "BUNNY_STORAGE_ZONE"),
+                os.getenv(prefix + "BUNNY_STORAGE_HOST"),
+                os.getenv(prefix + "PATH_TEMPLATE", "{upload_path}")
+            ))
+        return cls(destinations)
+
+    def plan(self, job) -> Dict[str, Dict[str, Any]]:
+        """Per-destination upload status for a job, as stored in job.destinations"""
+        return {
+            name: {'path': destination.render_path(job), 'status': 'pending', 'attempts': 0}
+            for name, destination in self.destinations.items()
+        }
+
+    def upload(self, path: str, statuses: Dict[str, Dict[str, Any]], progress_callback=None,
+               checksum: Optional[str] = None) -> str:
+        """Upload to every destination not yet marked uploaded, updating `statuses` in place
+
+        One pending destination goes through upload_file; several share a
+        single read of the file. Raises if any destination failed, so the stage
+        is retried, and the retry only uploads to the ones still missing.
+        Returns the SHA-256 hex digest of the output.
+        """
+        # Import here to avoid circular imports
+        from .bunny_client import upload_file, upload_fanout
+
+        pending = [name for name, status in statuses.items() if status['status'] != 'uploaded']
+        if not pending:
+            return checksum
+        for name in pending:
+            statuses[name].update(status='uploading', attempts=statuses[name]['attempts'] + 1, error=None)
+        uploads = [(self.destinations[name], statuses[name]['path']) for name in pending]
+
+        if len(uploads) == 1:
+            destination, dest_name = uploads[0]
+            try:
+                digest = upload_file(path, dest_name, progress_callback, checksum, destination=destination)
+                errors = [None]
+            except JobCancelled:
+                raise
+            except Exception as e:
+                digest, errors = checksum, [e]
+        else:
+            digest, errors = upload_fanout(path, uploads, progress_callback, checksum)
+
+        for name, error in zip(pending, errors):
+            statuses[name]['status'] = 'failed' if error else 'uploaded'
+            if error:
+                statuses[name]['error'] = str(error)
+                logger.warning(f"Upload to {name} ({statuses[name]['path']}) failed: {error}")
+
+        failed = [name for name, error in zip(pending, errors) if error]
+        if failed:
+            raise Exception(
+                f"Upload failed for {', '.join(failed)}: " + '; '.join(statuses[n]['error'] for n in failed)
+            )
+        return digest
+
+    def upload_sidecars(self, files: Dict[str, str], statuses: Dict[str, Dict[str, Any]],
+                        progress_callback=None) -> Dict[str, str]:
+        """Upload sidecar files (name -> local path) next to the output in every destination
+
+        Each zone gets them in a folder named after its copy of the output.
+        They are small, so a retry simply sends them all again. Returns the
+        folder per destination.
+        """
+        # Import here to avoid circular imports
+        from .bunny_client import upload_file
+
+        sent = 0
+
+        def on_progress(done_bytes):
+            if progress_callback:
+                progress_callback(sent + done_bytes)
+
+        folders = {}
+        for name, status in statuses.items():
+            folder = SidecarGenerator.remote_prefix(status['path'])
+            for filename, path in files.items():
+                upload_file(path, folder + filename, on_progress, destination=self.destinations[name])
+                sent += os.path.getsize(path)
+            folders[name] = folder
+        return folders
+
+    def get_status(self) -> List[Dict[str, Any]]:
+        """Configured destinations, without credentials"""
+        return [
+            {
+                'name': d.name,
+                'zone': d.zone,
+                'host': d.host,
+                'path_template': d.path_template,
+                'configured': bool(d.api_key and d.zone and d.host)
+            }
+            for d in self.destinations.values()
+        ]
+
+# Global instance
+upload_destinations = UploadDestinations.from_env()
+
+def get_destinations() -> List[Dict[str, Any]]:
+    """Get the configured upload destinations"""
+    return upload_destinations.get_status()
@@ -0,0 +1,327 @@
+import os
+import json
+import time
+import logging
+import threading
+import subprocess
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Any, Set
+
+from .cpu_allocator import cpu_allocator, CpuAllocation
+
+logger = logging.getLogger(__name__)
+
+# Synthetic clip encoded by the benchmark: long enough for encoder start-up to not dominate
+BENCHMARK_SECONDS = 5
+BENCHMARK_SOURCE = 'testsrc2=size=1920x1080:rate=30'
+
+# Allocation key of the benchmark encode, so it takes a share of the cores like any other encode
+BENCHMARK_ALLOCATION = 'encoder-benchmark'
+
+# Backend used when a requested one is unknown or unavailable; libx265 ships with every ffmpeg build we support
+DEFAULT_BACKEND = 'x265'
+
+
+def _bufsize(max_bitrate: str) -> str:
+    return str(int(max_bitrate.replace('k', '')) * 2) + 'k'
+
+
+@dataclass
+class EncoderBackend:
+    """One way of producing the video stream, mapping get_optimized_settings onto encoder options"""
+    name: str  # Codec value used by the API and stored on jobs
+    encoder: str  # FFmpeg encoder name
+    display_name: str
+    quality_flag: str = '-crf'
+    gpu: bool = False  # GPU encoders do not get a CPU allocation
+    presets: Dict[str, str] = field(default_factory=dict)  # Settings preset -> encoder preset
+    quality_offset: int = 0  # Added to the settings CRF to land on a similar quality
+    profile_speed: float = 1.0  # Expected media seconds per wall second at 1080p until benchmarked
+    fallback: Optional[str] = DEFAULT_BACKEND
+
+    def is_available(self, encoders: Set[str]) -> bool:
+        return self.encoder in encoders
+
+    def map_preset(self, preset: str) -> str:
+        return self.presets.get(preset, preset)
+
+    def map_quality(self, crf: int) -> int:
+        return int(crf) + self.quality_offset
+
+    def rate_control(self, settings: Dict[str, Any]) -> List[str]:
+        """Capped VBR: average bitrate with a constant-quality floor"""
+        return [
+            '-b:v', settings['avg_bitrate'],
+            '-maxrate', settings['max_bitrate'],
+            '-bufsize', _bufsize(settings['max_bitrate']),
+            self.quality_flag, str(self.map_quality(settings['crf'])),
+            '-preset', self.map_preset(settings['preset'])
+        ]
+
+    def constant_quality(self, quality: int, preset: str) -> List[str]:
+        """Pure constant-quality options, used by size-targeting sample encodes"""
+        return [self.quality_flag, str(self.map_quality(quality)), '-preset', self.map_preset(preset)]
+
+    def threading_options(self, allocation: CpuAllocation) -> Dict[str, List[str]]:
+        return cpu_allocator.get_ffmpeg_options(allocation, self.encoder)
+
+
+@dataclass
+class NvencBackend(EncoderBackend):
+    quality_flag: str = '-cq'
+    gpu: bool = True
+
+    def constant_quality(self, quality: int, preset: str) -> List[str]:
+        # No average bitrate target, otherwise NVENC ignores -cq
+        return super().constant_quality(quality, preset) + ['-rc', 'vbr', '-b:v', '0']
+
+
+@dataclass
+class SvtAv1Backend(EncoderBackend):
+    def rate_control(self, settings: Dict[str, Any]) -> List[str]:
+        # SVT-AV1 has no CRF + average bitrate mode; capped CRF bounds the size instead
+        return [
+            '-crf', str(self.map_quality(settings['crf'])),
+            '-maxrate', settings['max_bitrate'],
+            '-bufsize', _bufsize(settings['max_bitrate']),
+            '-preset', self.map_preset(settings['preset'])
+        ]
+
+
+DEFAULT_BACKENDS = [
+    NvencBackend('hevc_nvenc', 'hevc_nvenc', 'HEVC (NVENC) - Best Quality', profile_speed=6.0),
+    NvencBackend('h264_nvenc', 'h264_nvenc', 'H.264 (NVENC) - Universal', profile_speed=8.0),
+    EncoderBackend('x265', 'libx265', 'HEVC (x265 CPU) - Fallback', profile_speed=0.6, fallback=None),
+    EncoderBackend('x265_fast', 'libx265', 'HEVC (x265 CPU, fast preset)',
+                   presets={'medium': 'veryfast', 'slow': 'faster'}, profile_speed=2.5),
+    # x264 needs a lower CRF than x265 for similar quality
+    EncoderBackend('x264', 'libx264', 'H.264 (x264 CPU) - Fast',
+                   presets={'medium': 'fast', 'slow': 'medium'}, quality_offset=-3, profile_speed=3.0),
+    # SVT-AV1 CRF runs 0-63; presets are numbers, higher is faster
+    SvtAv1Backend('svtav1', 'libsvtav1', 'AV1 (SVT-AV1 CPU) - Smallest',
+                  presets={'medium': '8', 'slow': '6'}, quality_offset=10, profile_speed=2.0)
+]
+
+
+class EncoderRegistry:
+    """Known encoder backends, which ones this ffmpeg build has and how fast each one measured"""
+
+    def __init__(self, benchmark_path: Optional[str] = None, auto_candidates: Optional[List[str]] = None):
+        self.backends: Dict[str, EncoderBackend] = {}
+        self.benchmark_path = benchmark_path
+        self.auto_candidates = auto_candidates
+        self.measured: Dict[str, Dict[str, Any]] = {}
+        self._available_encoders: Optional[Set[str]] = None
+        self._lock = threading.Lock()
+        for backend in DEFAULT_BACKENDS:
+            self.register(backend)
+        self._load_benchmark()
+
+    @classmethod
+    def from_env(cls) -> 'EncoderRegistry':
+        """Build the registry from ENCODER_BENCHMARK_PATH and ENCODER_AUTO_CANDIDATES"""
+        candidates = os.getenv("ENCODER_AUTO_CANDIDATES", "")
+        return cls(
+            benchmark_path=os.getenv("ENCODER_BENCHMARK_PATH", "logs/encoder_benchmark.json") or None,
+            auto_candidates=[c.strip() for c in candidates.split(',') if c.strip()] or None
+        )
+
+    def register(self, backend: EncoderBackend):
+        self.backends[backend.name] = backend
+
+    def get(self, name: str) -> Optional[EncoderBackend]:
+        return self.backends.get(name)
+
+    def available_encoders(self, probe: bool = True) -> Optional[Set[str]]:
+        """Encoder names compiled into ffmpeg (probed once; None if not probed and `probe` is False)"""
+        if self._available_encoders is not None or not probe:
+            return self._available_encoders
+        try:
+            result = subprocess.run(['ffmpeg', '-hide_banner', '-encoders'],
+                                    capture_output=True, text=True, timeout=10)
+            if result.returncode == 0:
+                # Lines look like ' V....D libx265   libx265 H.265 / HEVC'
+                self._available_encoders = {
+                    parts[1] for parts in (line.split() for line in result.stdout.splitlines())
+                    if len(parts) >= 2 and len(parts[0]) == 6 and parts[0][0] == 'V'
+                }
+                return self._available_encoders
+        except Exception as e:
+            logger.error(f"Error listing ffmpeg encoders: {e}")
+        return set()
+
+    def available(self, probe: bool = True) -> List[EncoderBackend]:
+        """Backends this ffmpeg build supports (the default backend when unknown)"""
+        encoders = self.available_encoders(probe)
+        if encoders is None:
+            return [self.backends[DEFAULT_BACKEND]]
+        return [b for b in self.backends.values() if b.is_available(encoders)]
+
+    def speed(self, name: str) -> float:
+        """Measured (else expected) media seconds encoded per wall second at 1080p"""
+        measured = self.measured.get(name)
+        if measured and measured.get('speed'):
+            return measured['speed']
+        backend = self.backends.get(name)
+        return backend.profile_speed if backend else self.backends[DEFAULT_BACKEND].profile_speed
+
+    def fastest(self, probe: bool = True) -> EncoderBackend:
+        candidates = [
+            b for b in self.available(probe)
+            if not self.auto_candidates or b.name in self.auto_candidates
+        ]
+        if not candidates:
+            return self.backends[DEFAULT_BACKEND]
+        return max(candidates, key=lambda b: self.speed(b.name))
+
+    def resolve(self, codec: str, probe: bool = True) -> EncoderBackend:
+        """Backend for a codec choice: 'auto' picks the fastest, unavailable ones fall back"""
+        if codec == 'auto':
+            return self.fastest(probe)
+
+        backend = self.backends.get(codec) or self.backends[DEFAULT_BACKEND]
+        encoders = self.available_encoders(probe)
+        seen = set()
+        while encoders is not None and not backend.is_available(encoders) and backend.fallback:
+            if backend.name in seen:
+                break
+            seen.add(backend.name)
+            backend = self.backends[backend.fallback]
+        return backend
+
+    def benchmark(self, names: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+        """Encode a synthetic 1080p clip with each available backend and record its speed
+
+        CPU backends run on a cpu_allocator share so they neither oversubscribe
+        running encodes nor get more cores than an encode would. A result
+        measured while other encodes ran is flagged `under_load`; it never
+        replaces an idle measurement and is re-measured on the next idle start.
+        """
+        results = {}
+        for backend in self.available():
+            if names and backend.name not in names:
+                continue
+            allocation = None if backend.gpu else cpu_allocator.allocate(BENCHMARK_ALLOCATION)
+            threading_options = backend.threading_options(allocation) if allocation else {'input': [], 'encoder': []}
+            settings = {'avg_bitrate': '1000k', 'max_bitrate': '1500k', 'crf': 24, 'preset': 'medium'}
+            cmd = [
+                'ffmpeg', '-hide_banner', '-loglevel', 'error', '-nostdin', *threading_options['input'],
+                '-f', 'lavfi', '-i', BENCHMARK_SOURCE, '-t', str(BENCHMARK_SECONDS), '-an',
+                '-c:v', backend.encoder, *backend.rate_control(settings), *threading_options['encoder'],
+                '-f', 'null', '-'
+            ]
+            under_load = self._under_load()
+            started = time.monotonic()
+            try:
+                result = subprocess.run(
+                    cmd, capture_output=True, text=True, timeout=600,
+                    preexec_fn=cpu_allocator.get_preexec_fn(allocation) if allocation else None
+                )
+            except Exception as e:
+                logger.warning(f"Benchmark of {backend.name} failed: {e}")
+                continue
+            finally:
+                if allocation:
+                    cpu_allocator.release(BENCHMARK_ALLOCATION)
+            elapsed = time.monotonic() - started
+            under_load = under_load or self._under_load()
+            if result.returncode != 0 or elapsed <= 0:
+                logger.warning(f"Benchmark of {backend.name} failed: {result.stderr.strip()[-200:]}")
+                continue
+            results[backend.name] = {
+                'speed': round(BENCHMARK_SECONDS / elapsed, 3),
+                'fps': round(BENCHMARK_SECONDS * 30 / elapsed, 1),
+                'measured_at': time.time(),
+                'under_load': under_load
+            }
+            logger.info(f"Benchmark: {backend.name} encodes 1080p at {results[backend.name]['speed']}x"
+                        + (" (other encodes running)" if under_load else ""))
+
+        with self._lock:
+            for name, measured in results.items():
+                previous = self.measured.get(name)
+                if measured['under_load'] and previous and not previous.get('under_load'):
+                    continue
+                self.measured[name] = measured
+            self._save_benchmark()
+        return results
+
+    @staticmethod
+    def _under_load() -> bool:
+        """Whether any other encode, sample or quality run is using the CPUs or GPU"""
+        # Import here to avoid circular imports
+        from .ffmpeg_worker import ffmpeg_worker
+        return bool(ffmpeg_worker.processes) or any(
+            job_id != BENCHMARK_ALLOCATION for job_id in list(cpu_allocator.allocations)
+        )
+
+    def stale(self) -> List[str]:
+        """Available backends not measured yet, or only measured while other encodes ran"""
+        return [
+            b.name for b in self.available()
+            if b.name not in self.measured or self.measured[b.name].get('under_load')
+        ]
+
+    def _load_benchmark(self):
+        if not self.benchmark_path or not os.path.exists(self.benchmark_path):
+            return
+        try:
+            with open(self.benchmark_path) as f:
+                self.measured = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable encoder benchmark {self.benchmark_path}: {e}")
+
+    def _save_benchmark(self):
+        if not self.benchmark_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.benchmark_path) or ".", exist_ok=True)
+            with open(self.benchmark_path, 'w') as f:
+                json.dump(self.measured, f, indent=2)
+        except OSError as e:
+            logger.warning(f"Could not save encoder benchmark: {e}")
+
+    def get_status(self) -> Dict[str, Any]:
+        """Every backend with its availability and speed, plus what 'auto' currently picks"""
+        encoders = self.available_encoders(probe=False)
+        return {
+            'probed': encoders is not None,
+            'auto': self.fastest(probe=False).name,
+            'backends': [
+                {
+                    'name': b.name,
+                    'encoder': b.encoder,
+                    'display_name': b.display_name,
+                    'gpu': b.gpu,
+                    'available': b.is_available(encoders) if encoders is not None else None,
+                    'speed': round(self.speed(b.name), 3),
+                    'benchmarked': b.name in self.measured
+                }
+                for b in self.backends.values()
+            ]
+        }
+
+# Global instance
+encoder_registry = EncoderRegistry.from_env()
+
+def get_encoder_status() -> Dict[str, Any]:
+    """Get encoder backends, availability and measured speeds"""
+    return encoder_registry.get_status()
+
+def start_encoder_benchmark():
+    """Benchmark in a daemon thread if ENCODER_BENCHMARK_ON_START is set and some backend lacks an idle measurement"""
+    if os.getenv("ENCODER_BENCHMARK_ON_START", "true").lower() not in ("1", "true", "yes"):
+        return
+    if encoder_registry.measured and not any(m.get('under_load') for m in encoder_registry.measured.values()):
+        return
+
+    def run():
+        stale = encoder_registry.stale()
+        if stale:
+            encoder_registry.benchmark(stale)
+
+    threading.Thread(target=run, name="encoder-benchmark", daemon=True).start()
+
+def run_encoder_benchmark(names: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+    """Benchmark available encoder backends (blocking)"""
+    return encoder_registry.benchmark(names)
@@ -1,19 +1,82 @@
+import asyncio
+import codecs
 import subprocess
 import os
+import re
+import signal
 import logging
 import threading
 import time
 import json
-from typing import Dict, Any, Optional, Tuple, List
+from collections import deque
+from typing import Dict, Any, Optional, Tuple, List, Deque
+
+from .cpu_allocator import cpu_allocator
+from .encoders import encoder_registry, EncoderBackend
+from .sidecars import sidecar_generator
 
 logger = logging.getLogger(__name__)
 
+# Diagnostic (non-progress) stderr lines kept per encode for debugging failures
+FFMPEG_LOG_LINES = int(os.getenv("FFMPEG_LOG_LINES", "200"))
+
+# Seconds between reads of an encode's log file while it has nothing new
+LOG_POLL_INTERVAL = 0.5
+
+
+class AdoptedProcess:
+    """An FFmpeg started before this service last (re)started, followed by pid
+
+    A reload re-executes the service in place, so its encodes are still our
+    children and are reaped here; ones left by a process that exited belong
+    to init and can only be watched.
+    """
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self._returncode: Optional[int] = None
+
+    @property
+    def returncode(self) -> Optional[int]:
+        if self._returncode is not None:
+            return self._returncode
+        try:
+            pid, status = os.waitpid(self.pid, os.WNOHANG)
+            if pid:
+                self._returncode = os.waitstatus_to_exitcode(status)
+            return self._returncode
+        except ChildProcessError:
+            pass
+        # Reaped by init once it exits; its real status is not visible to us
+        try:
+            os.kill(self.pid, 0)
+        except ProcessLookupError:
+            self._returncode = 0
+        except PermissionError:
+            pass
+        return self._returncode
+
+    async def wait(self) -> int:
+        while self.returncode is None:
+            await asyncio.sleep(LOG_POLL_INTERVAL)
+        return self.returncode
+
+    def terminate(self):
+        os.kill(self.pid, signal.SIGTERM)
+
+    def kill(self):
+        os.kill(self.pid, signal.SIGKILL)
+
+
 class FFmpegWorker:
     def __init__(self):
-        self.current_process = None
-        self.current_thread = None
+        self.processes: Dict[str, Any] = {}  # asyncio subprocesses, or AdoptedProcess
         self.is_running = False
         self.progress_callback = None
+        # Set while the service hands its encodes over to the next process: cancelled
+        # encodes are left running instead of being stopped
+        self.handover = False
+        self.handover_encodes = os.getenv("HANDOVER_ENCODES", "true").lower() in ("1", "true", "yes")
         
     def get_gpu_info(self) -> Dict[str, Any]:
         """Get GPU information"""
@@ -40,29 +103,11 @@ class FFmpegWorker:
 
     def get_nvenc_capabilities(self) -> Dict[str, bool]:
         """Check which NVENC encoders are available"""
-        capabilities = {
-            'hevc': False, 
-            'h264': False
+        encoders = encoder_registry.available_encoders()
+        return {
+            'hevc': 'hevc_nvenc' in encoders,
+            'h264': 'h264_nvenc' in encoders
         }
-        
-        try:
-            # Check for NVENC encoders using ffmpeg
-            result = subprocess.run(['ffmpeg', '-hide_banner', '-encoders'], 
-                                    capture_output=True, text=True, timeout=10)
-            
-            if result.returncode == 0:
-                output = result.stdout.lower()
-                
-                # Check for specific NVENC encoders (AV1 removed)
-                if 'hevc_nvenc' in output:
-                    capabilities['hevc'] = True
-                if 'h264_nvenc' in output:
-                    capabilities['h264'] = True
-                    
-        except Exception as e:
-            logger.error(f"Error checking NVENC capabilities: {e}")
-            
-        return capabilities
 
     def get_video_resolution(self, input_file: str) -> Tuple[int, int]:
         """Get video resolution (width, height)"""
@@ -131,61 +176,82 @@ class FFmpegWorker:
                 'preset': 'slow'
             }
 
-    def get_ffmpeg_preset(self, codec: str, input_file: str, has_nvenc: bool) -> Dict[str, Any]:
-        """Get FFmpeg encoding preset based on codec and video resolution (VBR optimized for 120MB/10min)"""
+    def get_backend(self, codec: str) -> EncoderBackend:
+        """Encoder backend for a codec choice ('auto' picks the fastest measured one)"""
+        return encoder_registry.resolve(codec)
+
+    def predict_video_encoder(self, codec: str) -> str:
+        """Backend a codec choice will use, from the cached encoder list (never runs ffmpeg)"""
+        return encoder_registry.resolve(codec, probe=False).name
+
+    def predict_target_settings(self, input_file: str, codec: str, target_size: Optional[int] = None,
+                                target_bitrate: Optional[int] = None,
+                                media_info: Optional[Dict[str, Any]] = None,
+                                job_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Predict rate-control settings from sample encodes so the output hits a target size/bitrate
+
+        Pass `media_info` (width, height, duration) when the source was already
+        probed; otherwise it is probed here. CPU sample encodes take a share of
+        the cores like any other encode.
+        """
+        from .size_targeting import predict_settings
+        
+        if media_info and media_info.get('duration'):
+            duration, width, height = media_info['duration'], media_info['width'], media_info['height']
+        else:
+            duration = self.get_video_duration(input_file)
+            width, height = self.get_video_resolution(input_file)
+        if not duration:
+            logger.warning(f"Size targeting skipped for {input_file}: unknown duration")
+            return None
+        
+        backend = self.get_backend(codec)
+        process_id = f"{job_id or input_file}/sampling"
+        allocation = None if backend.gpu else cpu_allocator.allocate(process_id)
+        try:
+            return predict_settings(
+                input_file, duration, backend,
+                self.get_optimized_settings(width, height),
+                target_size=target_size, target_bitrate=target_bitrate, allocation=allocation
+            )
+        finally:
+            if allocation:
+                cpu_allocator.release(process_id)
+
+    def get_ffmpeg_preset(self, backend: EncoderBackend, input_file: str,
+                          settings: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Get FFmpeg encoding preset based on the backend and video resolution (VBR optimized for 120MB/10min)"""
         
         # Base audio settings - AAC stereo
         audio_settings = ['-c:a', 'aac', '-b:a', '128k', '-ac', '2']
         
-        # Get video resolution for optimization
-        width, height = self.get_video_resolution(input_file)
-        settings = self.get_optimized_settings(width, height)
+        # Get video resolution for optimization, unless settings were predicted for a size target
+        if settings is None:
+            width, height = self.get_video_resolution(input_file)
+            settings = self.get_optimized_settings(width, height)
         
-        # Remove AV1, focus on HEVC and H.264 with VBR
-        if codec == 'hevc_nvenc' and has_nvenc:
-            return {
-                'video_codec': ['-c:v', 'hevc_nvenc'],
-                'quality': [
-                    '-b:v', settings['avg_bitrate'],
-                    '-maxrate', settings['max_bitrate'], 
-                    '-bufsize', str(int(settings['max_bitrate'].replace('k', '')) * 2) + 'k',
-                    '-cq', str(settings['crf']),
-                    '-preset', settings['preset']
-                ],
-                'audio': audio_settings,
-                'output_format': 'mp4'
-            }
-        elif codec == 'h264_nvenc' and has_nvenc:
-            return {
-                'video_codec': ['-c:v', 'h264_nvenc'],
-                'quality': [
-                    '-b:v', settings['avg_bitrate'],
-                    '-maxrate', settings['max_bitrate'],
-                    '-bufsize', str(int(settings['max_bitrate'].replace('k', '')) * 2) + 'k',
-                    '-cq', str(settings['crf']),
-                    '-preset', settings['preset']
-                ],
-                'audio': audio_settings,
-                'output_format': 'mp4'
-            }
-        else:
-            # Fallback to CPU encoding with x265 VBR
-            return {
-                'video_codec': ['-c:v', 'libx265'],
-                'quality': [
-                    '-b:v', settings['avg_bitrate'],
-                    '-maxrate', settings['max_bitrate'],
-                    '-bufsize', str(int(settings['max_bitrate'].replace('k', '')) * 2) + 'k',
-                    '-crf', str(settings['crf']),
-                    '-preset', settings['preset']
-                ],
-                'audio': audio_settings,
-                'output_format': 'mp4'
-            }
+        return {
+            'video_codec': ['-c:v', backend.encoder],
+            'quality': backend.rate_control(settings),
+            'audio': audio_settings,
+            'output_format': 'mp4'
+        }
 
     def build_ffmpeg_command(self, input_file: str, output_file: str, preset: Dict[str, Any]) -> List[str]:
         """Build complete FFmpeg command"""
-        cmd = ['ffmpeg', '-i', input_file]
+        # Overwrite outputs left by an earlier attempt instead of prompting on stdin
+        cmd = ['ffmpeg', '-y']
+        
+        # Add decoder options (e.g. thread limits) before the input
+        cmd.extend(preset.get('input_options', []))
+        cmd.extend(['-i', input_file])
+        
+        # Sidecar outputs share the decoded frames; they come first so the
+        # encoded file stays the last argument
+        if preset.get('filter_complex'):
+            cmd.extend(['-filter_complex', preset['filter_complex']])
+            cmd.extend(preset['side_outputs'])
+            cmd.extend(preset['maps'])
         
         # Add video codec
         cmd.extend(preset['video_codec'])
@@ -193,6 +259,9 @@ class FFmpegWorker:
         # Add quality settings
         cmd.extend(preset['quality'])
         
+        # Add encoder threading options
+        cmd.extend(preset.get('threading', []))
+        
         # Add audio settings
         cmd.extend(preset['audio'])
         
@@ -255,118 +324,327 @@ class FFmpegWorker:
             return min(percentage, 100.0)
         return None
 
-    def run_ffmpeg(self, input_file: str, output_file: str, codec: str, 
-                   progress_callback=None) -> Tuple[bool, str]:
-        """Run FFmpeg encoding with VBR and resolution-based optimization"""
+    async def probe_video_async(self, input_file: str) -> Dict[str, Any]:
+        """Get resolution and duration with a single ffprobe run, without blocking the event loop"""
+        cmd = ['ffprobe', '-v', 'quiet', '-print_format', 'json', '-show_format',
+               '-select_streams', 'v:0', '-show_entries', 'stream=width,height:format=duration', input_file]
+        info = {'width': 1920, 'height': 1080, 'duration': None}  # Default to 1080p if detection fails
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+            )
+            stdout, _ = await asyncio.wait_for(process.communicate(), timeout=30)
+            if process.returncode == 0:
+                data = json.loads(stdout)
+                streams = data.get('streams') or [{}]
+                info['width'] = int(streams[0].get('width') or info['width'])
+                info['height'] = int(streams[0].get('height') or info['height'])
+                if data.get('format', {}).get('duration'):
+                    info['duration'] = float(data['format']['duration'])
+        except asyncio.TimeoutError:
+            process.kill()
+            logger.error(f"ffprobe timed out on {input_file}")
+        except Exception as e:
+            logger.error(f"Error probing video: {e}")
+        return info
+
+    async def validate_output_async(self, input_file: str, output_file: str) -> Tuple[bool, str]:
+        """Check that an encoded output exists and covers the source's duration"""
+        if not os.path.exists(output_file) or os.path.getsize(output_file) == 0:
+            return False, "Output file is missing or empty"
         
+        source = await self.probe_video_async(input_file)
+        output = await self.probe_video_async(output_file)
+        if not output['duration']:
+            return False, "Output has no readable duration"
+        if source['duration'] and abs(source['duration'] - output['duration']) > max(1.0, source['duration'] * 0.02):
+            return False, f"Output duration {output['duration']:.1f}s does not match source {source['duration']:.1f}s"
+        return True, "Output is valid"
+
+    @staticmethod
+    def log_path(output_file: str) -> str:
+        """Where an encode's stderr goes; a file rather than a pipe, so FFmpeg outlives a restart of this process"""
+        return output_file + '.ffmpeg.log'
+
+    @staticmethod
+    def is_encoder_process(pid: int, output_file: str) -> bool:
+        """Whether `pid` is still an FFmpeg writing `output_file` (guards against pid reuse)"""
         try:
-            # Check NVENC capabilities
-            nvenc_caps = self.get_nvenc_capabilities()
-            has_nvenc = any(nvenc_caps.values())
+            with open(f"/proc/{pid}/cmdline", 'rb') as f:
+                args = f.read().decode(errors='replace').split('\0')
+        except OSError:
+            return False
+        # The binary may be a wrapper script run by an interpreter
+        return any(os.path.basename(a).startswith('ffmpeg') for a in args[:2]) and output_file in args
+
+    @staticmethod
+    def find_encoder_processes(directories: List[str]) -> Dict[int, str]:
+        """FFmpeg processes writing into any of `directories`, as pid -> output file"""
+        directories = {os.path.abspath(d) for d in directories}
+        found = {}
+        for entry in os.listdir('/proc') if os.path.isdir('/proc') else []:
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry}/cmdline", 'rb') as f:
+                    args = f.read().decode(errors='replace').split('\0')
+            except OSError:
+                continue
+            args = [a for a in args if a]
+            if len(args) < 2 or not any(os.path.basename(a).startswith('ffmpeg') for a in args[:2]):
+                continue
+            if os.path.dirname(os.path.abspath(args[-1])) in directories:
+                found[int(entry)] = args[-1]
+        return found
+
+    async def _follow_status_lines(self, log_path: str, process):
+        """Yield FFmpeg status lines from its log until it exits; they end in either '\\r' or '\\n'"""
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        buffer = ''
+        with open(log_path, 'rb') as f:
+            while True:
+                # Check before reading, so output written just before exit is not lost
+                exited = process.returncode is not None
+                chunk = f.read(65536)
+                if not chunk:
+                    if exited:
+                        break
+                    await asyncio.sleep(LOG_POLL_INTERVAL)
+                    continue
+                buffer += decoder.decode(chunk)
+                *lines, buffer = re.split(r'[\r\n]', buffer)
+                for line in lines:
+                    if line.strip():
+                        yield line.strip()
+        if buffer.strip():
+            yield buffer.strip()
+
+    async def _terminate_process(self, process, grace_period: float = 5.0):
+        """Ask FFmpeg to stop, escalating to SIGKILL after the grace period"""
+        if process.returncode is not None:
+            return
+        try:
+            process.terminate()
+            await asyncio.wait_for(process.wait(), timeout=grace_period)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+        except ProcessLookupError:
+            pass
+
+    async def _supervise(self, process, log_path: str, progress_callback, total_duration: Optional[float],
+                         stderr_tail: Deque[str], timeout: Optional[float]) -> Tuple[bool, str]:
+        """Follow an encode's progress until it exits; on cancellation stop it, unless handing over"""
+        async def monitor():
+            async for line in self._follow_status_lines(log_path, process):
+                # Parse progress
+                progress_data = self.parse_ffmpeg_progress(line)
+                if progress_data is None:
+                    stderr_tail.append(line)
+                
+                if progress_data and progress_callback:
+                    # Calculate percentage if we have duration
+                    if total_duration and 'time' in progress_data:
+                        percentage = self.calculate_progress_percentage(
+                            progress_data['time'], total_duration
+                        )
+                        if percentage:
+                            progress_data['percentage'] = round(percentage, 1)
+                    
+                    progress_callback(progress_data)
+            return await process.wait()
+        
+        # Monitor progress, enforcing the overall timeout if one is set
+        try:
+            return_code = await asyncio.wait_for(monitor(), timeout=timeout)
+        except asyncio.TimeoutError:
+            await self._terminate_process(process)
+            return False, f"FFmpeg timed out after {timeout:.0f}s"
+        except asyncio.CancelledError:
+            # The job was cancelled: stop the encoder before propagating; during a
+            # handover it keeps running for the next process to adopt
+            if not self.handover:
+                await self._terminate_process(process)
+            raise
+        
+        if return_code == 0:
+            return True, "Encoding completed successfully"
+        detail = f": {stderr_tail[-1]}" if stderr_tail else ""
+        return False, f"FFmpeg failed with return code {return_code}{detail}"
+
+    def _finish(self, process_id: str, process, log_path: Optional[str], allocation):
+        self.processes.pop(process_id, None)
+        self.is_running = bool(self.processes)
+        if allocation:
+            cpu_allocator.release(process_id)
+        handed_over = self.handover and process is not None and process.returncode is None
+        if log_path and not handed_over and os.path.exists(log_path):
+            os.remove(log_path)
+
+    async def run_ffmpeg_async(self, input_file: str, output_file: str, codec: str,
+                               progress_callback=None, settings: Optional[Dict[str, Any]] = None,
+                               job_id: Optional[str] = None, timeout: Optional[float] = None,
+                               media_info: Optional[Dict[str, Any]] = None,
+                               stderr_tail: Optional[Deque[str]] = None,
+                               sidecars: bool = False) -> Tuple[bool, str]:
+        """Run FFmpeg encoding as an asyncio subprocess (VBR, resolution-based optimization)
+
+        With `sidecars`, the same run also writes the poster, sprite sheets
+        and scene list next to the output (see SidecarGenerator).
+        """
+        # Non-progress stderr lines are kept so a failure can be explained after the fact
+        if stderr_tail is None:
+            stderr_tail = deque(maxlen=FFMPEG_LOG_LINES)
+        
+        process_id = job_id or output_file
+        allocation = None
+        process = None
+        log_path = None
+        try:
+            # Pick the backend (falls back when this ffmpeg build lacks the encoder)
+            backend = self.get_backend(codec)
+            
+            # Probe resolution and duration for the preset and progress calculation
+            # (unless the caller already did)
+            info = media_info or await self.probe_video_async(input_file)
+            total_duration = info['duration']
+            if settings is None:
+                settings = self.get_optimized_settings(info['width'], info['height'])
+            
+            # Get encoding preset
+            preset = self.get_ffmpeg_preset(backend, input_file, settings)
             
-            # Get encoding preset (now uses input file for resolution detection)
-            preset = self.get_ffmpeg_preset(codec, input_file, has_nvenc)
+            # CPU encoders get a share of the cores so concurrent encodes don't oversubscribe
+            if not backend.gpu:
+                allocation = cpu_allocator.allocate(process_id)
+                threading_options = backend.threading_options(allocation)
+                preset['input_options'] = threading_options['input']
+                preset['threading'] = threading_options['encoder']
+            
+            if sidecars:
+                preset.update(sidecar_generator.command_options(
+                    output_file, info['width'], info['height'], total_duration
+                ))
             
             # Build command
             cmd = self.build_ffmpeg_command(input_file, output_file, preset)
             
             logger.info(f"Running FFmpeg command: {' '.join(cmd)}")
             
-            # Get video duration for progress calculation
-            total_duration = self.get_video_duration(input_file)
-            
-            # Start FFmpeg process
-            self.current_process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                universal_newlines=True,
-                bufsize=1
-            )
-            
+            # Start FFmpeg in its own session, writing status lines to a log file,
+            # so neither a signal to this process nor its exit takes the encode down
+            log_path = self.log_path(output_file)
+            with open(log_path, 'wb') as log_file:
+                process = await asyncio.create_subprocess_exec(
+                    *cmd,
+                    stdin=asyncio.subprocess.DEVNULL,
+                    stdout=asyncio.subprocess.DEVNULL,
+                    stderr=log_file,
+                    start_new_session=True,
+                    preexec_fn=cpu_allocator.get_preexec_fn(allocation) if allocation else None
+                )
+            self.processes[process_id] = process
             self.is_running = True
+            if allocation:
+                cpu_allocator.attach_process(process_id, process.pid)
             
-            # Monitor progress
-            while True:
-                if self.current_process.stdout is None:
-                    break
-                output = self.current_process.stdout.readline()
-                if output == '' and self.current_process.poll() is not None:
-                    break
-                
-                if output:
-                    # Parse progress
-                    progress_data = self.parse_ffmpeg_progress(output.strip())
-                    
-                    if progress_data and progress_callback:
-                        # Calculate percentage if we have duration
-                        if total_duration and 'time' in progress_data:
-                            percentage = self.calculate_progress_percentage(
-                                progress_data['time'], total_duration
-                            )
-                            if percentage:
-                                progress_data['percentage'] = round(percentage, 1)
-                        
-                        progress_callback(progress_data)
-            
-            # Get final return code
-            return_code = self.current_process.poll()
-            self.is_running = False
-            
-            if return_code == 0:
-                return True, "Encoding completed successfully"
-            else:
-                return False, f"FFmpeg failed with return code {return_code}"
+            return await self._supervise(process, log_path, progress_callback, total_duration,
+                                         stderr_tail, timeout)
                 
+        except asyncio.CancelledError:
+            raise
+        
         except Exception as e:
-            self.is_running = False
             logger.error(f"Error running FFmpeg: {e}")
             return False, f"Error: {str(e)}"
+        
+        finally:
+            self._finish(process_id, process, log_path, allocation)
+
+    async def adopt_ffmpeg_async(self, pid: int, output_file: str, codec: str, progress_callback=None,
+                                 job_id: Optional[str] = None, timeout: Optional[float] = None,
+                                 total_duration: Optional[float] = None,
+                                 stderr_tail: Optional[Deque[str]] = None) -> Tuple[bool, str]:
+        """Follow an encode a previous process of this service handed over
 
-    def stop_encoding(self):
-        """Stop current encoding process"""
-        if self.current_process and self.is_running:
+        Returns (False, reason) when the process is gone; the exit status of a
+        process that is not our child cannot be read, so callers validate the
+        output either way.
+        """
+        if stderr_tail is None:
+            stderr_tail = deque(maxlen=FFMPEG_LOG_LINES)
+        log_path = self.log_path(output_file)
+        process = AdoptedProcess(pid)
+        # Checking the returncode first reaps an encode of ours that exited during the reload
+        if process.returncode is not None or not self.is_encoder_process(pid, output_file):
+            return False, f"FFmpeg process {pid} is no longer running"
+        
+        process_id = job_id or output_file
+        allocation = None
+        try:
+            # Take the encode's cores back into the allocator's accounting and re-pin it
+            if not self.get_backend(codec).gpu:
+                allocation = cpu_allocator.allocate(process_id)
+                cpu_allocator.attach_process(process_id, pid)
+            self.processes[process_id] = process
+            self.is_running = True
+            logger.info(f"Adopted running FFmpeg process {pid} writing {output_file}")
+            if not os.path.exists(log_path):
+                open(log_path, 'wb').close()
+            return await self._supervise(process, log_path, progress_callback, total_duration,
+                                         stderr_tail, timeout)
+        finally:
+            self._finish(process_id, process, log_path, allocation)
+
+    def run_ffmpeg(self, input_file: str, output_file: str, codec: str, 
+                   progress_callback=None, settings: Optional[Dict[str, Any]] = None,
+                   job_id: Optional[str] = None, timeout: Optional[float] = None) -> Tuple[bool, str]:
+        """Run FFmpeg encoding from synchronous code (blocks until the encode finishes)"""
+        return asyncio.run(self.run_ffmpeg_async(
+            input_file, output_file, codec, progress_callback, settings, job_id, timeout
+        ))
+
+    def stop_encoding(self, job_id: Optional[str] = None):
+        """Signal running encodes (or just one job's) to stop; the supervising task reaps them"""
+        targets = [job_id] if job_id else list(self.processes)
+        stopped = 0
+        for process_id in targets:
+            process = self.processes.get(process_id)
+            if process is None or process.returncode is not None:
+                continue
             try:
-                self.current_process.terminate()
-                # Wait a bit for graceful termination
-                try:
-                    self.current_process.wait(timeout=5)
-                except subprocess.TimeoutExpired:
-                    # Force kill if it doesn't terminate gracefully
-                    self.current_process.kill()
-                    self.current_process.wait()
-                
-                self.is_running = False
-                return True, "Encoding stopped"
+                # os.kill is safe to call from any thread, unlike the asyncio transport
+                os.kill(process.pid, signal.SIGTERM)
+                stopped += 1
+            except ProcessLookupError:
+                pass
             except Exception as e:
                 logger.error(f"Error stopping encoding: {e}")
                 return False, f"Error stopping: {str(e)}"
         
+        if stopped:
+            return True, "Encoding stopped"
         return False, "No encoding process running"
 
     def get_encoding_status(self) -> Dict[str, Any]:
         """Get current encoding status"""
         return {
             'is_running': self.is_running,
-            'has_process': self.current_process is not None
+            'has_process': bool(self.processes),
+            'running_processes': len(self.processes)
         }
 
-    def get_supported_codecs(self) -> List[Dict[str, str]]:
-        """Get list of supported codecs with their display names"""
-        nvenc_caps = self.get_nvenc_capabilities()
-        has_nvenc = any(nvenc_caps.values())
-        
-        codecs = []
-        
-        if has_nvenc:
-            if nvenc_caps['hevc']:
-                codecs.append({'value': 'hevc_nvenc', 'name': 'HEVC (NVENC) - Best Quality'})
-            if nvenc_caps['h264']:
-                codecs.append({'value': 'h264_nvenc', 'name': 'H.264 (NVENC) - Universal'})
-        
-        # Always include CPU fallback
-        codecs.append({'value': 'x265', 'name': 'HEVC (x265 CPU) - Fallback'})
-        
+    def get_supported_codecs(self) -> List[Dict[str, Any]]:
+        """Get list of supported codecs with their display names (from the cached encoder list)"""
+        codecs = [
+            {'value': backend.name, 'name': backend.display_name, 'gpu': backend.gpu}
+            for backend in encoder_registry.available(probe=False)
+        ]
+        codecs.append({
+            'value': 'auto',
+            'name': f"Auto - fastest measured ({encoder_registry.fastest(probe=False).display_name})",
+            'gpu': False
+        })
         return codecs
 
     def validate_input_file(self, file_path: str) -> Tuple[bool, str]:
@@ -445,13 +723,19 @@ def get_supported_codecs():
     """Get supported codecs"""
     return ffmpeg_worker.get_supported_codecs()
 
-def run_encoding(input_file: str, output_file: str, codec: str, progress_callback=None):
+def run_encoding(input_file: str, output_file: str, codec: str, progress_callback=None, settings=None):
     """Run encoding with progress tracking (VBR optimized)"""
-    return ffmpeg_worker.run_ffmpeg(input_file, output_file, codec, progress_callback)
+    return ffmpeg_worker.run_ffmpeg(input_file, output_file, codec, progress_callback, settings)
+
+async def run_encoding_async(input_file: str, output_file: str, codec: str, progress_callback=None,
+                             settings=None, job_id=None, timeout=None):
+    """Run encoding on the caller's event loop"""
+    return await ffmpeg_worker.run_ffmpeg_async(input_file, output_file, codec, progress_callback,
+                                                settings, job_id, timeout)
 
-def stop_encoding():
+def stop_encoding(job_id=None):
     """Stop current encoding"""
-    return ffmpeg_worker.stop_encoding()
+    return ffmpeg_worker.stop_encoding(job_id)
 
 def get_encoding_status():
     """Get encoding status"""
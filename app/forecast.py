@@ -0,0 +1,250 @@
+import time
+import heapq
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Any, Tuple
+
+from .encoders import encoder_registry
+
+logger = logging.getLogger(__name__)
+
+# Resolution tiers, matching the pixel thresholds of FFmpegWorker.get_optimized_settings
+RESOLUTION_TIERS = [
+    (640 * 360, '360p'),
+    (720 * 480, '480p'),
+    (1280 * 720, '720p'),
+    (1920 * 1080, '1080p'),
+    (2560 * 1440, '1440p')
+]
+TIER_PIXELS = {'360p': 640 * 360, '480p': 720 * 480, '720p': 1280 * 720,
+               '1080p': 1920 * 1080, '1440p': 2560 * 1440, '2160p': 3840 * 2160}
+
+# Priors used until a combination has been observed
+DEFAULT_TRANSFER_BPS = 25 * 1024 * 1024
+DEFAULT_SOURCE_SIZE = 1024 * 1024 * 1024
+DEFAULT_SIZE_RATIO = 0.3
+
+# Weight of the newest observation in the moving averages
+SMOOTHING = 0.2
+
+# Completed jobs read back from the archive at startup to warm the model
+FORECAST_SEED_JOBS = 200
+
+
+def resolution_tier(width: Optional[int], height: Optional[int]) -> Optional[str]:
+    """Resolution tier of a frame size (None when unknown)"""
+    if not width or not height:
+        return None
+    pixels = width * height
+    for limit, tier in RESOLUTION_TIERS:
+        if pixels <= limit:
+            return tier
+    return '2160p'
+
+
+class MovingAverage:
+    """Exponentially weighted average; the first observation replaces the prior"""
+
+    __slots__ = ('value', 'samples')
+
+    def __init__(self):
+        self.value: Optional[float] = None
+        self.samples = 0
+
+    def update(self, value: float):
+        self.value = value if self.value is None else self.value + SMOOTHING * (value - self.value)
+        self.samples += 1
+
+
+class ThroughputModel:
+    """Encode speed, output bitrate and transfer bandwidth learned from completed jobs"""
+
+    def __init__(self):
+        self.encode_speed: Dict[Tuple[str, str], MovingAverage] = {}
+        self.output_bitrate: Dict[Tuple[str, str], MovingAverage] = {}
+        # For jobs whose duration is unknown until downloaded
+        self.encode_source_bps: Dict[str, MovingAverage] = {}
+        self.size_ratio: Dict[str, MovingAverage] = {}
+        self.transfer_bps = {'download': MovingAverage(), 'upload': MovingAverage()}
+        self.source_size = MovingAverage()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _update(table: Dict, key, value: float):
+        table.setdefault(key, MovingAverage()).update(value)
+
+    def observe(self, record):
+        """Learn from a completed JobRecord"""
+        stages = dict(record.stage_seconds or ())
+        encoder = record.encoder
+        tier = resolution_tier(record.width, record.height)
+        # Measured by the transfer scheduler; stage times also include retries and backoff
+        measured = dict(record.transfer_mbps or ())
+        with self._lock:
+            if record.source_size:
+                self.source_size.update(record.source_size)
+            # A fan-out upload sends every destination's copy at once; learn the rate of one copy
+            copies = {'download': 1, 'upload': len(record.destinations or ()) or 1}
+            for direction, size in (('download', record.source_size), ('upload', record.file_size_after)):
+                if measured.get(direction):
+                    self.transfer_bps[direction].update(measured[direction] * 1000 * 1000 / 8 / copies[direction])
+                elif stages.get(direction) and size:
+                    self.transfer_bps[direction].update(size / stages[direction])
+            if not encoder or not stages.get('encode'):
+                return
+            if record.media_duration and tier:
+                self._update(self.encode_speed, (encoder, tier), record.media_duration / stages['encode'])
+                if record.file_size_after:
+                    self._update(self.output_bitrate, (encoder, tier), record.file_size_after * 8 / record.media_duration)
+            if record.source_size:
+                self._update(self.encode_source_bps, encoder, record.source_size / stages['encode'])
+                if record.file_size_after:
+                    self._update(self.size_ratio, encoder, record.file_size_after / record.source_size)
+
+    def speed(self, encoder: str, tier: str) -> float:
+        """Media seconds encoded per wall second"""
+        learned = self.encode_speed.get((encoder, tier))
+        if learned and learned.value:
+            return learned.value
+        # Benchmarked (or profiled) 1080p speed of the backend, scaled by pixel count
+        return encoder_registry.speed(encoder) * TIER_PIXELS['1080p'] / TIER_PIXELS[tier]
+
+    def bitrate(self, encoder: str, tier: str, width: int, height: int) -> float:
+        """Output bits per media second"""
+        learned = self.output_bitrate.get((encoder, tier))
+        if learned and learned.value:
+            return learned.value
+        # Import here to avoid circular imports
+        from .ffmpeg_worker import ffmpeg_worker
+        from .staging import AUDIO_BITRATE_BPS
+        video_kbps = int(ffmpeg_worker.get_optimized_settings(width, height)['avg_bitrate'].rstrip('k'))
+        return video_kbps * 1000 + AUDIO_BITRATE_BPS
+
+    def bandwidth(self, direction: str) -> float:
+        return self.transfer_bps[direction].value or DEFAULT_TRANSFER_BPS
+
+    def encode_seconds_from_size(self, encoder: str, source_size: int) -> float:
+        """Encode time when only the source size is known: learned source bytes per second, else a 1080p guess"""
+        learned = self.encode_source_bps.get(encoder)
+        if learned and learned.value:
+            return source_size / learned.value
+        # Assume a typical 1080p source (about 5 Mbps) at the prior speed
+        duration = source_size * 8 / (5 * 1000 * 1000)
+        return duration / self.speed(encoder, '1080p')
+
+    def output_size_from_size(self, encoder: str, source_size: int) -> int:
+        learned = self.size_ratio.get(encoder)
+        ratio = learned.value if learned and learned.value else DEFAULT_SIZE_RATIO
+        return int(source_size * ratio)
+
+    def get_status(self) -> Dict[str, Any]:
+        """Learned rates, for capacity planning"""
+        with self._lock:
+            return {
+                'encoders': [
+                    {
+                        'encoder': encoder,
+                        'tier': tier,
+                        'speed': round(average.value, 2),
+                        'samples': average.samples,
+                        'output_kbps': round(self.output_bitrate[(encoder, tier)].value / 1000)
+                        if (encoder, tier) in self.output_bitrate else None
+                    }
+                    for (encoder, tier), average in sorted(self.encode_speed.items())
+                ],
+                'download_mbps': round(self.bandwidth('download') * 8 / 1000 / 1000, 1),
+                'upload_mbps': round(self.bandwidth('upload') * 8 / 1000 / 1000, 1),
+                'transfer_samples': {d: a.samples for d, a in self.transfer_bps.items()}
+            }
+
+
+class QueueForecaster:
+    def __init__(self, model: Optional[ThroughputModel] = None):
+        self.model = model or ThroughputModel()
+
+    def estimate_job(self, job, encoder: str) -> Dict[str, Any]:
+        """Remaining seconds per stage and predicted output size for an active EncodingJob"""
+        model = self.model
+        progress = job.progress or {}
+        stage = progress.get('stage')
+        tier = resolution_tier(job.width, job.height)
+        source_size = job.source_size or job.file_size_before or int(model.source_size.value or DEFAULT_SOURCE_SIZE)
+
+        if job.file_size_after and 'encoded' in job.checkpoints:
+            predicted_size = job.file_size_after
+        elif job.rate_control and job.rate_control.get('predicted_size'):
+            predicted_size = job.rate_control['predicted_size']
+        elif job.media_duration and tier:
+            predicted_size = int(job.media_duration * model.bitrate(encoder, tier, job.width, job.height) / 8)
+        else:
+            predicted_size = model.output_size_from_size(encoder, source_size)
+
+        remaining = {'download': 0.0, 'encode': 0.0, 'upload': 0.0}
+        if 'downloaded' not in job.checkpoints:
+            done = progress.get('bytes', 0) if stage == 'download' else 0
+            remaining['download'] = max(source_size - done, 0) / model.bandwidth('download')
+
+        if 'encoded' not in job.checkpoints:
+            if job.media_duration and tier:
+                encoded = 0.0
+                speed = model.speed(encoder, tier)
+                if job.status.value == 'running' and 'time' in progress:
+                    # Mid-encode: use the encoder's own position and live speed
+                    from .ffmpeg_worker import ffmpeg_worker
+                    encoded = ffmpeg_worker.time_to_seconds(progress['time']) or 0.0
+                    live_speed = str(progress.get('speed', '')).rstrip('x')
+                    try:
+                        speed = float(live_speed) or speed
+                    except ValueError:
+                        pass
+                remaining['encode'] = max(job.media_duration - encoded, 0) / speed
+            else:
+                remaining['encode'] = model.encode_seconds_from_size(encoder, source_size)
+
+        if 'uploaded' not in job.checkpoints:
+            done = progress.get('bytes', 0) if stage == 'upload' else 0
+            remaining['upload'] = max(predicted_size - done, 0) / model.bandwidth('upload')
+
+        return {
+            'remaining_seconds': round(sum(remaining.values()), 1),
+            'stage_seconds': {k: round(v, 1) for k, v in remaining.items() if v},
+            'predicted_size': int(predicted_size)
+        }
+
+    def forecast(self, running: List, pending: List, slots: int,
+                 encoder_for) -> Dict[str, Any]:
+        """Schedule running then pending jobs onto the job slots in queue order"""
+        now = time.time()
+        estimates = {}
+        # Each slot is represented by the time (seconds from now) it becomes free
+        free_at = []
+        for job in running:
+            estimate = self.estimate_job(job, encoder_for(job))
+            estimate['eta_seconds'] = estimate['remaining_seconds']
+            estimates[job.id] = estimate
+            free_at.append(estimate['remaining_seconds'])
+
+        free_at.sort()
+        free_at = free_at[:slots] + [0.0] * max(slots - len(free_at), 0)
+        heapq.heapify(free_at)
+
+        total_job_seconds = 0.0
+        for job in pending:
+            estimate = self.estimate_job(job, encoder_for(job))
+            start = heapq.heappop(free_at)
+            finish = start + estimate['remaining_seconds']
+            heapq.heappush(free_at, finish)
+            estimate['eta_seconds'] = round(finish, 1)
+            estimates[job.id] = estimate
+            total_job_seconds += estimate['remaining_seconds']
+
+        backlog_seconds = max((e['eta_seconds'] for e in estimates.values()), default=0.0)
+        average_job = total_job_seconds / len(pending) if pending else None
+        return {
+            'jobs': estimates,
+            'backlog_seconds': round(backlog_seconds, 1),
+            'completion_at': datetime.fromtimestamp(now + backlog_seconds).strftime("%Y-%m-%d %H:%M:%S")
+            if estimates else None,
+            'jobs_per_hour': round(slots * 3600 / average_job, 1) if average_job else None
+        }
@@ -0,0 +1,506 @@
+import os
+import re
+import json
+import logging
+import sqlite3
+import threading
+from collections import Counter, OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Any, Iterator, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Checkpoints are stored as a bitmask on finished jobs
+CHECKPOINT_BITS = {'downloaded': 1, 'encoded': 2, 'uploaded': 4}
+
+# Keys of a size-targeting prediction worth keeping once the job is done
+RATE_CONTROL_LOG_KEYS = ('avg_bitrate', 'max_bitrate', 'crf', 'predicted_size', 'complexity_bitrate')
+
+ARCHIVE_READ_BLOCK = 64 * 1024
+
+# Archive lines start with the job id (it is the first slot), so indexing skips the JSON parse
+ARCHIVE_LINE_ID = re.compile(rb'\{"id":"([^"]+)"')
+
+
+def format_file_size(size_bytes: int) -> str:
+    """Format file size in human readable format"""
+    if size_bytes == 0:
+        return "0 B"
+
+    size = float(size_bytes)
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size < 1024.0:
+            return f"{size:.1f} {unit}"
+        size /= 1024.0
+
+    return f"{size:.1f} TB"
+
+
+def _timestamp(value: Optional[datetime]) -> Optional[float]:
+    return value.timestamp() if value else None
+
+
+def _digest(value: Optional[str]) -> Optional[bytes]:
+    return bytes.fromhex(value) if value else None
+
+
+class JobRecord:
+    """Compact, immutable-by-convention summary of a finished (or snapshotted) job"""
+
+    __slots__ = (
+        'id', 'status', 'codec', 'input_file', 'output_file', 'remote_path', 'upload_path',
+        'created_at', 'started_at', 'completed_at', 'source_size', 'file_size_before',
+        'file_size_after', 'target_size', 'target_bitrate', 'error_message', 'checkpoint_bits',
+        'stage_seconds', 'stage_attempts', 'percentage', '_expected_source_sha256',
+        '_source_sha256', '_output_sha256', 'duplicate_of', 'rate_control', 'encoder',
+        'media_duration', 'width', 'height', 'ffmpeg_log', 'keep_source', 'transfer_mbps',
+        'source_codecs', 'destinations', 'priority', 'quality', 'sidecars'
+    )
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+
+    @classmethod
+    def from_job(cls, job) -> 'JobRecord':
+        """Compact an EncodingJob; the free-form progress dict is reduced to its percentage"""
+        return cls(
+            id=job.id,
+            status=job.status,
+            codec=job.codec,
+            input_file=job.input_file,
+            output_file=job.output_file,
+            remote_path=job.remote_path,
+            upload_path=job.upload_path,
+            created_at=_timestamp(job.created_at),
+            started_at=_timestamp(job.started_at),
+            completed_at=_timestamp(job.completed_at),
+            source_size=job.source_size,
+            file_size_before=job.file_size_before,
+            file_size_after=job.file_size_after,
+            target_size=job.target_size,
+            target_bitrate=job.target_bitrate,
+            error_message=job.error_message,
+            checkpoint_bits=sum(CHECKPOINT_BITS[c] for c in job.checkpoints if c in CHECKPOINT_BITS),
+            stage_seconds=tuple(
+                (stage, round(end - start, 2)) for stage, (start, end) in job.stage_timings.items()
+            ),
+            stage_attempts=tuple(job.stage_attempts.items()),
+            percentage=(job.progress or {}).get('percentage'),
+            _expected_source_sha256=_digest(job.expected_source_sha256),
+            _source_sha256=_digest(job.source_sha256),
+            _output_sha256=_digest(job.output_sha256),
+            duplicate_of=job.duplicate_of,
+            rate_control={
+                key: job.rate_control[key] for key in RATE_CONTROL_LOG_KEYS if key in job.rate_control
+            } if job.rate_control else None,
+            encoder=job.encoder,
+            media_duration=job.media_duration,
+            width=job.width,
+            height=job.height,
+            # Only failures need the encoder's last words
+            ffmpeg_log=tuple(job.ffmpeg_log) if job.status.value == 'failed' and job.ffmpeg_log else None,
+            keep_source=job.keep_source or None,
+            transfer_mbps=tuple(
+                (stage, stats['mbps']) for stage, stats in job.transfer_stats.items() if stats.get('mbps')
+            ),
+            source_codecs=job.source_codecs,
+            destinations={name: dict(status) for name, status in job.destinations.items()} or None,
+            priority=job.priority or None,
+            quality=dict(job.quality) if job.quality else None,
+            sidecars=dict(job.sidecars) if job.sidecars else None
+        )
+
+    @property
+    def checkpoints(self) -> List[str]:
+        return [name for name, bit in CHECKPOINT_BITS.items() if self.checkpoint_bits & bit]
+
+    @property
+    def expected_source_sha256(self) -> Optional[str]:
+        return self._expected_source_sha256.hex() if self._expected_source_sha256 else None
+
+    @property
+    def source_sha256(self) -> Optional[str]:
+        return self._source_sha256.hex() if self._source_sha256 else None
+
+    @property
+    def output_sha256(self) -> Optional[str]:
+        return self._output_sha256.hex() if self._output_sha256 else None
+
+    def to_archive(self) -> Dict[str, Any]:
+        """JSON-serialisable form for the on-disk archive"""
+        data = {}
+        for name in self.__slots__:
+            value = getattr(self, name)
+            if value is None or value == ():
+                continue
+            if isinstance(value, bytes):
+                value = value.hex()
+            data[name.lstrip('_')] = value
+        data['status'] = self.status.value
+        return data
+
+    @classmethod
+    def from_archive(cls, data: Dict[str, Any]) -> 'JobRecord':
+        # Import here to avoid circular imports
+        from .queue_manager import JobStatus
+
+        fields = {}
+        for name in cls.__slots__:
+            value = data.get(name.lstrip('_'))
+            if name.startswith('_') and value:
+                value = bytes.fromhex(value)
+            elif name in ('stage_seconds', 'stage_attempts', 'transfer_mbps') and value:
+                value = tuple(tuple(pair) for pair in value)
+            elif name == 'ffmpeg_log' and value:
+                value = tuple(value)
+            fields[name] = value
+        fields['status'] = JobStatus(data['status'])
+        fields['checkpoint_bits'] = fields['checkpoint_bits'] or 0
+        return cls(**fields)
+
+    def to_job(self):
+        """Rebuild an EncodingJob so a failed or cancelled job can be retried"""
+        # Import here to avoid circular imports
+        from .queue_manager import EncodingJob
+
+        return EncodingJob(
+            id=self.id,
+            input_file=self.input_file,
+            output_file=self.output_file,
+            codec=self.codec,
+            status=self.status,
+            created_at=datetime.fromtimestamp(self.created_at),
+            file_size_before=self.file_size_before,
+            remote_path=self.remote_path,
+            source_size=self.source_size,
+            target_size=self.target_size,
+            target_bitrate=self.target_bitrate,
+            checkpoints=self.checkpoints,
+            upload_path=self.upload_path,
+            expected_source_sha256=self.expected_source_sha256,
+            source_sha256=self.source_sha256,
+            output_sha256=self.output_sha256,
+            media_duration=self.media_duration,
+            width=self.width,
+            height=self.height,
+            source_codecs=self.source_codecs,
+            destinations={name: dict(status) for name, status in (self.destinations or {}).items()},
+            keep_source=bool(self.keep_source),
+            priority=self.priority or 0,
+            quality=dict(self.quality) if self.quality else None,
+            sidecars=dict(self.sidecars) if self.sidecars else None
+        )
+
+    def to_log_entry(self, progress: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Entry for the logs API; `progress` is the live dict of an active job"""
+        if progress is None:
+            progress = {'percentage': self.percentage} if self.percentage is not None else {}
+
+        log_entry = {
+            'id': self.id,
+            'input_file': os.path.basename(self.input_file),
+            'output_file': os.path.basename(self.output_file),
+            'codec': self.codec,
+            'status': self.status.value,
+            'created_at': datetime.fromtimestamp(self.created_at).strftime("%Y-%m-%d %H:%M:%S"),
+            'progress': progress,
+            'error_message': self.error_message
+        }
+
+        if self.stage_attempts:
+            log_entry['stage_attempts'] = dict(self.stage_attempts)
+
+        if self.checkpoint_bits:
+            log_entry['checkpoints'] = self.checkpoints
+
+        if self.stage_seconds:
+            log_entry['stage_seconds'] = dict(self.stage_seconds)
+
+        if self.transfer_mbps:
+            log_entry['transfer_mbps'] = dict(self.transfer_mbps)
+
+        for key in ('source_sha256', 'output_sha256', 'duplicate_of', 'encoder', 'source_codecs', 'priority'):
+            if getattr(self, key):
+                log_entry[key] = getattr(self, key)
+
+        if self.rate_control:
+            log_entry['rate_control'] = self.rate_control
+
+        if self.destinations:
+            log_entry['destinations'] = self.destinations
+
+        if self.quality:
+            log_entry['quality'] = self.quality
+
+        if self.sidecars:
+            log_entry['sidecars'] = self.sidecars
+
+        if self.ffmpeg_log:
+            log_entry['has_ffmpeg_log'] = True
+
+        if self.started_at:
+            log_entry['started_at'] = datetime.fromtimestamp(self.started_at).strftime("%Y-%m-%d %H:%M:%S")
+
+        if self.completed_at:
+            log_entry['completed_at'] = datetime.fromtimestamp(self.completed_at).strftime("%Y-%m-%d %H:%M:%S")
+
+            # Calculate duration
+            if self.started_at:
+                log_entry['duration'] = f"{self.completed_at - self.started_at:.1f}s"
+
+        # Calculate compression ratio
+        if self.file_size_before and self.file_size_after:
+            ratio = (1 - self.file_size_after / self.file_size_before) * 100
+            log_entry['compression_ratio'] = f"{ratio:.1f}%"
+            log_entry['size_before'] = format_file_size(self.file_size_before)
+            log_entry['size_after'] = format_file_size(self.file_size_after)
+
+        return log_entry
+
+
+class JobHistory:
+    """Finished jobs: a bounded in-memory window backed by an append-only JSON-lines archive
+
+    A SQLite sidecar (`<archive>.idx`) maps each job id to the byte offset of
+    its latest archive line, so looking up a job outside the window reads one
+    line. The sidecar remembers how much of the archive it covers; opening the
+    archive only indexes lines appended past that point.
+    """
+
+    def __init__(self, window_size: int = 200, archive_path: Optional[str] = None):
+        self.window_size = window_size
+        self.archive_path = archive_path
+        self.window: "OrderedDict[str, JobRecord]" = OrderedDict()
+        self.counts: Counter = Counter()
+        self.archived_count = 0
+        self._index: Optional[sqlite3.Connection] = None
+        self._indexed_bytes = 0  # Archive bytes the sidecar covers
+        self._lock = threading.Lock()
+
+        if self.archive_path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.archive_path)), exist_ok=True)
+            self._open_index()
+
+    @classmethod
+    def from_env(cls) -> 'JobHistory':
+        """Build the history from JOB_HISTORY_SIZE and JOB_ARCHIVE_PATH (empty disables the archive)"""
+        return cls(
+            window_size=int(os.getenv("JOB_HISTORY_SIZE", "200")),
+            archive_path=os.getenv("JOB_ARCHIVE_PATH", "logs/job_history.jsonl") or None
+        )
+
+    def add(self, job) -> List[str]:
+        """Record a finished job; returns the ids that fell out of the in-memory window"""
+        record = JobRecord.from_job(job)
+        evicted = []
+        with self._lock:
+            self._append_to_archive(record)
+            self._discard(record.id)
+            self.window[record.id] = record
+            self.counts[record.status] += 1
+            while len(self.window) > self.window_size:
+                old_id, old = self.window.popitem(last=False)
+                self.counts[old.status] -= 1
+                evicted.append(old_id)
+        return evicted
+
+    def _open_index(self):
+        """Open the sidecar index and bring it up to date; a damaged one is rebuilt from the archive"""
+        index_path = self.archive_path + '.idx'
+        for attempt in range(2):
+            try:
+                self._index = sqlite3.connect(index_path, check_same_thread=False)
+                self._index.execute('CREATE TABLE IF NOT EXISTS offsets (id TEXT PRIMARY KEY, offset INTEGER NOT NULL)')
+                self._index.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+                self._catch_up_index()
+                return
+            except (OSError, sqlite3.Error) as e:
+                if self._index:
+                    self._index.close()
+                self._index = None
+                if attempt or not os.path.exists(index_path):
+                    logger.error(f"Job archive index unavailable, archived jobs cannot be looked up: {e}")
+                    return
+                logger.warning(f"Rebuilding job archive index {index_path}: {e}")
+                os.remove(index_path)
+
+    def _catch_up_index(self):
+        """Index the archive lines written since the sidecar was last updated"""
+        meta = dict(self._index.execute('SELECT key, value FROM meta'))
+        self._indexed_bytes = meta.get('indexed_bytes', 0)
+        self.archived_count = meta.get('records', 0)
+        size = os.path.getsize(self.archive_path) if os.path.exists(self.archive_path) else 0
+        if size < self._indexed_bytes:
+            # The archive was replaced or truncated under the index
+            self._index.execute('DELETE FROM offsets')
+            self._indexed_bytes = self.archived_count = 0
+        if size == self._indexed_bytes:
+            return
+
+        offsets = []
+        offset = self._indexed_bytes
+        with open(self.archive_path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                match = ARCHIVE_LINE_ID.match(line)
+                if match:
+                    offsets.append((match.group(1).decode(), offset))
+                self.archived_count += 1
+                offset += len(line)
+        self._index.executemany('INSERT OR REPLACE INTO offsets VALUES (?, ?)', offsets)
+        self._indexed_bytes = offset
+        self._save_index_meta()
+
+    def _save_index_meta(self):
+        self._index.executemany('INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                                [('indexed_bytes', self._indexed_bytes), ('records', self.archived_count)])
+        self._index.commit()
+
+    def _append_to_archive(self, record: JobRecord):
+        """Append one record (caller holds the lock); a failed write only loses durability"""
+        if not self.archive_path:
+            return
+        try:
+            line = (json.dumps(record.to_archive(), separators=(',', ':')) + '\n').encode()
+            with open(self.archive_path, 'ab') as f:
+                offset = f.tell()
+                f.write(line)
+            self.archived_count += 1
+        except OSError as e:
+            logger.error(f"Could not archive job {record.id}: {e}")
+            return
+        if not self._index:
+            return
+        try:
+            self._index.execute('INSERT OR REPLACE INTO offsets VALUES (?, ?)', (record.id, offset))
+            # Only advance past contiguous lines, so a missed update is caught up on the next open
+            if offset == self._indexed_bytes:
+                self._indexed_bytes = offset + len(line)
+            self._save_index_meta()
+        except sqlite3.Error as e:
+            logger.error(f"Could not index archived job {record.id}: {e}")
+
+    def _read_archived(self, offset: int) -> Optional[JobRecord]:
+        with open(self.archive_path, 'rb') as f:
+            f.seek(offset)
+            line = f.readline()
+        try:
+            return JobRecord.from_archive(json.loads(line))
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Skipping unreadable job archive line: {e}")
+            return None
+
+    def _discard(self, job_id: str) -> Optional[JobRecord]:
+        """Remove a record from the window (caller holds the lock)"""
+        record = self.window.pop(job_id, None)
+        if record:
+            self.counts[record.status] -= 1
+        return record
+
+    def get(self, job_id: str) -> Optional[JobRecord]:
+        """Look a job up in the window, then in the archive (through the offset index)"""
+        with self._lock:
+            record = self.window.get(job_id)
+            if record:
+                return record
+            offset = self._lookup_offset(job_id)
+        if offset is None:
+            return None
+        try:
+            return self._read_archived(offset)
+        except OSError as e:
+            logger.error(f"Could not read job {job_id} from the archive: {e}")
+            return None
+
+    def _lookup_offset(self, job_id: str) -> Optional[int]:
+        """Offset of a job's latest archive line (caller holds the lock)"""
+        if not self._index:
+            return None
+        try:
+            row = self._index.execute('SELECT offset FROM offsets WHERE id = ?', (job_id,)).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"Could not look up job {job_id} in the archive index: {e}")
+            return None
+        return row[0] if row else None
+
+    def forget(self, job_id: str):
+        """Drop a job from the window (e.g. it is being retried); the archive keeps its old state"""
+        with self._lock:
+            self._discard(job_id)
+
+    def clear(self) -> List[str]:
+        """Empty the in-memory window; the records stay queryable in the archive"""
+        with self._lock:
+            cleared = list(self.window)
+            self.window.clear()
+            self.counts.clear()
+        return cleared
+
+    def recent(self) -> List[JobRecord]:
+        """Window records, newest first"""
+        with self._lock:
+            records = list(self.window.values())
+        return sorted(records, key=lambda r: r.created_at, reverse=True)
+
+    def find(self, predicate) -> Optional[JobRecord]:
+        """First window record matching a predicate"""
+        with self._lock:
+            records = list(self.window.values())
+        for record in reversed(records):
+            if predicate(record):
+                return record
+        return None
+
+    def query(self, limit: int = 100, offset: int = 0, exclude: Optional[set] = None) -> List[JobRecord]:
+        """Newest-first page over the whole archive (one entry per job id, latest state wins)"""
+        if not self.archive_path:
+            return self.recent()[offset:offset + limit]
+
+        seen = set(exclude or ())
+        page = []
+        skipped = 0
+        for record in self._iter_archive():
+            if record.id in seen:
+                continue
+            seen.add(record.id)
+            if skipped < offset:
+                skipped += 1
+                continue
+            page.append(record)
+            if len(page) >= limit:
+                break
+        return page
+
+    def _iter_archive(self) -> Iterator[JobRecord]:
+        """Archive records from newest to oldest, reading the file backwards in blocks"""
+        if not self.archive_path or not os.path.exists(self.archive_path):
+            return
+        for line in self._reverse_lines(self.archive_path):
+            try:
+                yield JobRecord.from_archive(json.loads(line))
+            except (ValueError, KeyError, TypeError) as e:
+                logger.warning(f"Skipping unreadable job archive line: {e}")
+
+    @staticmethod
+    def _reverse_lines(path: str) -> Iterator[bytes]:
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            position = f.tell()
+            remainder = b''
+            while position > 0:
+                read_size = min(ARCHIVE_READ_BLOCK, position)
+                position -= read_size
+                f.seek(position)
+                lines = (f.read(read_size) + remainder).split(b'\n')
+                remainder = lines.pop(0)
+                for line in reversed(lines):
+                    if line.strip():
+                        yield line
+            if remainder.strip():
+                yield remainder
+
+    def get_counts(self) -> Tuple[Counter, int]:
+        """Status counts of the window and the number of archived records"""
+        with self._lock:
+            return Counter(self.counts), self.archived_count
@@ -0,0 +1,147 @@
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional, Any, Tuple
+
+logger = logging.getLogger(__name__)
+
+SORT_KEYS = ('name', 'size', 'date')
+
+# Rows per page when the caller does not ask for a size, and the most it may ask for
+DEFAULT_PAGE_SIZE = 200
+MAX_PAGE_SIZE = 1000
+
+
+class ListingCache:
+    """Serves folder listings a page at a time
+
+    A storage listing always returns the whole folder, so it is fetched once,
+    kept for a short while and sliced per request; sorted views are cached on
+    top of it. Responses stay the same size however large the
+    folder is.
+    """
+
+    def __init__(self, ttl: float = 30.0, max_folders: int = 32):
+        self.ttl = ttl
+        self.max_folders = max_folders
+        # path -> (fetched at, listing, {(sort, descending): rows})
+        self._entries: 'OrderedDict[str, Tuple[float, Dict[str, Any], Dict[tuple, List[list]]]]' = OrderedDict()
+        self._pending: Dict[str, asyncio.Future] = {}
+
+    @classmethod
+    def from_env(cls) -> 'ListingCache':
+        """Build from LISTING_CACHE_SECONDS and LISTING_CACHE_FOLDERS"""
+        return cls(
+            ttl=float(os.getenv("LISTING_CACHE_SECONDS", "30")),
+            max_folders=int(os.getenv("LISTING_CACHE_FOLDERS", "32"))
+        )
+
+    @staticmethod
+    def _normalise(path: str) -> str:
+        return path.strip('/')
+
+    async def get(self, path: str, refresh: bool = False) -> Dict[str, Any]:
+        """The full listing of a folder, from the cache while it is fresh"""
+        # Import here to avoid circular imports
+        from .bunny_client import list_files
+
+        path = self._normalise(path)
+        entry = self._entries.get(path)
+        if entry and not refresh and time.monotonic() - entry[0] < self.ttl:
+            self._entries.move_to_end(path)
+            return entry[1]
+
+        # Concurrent requests for the same folder share one listing call
+        pending = self._pending.get(path)
+        if pending:
+            return await asyncio.shield(pending)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[path] = future
+        try:
+            listing = await list_files(path)
+            self._entries[path] = (time.monotonic(), listing, {})
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_folders:
+                self._entries.popitem(last=False)
+            future.set_result(listing)
+            return listing
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Marks it retrieved when no other request was waiting
+            raise
+        finally:
+            del self._pending[path]
+
+    def _rows(self, path: str, listing: Dict[str, Any], sort: str, descending: bool,
+              query: str) -> List[list]:
+        """Directories then files as [type, name, size, modified], sorted and filtered
+
+        Only the unfiltered sort orders are cached (at most six per folder);
+        a filter is a pass over the cached order, so typing a query does not
+        grow the cache by one view per keystroke.
+        """
+        views = self._entries[path][2] if path in self._entries else {}
+        key = (sort, descending)
+        rows = views.get(key)
+        if rows is None:
+            rows = views[key] = self._sorted_rows(listing, sort, descending)
+        if not query:
+            return rows
+        needle = query.lower()
+        return [row for row in rows if needle in row[1].lower()]
+
+    @staticmethod
+    def _sorted_rows(listing: Dict[str, Any], sort: str, descending: bool) -> List[list]:
+        directories = [['d', d['name'], None, d.get('last_modified') or None] for d in listing['directories']]
+        files = [['f', f['name'], f['size'], f['last_modified'] or None] for f in listing['files']]
+
+        by_name = lambda row: row[1].lower()
+        if sort == 'size':
+            files.sort(key=lambda row: (row[2] or 0, by_name(row)), reverse=descending)
+            directories.sort(key=by_name)  # Directories have no size
+        elif sort == 'date':
+            for rows in (directories, files):
+                rows.sort(key=lambda row: (row[3] or '', by_name(row)), reverse=descending)
+        else:
+            for rows in (directories, files):
+                rows.sort(key=by_name, reverse=descending)
+        return directories + files
+
+    async def page(self, path: str, offset: int = 0, limit: int = DEFAULT_PAGE_SIZE, sort: str = 'name',
+                   order: str = 'asc', query: str = '', refresh: bool = False) -> Dict[str, Any]:
+        """One page of a folder as compact rows; `total` counts rows matching the filter"""
+        path = self._normalise(path)
+        sort = sort if sort in SORT_KEYS else 'name'
+        descending = order == 'desc'
+        offset = max(offset, 0)
+        limit = min(max(limit, 1), MAX_PAGE_SIZE)
+
+        listing = await self.get(path, refresh)
+        rows = self._rows(path, listing, sort, descending, query.strip())
+        return {
+            'path': path,
+            'parent': path.rsplit('/', 1)[0] if '/' in path else ('' if path else None),
+            'columns': ['type', 'name', 'size', 'modified'],
+            'rows': rows[offset:offset + limit],
+            'offset': offset,
+            'total': len(rows),
+            'directories': len(listing['directories']),
+            'files': len(listing['files']),
+            'sort': sort,
+            'order': 'desc' if descending else 'asc',
+            'query': query.strip()
+        }
+
+# Global instance
+listing_cache = ListingCache.from_env()
+
+async def get_listing(path: str, refresh: bool = False) -> Dict[str, Any]:
+    """Get a folder's full listing, cached for a short while"""
+    return await listing_cache.get(path, refresh)
+
+async def get_listing_page(path: str, offset: int = 0, limit: int = DEFAULT_PAGE_SIZE, sort: str = 'name',
+                           order: str = 'asc', query: str = '', refresh: bool = False) -> Dict[str, Any]:
+    """Get one sorted, filtered page of a folder"""
+    return await listing_cache.page(path, offset, limit, sort, order, query, refresh)
@@ -0,0 +1,114 @@
+import os
+import sys
+import json
+import queue
+import atexit
+import logging
+import logging.handlers
+import contextvars
+from datetime import datetime
+from typing import Optional
+
+# Job the current task or transfer thread is working on; asyncio tasks and
+# asyncio.to_thread copy the context, so records from either carry the job ID
+current_job_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar('current_job_id', default=None)
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JobContextFilter(logging.Filter):
+    """Stamp records with the job ID from the current context (unless passed via `extra`)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, 'job_id', None) is None:
+            record.job_id = current_job_id.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; fields that are not set are left out"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        if getattr(record, 'job_id', None):
+            entry['job_id'] = record.job_id
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """The classic console format with the job ID appended when there is one"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        message = super().format(record)
+        job_id = getattr(record, 'job_id', None)
+        return f"{message} [job {job_id[:8]}]" if job_id else message
+
+
+def _file_handler(path: str) -> logging.Handler:
+    """Size-rotated by default; LOG_ROTATE_WHEN (e.g. 'midnight') switches to time-based rotation"""
+    backup_count = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+    when = os.getenv("LOG_ROTATE_WHEN", "")
+    if when:
+        return logging.handlers.TimedRotatingFileHandler(path, when=when, backupCount=backup_count,
+                                                         encoding='utf-8')
+    max_bytes = int(float(os.getenv("LOG_MAX_MB", "50")) * 1024 * 1024)
+    return logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count,
+                                                encoding='utf-8')
+
+
+def configure_logging():
+    """Route all records through a queue so callers never wait on console or disk I/O
+
+    The console keeps the human-readable format; LOG_FILE gets rotated JSON
+    records (LOG_FORMAT=text for the console format instead).
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    handlers = []
+    console = logging.StreamHandler(sys.stdout)
+    console.setFormatter(TextFormatter(TEXT_FORMAT))
+    handlers.append(console)
+
+    log_file = os.getenv("LOG_FILE", "logs/application.jsonl")
+    if log_file:
+        os.makedirs(os.path.dirname(log_file) or ".", exist_ok=True)
+        file_handler = _file_handler(log_file)
+        if os.getenv("LOG_FORMAT", "json").lower() == "text":
+            file_handler.setFormatter(TextFormatter(TEXT_FORMAT))
+        else:
+            file_handler.setFormatter(JsonFormatter())
+        handlers.append(file_handler)
+
+    # Filters on the queue handler run in the caller's thread, before the record
+    # is queued, while the contextvar still holds the caller's job
+    queue_handler = logging.handlers.QueueHandler(queue.SimpleQueue())
+    queue_handler.addFilter(JobContextFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+
+    _listener = logging.handlers.QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
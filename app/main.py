@@ -4,36 +4,40 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
 import os
+import sys
+import time
+import signal
 import asyncio
 import logging
-import sys
 from datetime import datetime
 from typing import Dict, List
 
-from .ffmpeg_worker import (
-    get_gpu_info, get_nvenc_capabilities, 
-    get_supported_codecs, validate_input_file
+from .ffmpeg_worker import get_supported_codecs, validate_input_file
+from .telemetry import (
+    start_telemetry, get_gpu_info, get_nvenc_capabilities,
+    get_telemetry, get_latest_telemetry
 )
-from .bunny_client import list_files, download_file, upload_file
+from .bunny_client import download_file, upload_file
 from .queue_manager import (
     add_encoding_job, get_queue_status, get_job_logs, 
-    cancel_job, clear_completed_jobs, get_job
+    cancel_job, clear_completed_jobs, get_job, retry_job, get_queue_forecast,
+    get_ffmpeg_log, drain_queue, resume_queue, handover_queue, restore_queue_state
 )
+from .staging import sweep_orphans, get_staging_status
+from .transfer_scheduler import get_transfer_status
+from .concurrency import get_concurrency_status
+from .preflight import preflight_sources
+from .destinations import get_destinations
+from .listing import get_listing, get_listing_page, DEFAULT_PAGE_SIZE
+from .watch_folder import start_folder_watcher, get_watch_status, scan_watch_folders
+from .cpu_allocator import get_cpu_allocation_status
+from .log_config import configure_logging, shutdown_logging
+from .encoders import get_encoder_status, run_encoder_benchmark, start_encoder_benchmark
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('logs/application.log'),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+# Configure logging (creates the log directory; records are written by a background thread)
+configure_logging()
 logger = logging.getLogger(__name__)
 
-# Create logs directory
-os.makedirs("logs", exist_ok=True)
-
 app = FastAPI()
 
 # Templates
@@ -43,6 +47,77 @@ templates = Jinja2Templates(directory="app/templates")
 os.makedirs("input", exist_ok=True)
 os.makedirs("output", exist_ok=True)
 
+# Changes when a reload re-executes the process, which keeps its pid
+STARTED_AT = time.time()
+
+# Seconds a reload (SIGHUP) waits for transfers to finish before handing over anyway
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT_SECONDS", "600"))
+
+@app.on_event("startup")
+async def cleanup_staging():
+    """Re-queue jobs handed over by the previous process, then remove partial files nobody owns"""
+    sweep_orphans(restore_queue_state())
+
+@app.on_event("startup")
+async def install_reload_handler():
+    """SIGHUP (systemctl reload) drains the queue, hands it over and re-executes the new version in place"""
+    loop = asyncio.get_running_loop()
+    reloading = False
+
+    async def drain_and_reload():
+        nonlocal reloading
+        if reloading:
+            return
+        reloading = True
+        ready = await asyncio.to_thread(drain_queue, DRAIN_TIMEOUT)
+        if not ready:
+            logger.warning(f"Drain timed out after {DRAIN_TIMEOUT:.0f}s, handing over unfinished stages")
+        await asyncio.to_thread(handover_queue, True)
+        logger.info("Re-executing to load the new version")
+        shutdown_logging()
+        # Same pid, so systemd keeps the unit and its encodes (still our children) running;
+        # the listening socket is closed on exec and the new version binds it again
+        os.execv(sys.executable, [sys.executable, *sys.orig_argv[1:]])
+
+    try:
+        loop.add_signal_handler(signal.SIGHUP, lambda: asyncio.ensure_future(drain_and_reload()))
+    except (NotImplementedError, RuntimeError, ValueError):
+        # Not on the main thread (e.g. under a test client) or not on Unix
+        logger.info("Reload handler not installed; use POST /api/queue/drain before restarting")
+
+@app.on_event("startup")
+async def start_watch_folder():
+    """Poll the source prefixes in WATCH_PREFIXES and queue new uploads"""
+    start_folder_watcher()
+
+@app.on_event("shutdown")
+async def hand_over_jobs():
+    """Save the queue for the next start; running encodes are stopped, only a reload hands them over"""
+    await asyncio.to_thread(handover_queue, False)
+
+@app.on_event("startup")
+async def start_hardware_sampler():
+    """Sample GPU/CPU/RAM/disk/network in the background; routes only read snapshots"""
+    start_telemetry()
+
+@app.on_event("startup")
+async def benchmark_encoders():
+    """Measure encoder backend speeds once so 'auto' can pick the fastest"""
+    start_encoder_benchmark()
+
+async def get_listing_metadata(file_paths: List[str]) -> Dict[str, Dict]:
+    """Look up source sizes and checksums from the storage listing, one request per folder"""
+    metadata = {}
+    folders = {path.rsplit('/', 1)[0] if '/' in path else '' for path in file_paths}
+    for folder in folders:
+        try:
+            files_data = await get_listing(folder)
+            for file_info in files_data['files']:
+                metadata[file_info['path']] = file_info
+        except Exception as e:
+            logger.warning(f"Could not list {folder or '/'} for source metadata: {e}")
+    return metadata
+
 # Optional static files
 if os.path.isdir("static"):
     app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -63,25 +138,14 @@ async def dashboard(request: Request, path: str = ""):
         nvenc_caps = get_nvenc_capabilities()
         has_nvenc = any(nvenc_caps.values())
         
-        # Try to get files from Bunny CDN
-        try:
-            files_data = await list_files(path)
-        except Exception as bunny_error:
-            logger.warning(f"Bunny CDN error: {bunny_error}")
-            # Return with empty file list but working hardware info
-            files_data = {
-                "directories": [], 
-                "files": [], 
-                "current_path": path, 
-                "parent_path": ""
-            }
-        
-        return templates.TemplateResponse("dashboard.html", {
+        # The file browser pages through /api/files itself, so huge folders
+        # never delay the page
+        return templates.TemplateResponse(request, "dashboard.html", {
             "request": request, 
-            "files_data": files_data,
             "current_path": path,
             "has_nvenc": has_nvenc,
             "nvenc_caps": nvenc_caps,
+            "codecs": get_supported_codecs(),
             "gpu_info": gpu_info
         })
     except Exception as e:
@@ -97,31 +161,36 @@ async def dashboard(request: Request, path: str = ""):
             nvenc_caps = {"av1": False, "hevc": False, "h264": False}
             has_nvenc = False
         
-        return templates.TemplateResponse("dashboard.html", {
+        return templates.TemplateResponse(request, "dashboard.html", {
             "request": request, 
-            "files_data": {"directories": [], "files": [], "current_path": path, "parent_path": ""}, 
             "error": str(e),
             "current_path": path,
             "has_nvenc": has_nvenc,
             "nvenc_caps": nvenc_caps,
+            "codecs": [],
             "gpu_info": gpu_info
         })
 
 @app.get("/browse", response_class=HTMLResponse)
 async def browse_directory(request: Request, path: str = ""):
-    """AJAX endpoint for directory navigation"""
+    """AJAX endpoint for directory navigation: breadcrumb and list controls; rows come from /api/files"""
+    path = path.strip('/')
+    return templates.TemplateResponse(request, "file_list.html", {
+        "request": request,
+        "current_path": path,
+        "parent_path": path.rsplit('/', 1)[0] if '/' in path else "",
+        "page_size": DEFAULT_PAGE_SIZE
+    })
+
+@app.get("/api/files")
+async def api_list_files(path: str = "", offset: int = 0, limit: int = DEFAULT_PAGE_SIZE, sort: str = "name",
+                         order: str = "asc", q: str = "", refresh: bool = False):
+    """One sorted (name/size/date), substring-filtered page of a source folder as compact rows"""
     try:
-        files_data = await list_files(path)
-        return templates.TemplateResponse("file_list.html", {
-            "request": request,
-            "files_data": files_data
-        })
+        return await get_listing_page(path, offset, limit, sort, order, q, refresh)
     except Exception as e:
-        return templates.TemplateResponse("file_list.html", {
-            "request": request,
-            "files_data": {"directories": [], "files": [], "current_path": path, "parent_path": ""},
-            "error": str(e)
-        })
+        logger.warning(f"Could not list {path or '/'}: {e}")
+        return JSONResponse({"success": False, "error": str(e)}, status_code=502)
 
 @app.post("/encode")
 async def start_encoding(request: Request):
@@ -131,6 +200,13 @@ async def start_encoding(request: Request):
         file_paths = form_data.getlist("file_path")  # Get list of selected files
         codec = form_data.get("codec", "hevc_nvenc")
         
+        # Optional size-targeted mode: a target file size (MB) or total bitrate (kbps) per title
+        target_size_mb = form_data.get("target_size_mb")
+        target_bitrate_kbps = form_data.get("target_bitrate_kbps")
+        target_size = int(float(target_size_mb) * 1024 * 1024) if target_size_mb else None
+        target_bitrate = int(float(target_bitrate_kbps) * 1000) if target_bitrate_kbps else None
+        priority = int(form_data.get("priority") or 0)
+        
         if not file_paths:
             return JSONResponse({
                 "success": False,
@@ -139,9 +215,27 @@ async def start_encoding(request: Request):
         
         job_ids = []
         filenames = []
+        source_metadata = await get_listing_metadata(file_paths)
+        
+        # Probe every source before queueing it, so broken files fail now rather than after a download
+        preflight = await preflight_sources(
+            file_paths, {path: source_metadata.get(path, {}).get('size') for path in file_paths}
+        )
+        rejected = [
+            {"file": path, "reason": result.reason} for path, result in preflight.items() if not result.ok
+        ]
+        if len(rejected) == len(file_paths):
+            return JSONResponse({
+                "success": False,
+                "error": "; ".join(f"{r['file']}: {r['reason']}" for r in rejected),
+                "rejected": rejected
+            }, status_code=422)
         
         # Process each selected file
         for file_path in file_paths:
+            if not preflight[file_path].ok:
+                continue
+            
             # Extract filename from path for display
             filename = file_path.split('/')[-1]
             
@@ -151,20 +245,26 @@ async def start_encoding(request: Request):
             output_path = f"./output/{output_filename}"
             
             # Add job to queue with remote file path for download
-            job_id = add_encoding_job(input_path, output_path, codec)
-            
-            # Store the original remote path for download
-            job = get_job(job_id)
-            if job:
-                job.remote_path = file_path  # Store the original remote path
+            job_id = add_encoding_job(
+                input_path, output_path, codec,
+                remote_path=file_path,
+                source_size=source_metadata.get(file_path, {}).get('size'),
+                source_checksum=source_metadata.get(file_path, {}).get('checksum'),
+                target_size=target_size,
+                target_bitrate=target_bitrate,
+                media_info=preflight[file_path].media_info(),
+                priority=priority
+            )
             
             job_ids.append(job_id)
             filenames.append(filename)
         
         return JSONResponse({
             "success": True,
-            "message": f"Added {len(job_ids)} job(s) to queue",
+            "message": f"Added {len(job_ids)} job(s) to queue"
+                       + (f", rejected {len(rejected)}" if rejected else ""),
             "job_ids": job_ids,
+            "rejected": rejected,
             "filename": filenames[0] if len(filenames) == 1 else f"{len(filenames)} files",
             "codec": codec,
             "redirect_url": "/logs"
@@ -182,10 +282,24 @@ async def api_get_queue_status():
     """Get current queue status"""
     return get_queue_status()
 
+@app.get("/api/queue/forecast")
+async def api_get_queue_forecast():
+    """Get per-job ETAs, backlog completion time and the learned throughput model"""
+    return get_queue_forecast()
+
 @app.get("/api/queue/logs")
-async def api_get_job_logs(limit: int = 100):
-    """Get job logs"""
-    return get_job_logs(limit)
+async def api_get_job_logs(limit: int = 100, offset: int = 0, archived: bool = False):
+    """Get job logs; `archived=true` pages through every finished job on disk"""
+    # The archive is read from disk, so keep it off the event loop
+    return await asyncio.to_thread(get_job_logs, limit, offset, archived)
+
+@app.get("/api/queue/ffmpeg-log/{job_id}")
+async def api_get_ffmpeg_log(job_id: str):
+    """Get the last FFmpeg stderr lines of a running or failed job"""
+    lines = get_ffmpeg_log(job_id)
+    if lines is None:
+        return JSONResponse({"success": False, "error": "Job not found"}, status_code=404)
+    return {"success": True, "job_id": job_id, "lines": lines}
 
 @app.post("/api/queue/cancel/{job_id}")
 async def api_cancel_job(job_id: str):
@@ -202,6 +316,68 @@ async def api_cancel_job(job_id: str):
             "error": str(e)
         }
 
+@app.post("/api/queue/retry/{job_id}")
+async def api_retry_job(job_id: str):
+    """Retry a failed job from its last completed stage"""
+    try:
+        success = retry_job(job_id)
+        return {
+            "success": success,
+            "message": "Job re-queued" if success else "Only failed or cancelled jobs can be retried"
+        }
+    except Exception as e:
+        return {
+            "success": False,
+            "error": str(e)
+        }
+
+@app.post("/api/queue/drain")
+async def api_drain_queue():
+    """Stop starting new jobs; `ready` is true once a reload would lose no work"""
+    ready = drain_queue()
+    return {
+        "success": True,
+        "ready": ready,
+        "message": "Queue drained, safe to reload" if ready else "Draining: waiting for running transfers"
+    }
+
+@app.post("/api/queue/resume")
+async def api_resume_queue():
+    """Start admitting jobs again after a drain"""
+    resume_queue()
+    return {"success": True, "message": "Queue resumed"}
+
+@app.get("/api/staging")
+async def api_get_staging_status():
+    """Get staging volume free space and reservations"""
+    return get_staging_status()
+
+@app.get("/api/transfers")
+async def api_get_transfer_status():
+    """Get bandwidth limits, paused hosts and the throughput of active transfers"""
+    return get_transfer_status()
+
+@app.get("/api/concurrency")
+async def api_get_concurrency_status():
+    """Get per-stage concurrency limits, the utilization behind them and recent changes"""
+    return get_concurrency_status()
+
+@app.get("/api/destinations")
+async def api_get_destinations():
+    """Get the destination zones every encoded output is uploaded to"""
+    return get_destinations()
+
+@app.get("/api/watch")
+async def api_get_watch_status():
+    """Get the watched prefixes, files waiting out the debounce and poll statistics"""
+    return get_watch_status()
+
+@app.post("/api/watch/scan")
+async def api_scan_watch_folders():
+    """Poll the watched prefixes now instead of at the next interval"""
+    scan_watch_folders()
+    return {"success": True, "message": "Scan started"}
+
 @app.post("/api/queue/clear")
 async def api_clear_completed_jobs():
     """Clear all completed jobs"""
@@ -225,7 +401,7 @@ async def get_current_job_status():
 @app.get("/logs", response_class=HTMLResponse)
 async def logs_page(request: Request):
     """Logs page showing queue status and job logs"""
-    return templates.TemplateResponse("logs.html", {"request": request})
+    return templates.TemplateResponse(request, "logs.html", {"request": request})
 
 @app.get("/status", response_class=HTMLResponse)
 async def status_page(request: Request):
@@ -236,7 +412,7 @@ async def status_page(request: Request):
 @app.get("/health")
 async def health_check():
     """Simple health check endpoint"""
-    return {"status": "healthy", "message": "Video Encoder API is running"}
+    return {"status": "healthy", "message": "Video Encoder API is running", "started_at": STARTED_AT}
 
 @app.get("/api/status")
 async def api_get_status():
@@ -273,7 +449,9 @@ async def api_get_hardware():
             "gpu_available": gpu_info.get("available", False),
             "gpus": gpu_info.get("gpus", []),
             "nvenc_caps": nvenc_caps,
-            "has_nvenc": any(nvenc_caps.values())
+            "has_nvenc": any(nvenc_caps.values()),
+            "cpu": get_cpu_allocation_status(),
+            "telemetry": get_latest_telemetry()
         }
     except Exception as e:
         logger.error(f"Error getting hardware info: {e}")
@@ -285,6 +463,25 @@ async def api_get_hardware():
             "error": str(e)
         }
 
+@app.get("/api/encoders")
+async def api_get_encoders():
+    """Get encoder backends, whether this ffmpeg build has them and their measured speed"""
+    return get_encoder_status()
+
+@app.post("/api/encoders/benchmark")
+async def api_benchmark_encoders():
+    """Re-measure every available encoder backend on a synthetic 1080p clip"""
+    try:
+        results = await asyncio.to_thread(run_encoder_benchmark)
+        return {"success": True, "results": results}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+@app.get("/api/telemetry")
+async def api_get_telemetry(seconds: float = 300):
+    """Latest hardware sample plus recent history (for sparklines)"""
+    return get_telemetry(seconds)
+
 @app.post("/api/stop")
 async def api_stop_encoding():
     """API endpoint for stopping/cancelling jobs"""
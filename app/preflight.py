@@ -0,0 +1,250 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import secrets
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Any
+
+import aiohttp
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# ffprobe errors that say nothing about the file itself (storage unreachable,
+# overloaded or rate limiting); the job is admitted and the download retries
+TRANSIENT_ERRORS = ('Connection refused', 'timed out', 'Timed out', '5XX', 'but not one of 40')
+
+# Storage response headers ffprobe needs to size the object and seek with Range requests
+FORWARDED_HEADERS = ('Content-Type', 'Content-Length', 'Content-Range', 'Accept-Ranges', 'Last-Modified')
+
+PROXY_CHUNK_SIZE = 64 * 1024
+
+
+@asynccontextmanager
+async def authenticated_proxy(url: str, headers: Dict[str, str], timeout: float):
+    """Serve one storage object on a one-off localhost URL that adds its auth headers
+
+    ffprobe is only given the local URL, so the storage key never shows up in
+    its argv (ps, /proc, logged commands). Range requests are passed through,
+    so ffprobe still seeks instead of reading the whole object.
+    """
+    token = secrets.token_urlsafe(16)
+    session = aiohttp.ClientSession(
+        timeout=aiohttp.ClientTimeout(sock_connect=timeout, sock_read=timeout), auto_decompress=False
+    )
+
+    async def forward(request: web.Request) -> web.StreamResponse:
+        if request.match_info['token'] != token or request.method not in ('GET', 'HEAD'):
+            raise web.HTTPNotFound()
+        upstream_headers = {**headers, 'Accept-Encoding': 'identity'}
+        if 'Range' in request.headers:
+            upstream_headers['Range'] = request.headers['Range']
+        try:
+            upstream = await session.request(request.method, url, headers=upstream_headers)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            # ffprobe reports this as a 5XX reply, which the prober treats as transient
+            raise web.HTTPBadGateway(text=str(e))
+        async with upstream:
+            response = web.StreamResponse(status=upstream.status, reason=upstream.reason, headers={
+                name: upstream.headers[name] for name in FORWARDED_HEADERS if name in upstream.headers
+            })
+            await response.prepare(request)
+            try:
+                if request.method == 'GET':
+                    async for chunk in upstream.content.iter_chunked(PROXY_CHUNK_SIZE):
+                        await response.write(chunk)
+                await response.write_eof()
+            except (aiohttp.ClientError, asyncio.TimeoutError, ConnectionResetError):
+                # ffprobe closes the connection once it has read enough, or seeks elsewhere
+                pass
+            return response
+
+    app = web.Application()
+    app.router.add_route('*', '/{token}/{name:.*}', forward)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = runner.addresses[0][1]
+        # Keep the object name, ffprobe uses the extension as a format hint
+        yield f"http://127.0.0.1:{port}/{token}/{url.rsplit('/', 1)[-1]}"
+    finally:
+        await runner.cleanup()
+        await session.close()
+
+
+@dataclass
+class PreflightResult:
+    """What probing a source before admission found out"""
+    path: str
+    ok: bool
+    reason: Optional[str] = None
+    probed: bool = False  # False when probing was disabled or inconclusive (the job is admitted blind)
+    duration: Optional[float] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    video_codec: Optional[str] = None
+    audio_codecs: List[str] = field(default_factory=list)
+    format_name: Optional[str] = None
+    elapsed_ms: Optional[float] = None
+
+    @property
+    def codecs(self) -> Optional[str]:
+        """e.g. 'h264+aac'"""
+        names = [c for c in [self.video_codec, *self.audio_codecs] if c]
+        return '+'.join(names) or None
+
+    def media_info(self) -> Optional[Dict[str, Any]]:
+        """Fields the queue stores on the job, so the forecast knows the title before download"""
+        if not self.probed:
+            return None
+        return {'duration': self.duration, 'width': self.width, 'height': self.height, 'codecs': self.codecs}
+
+
+class RemoteProber:
+    """Validates sources in the storage zone with ffprobe over authenticated HTTP
+
+    FFmpeg's HTTP reader fetches the container header and seeks with Range
+    requests (e.g. to a trailing moov atom), so only a few small reads hit
+    storage instead of a full download. Requests go through
+    authenticated_proxy, which holds the storage key.
+    """
+
+    def __init__(self, enabled: bool = True, timeout: float = 15.0, concurrency: int = 8,
+                 min_duration: float = 0.5, max_duration: float = 24 * 3600, probesize: int = 5 * 1000 * 1000):
+        self.enabled = enabled
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.min_duration = min_duration
+        self.max_duration = max_duration
+        self.probesize = probesize
+
+    @classmethod
+    def from_env(cls) -> 'RemoteProber':
+        """Build from PREFLIGHT_ENABLED, PREFLIGHT_TIMEOUT_SECONDS, PREFLIGHT_CONCURRENCY and the duration bounds"""
+        return cls(
+            enabled=os.getenv("PREFLIGHT_ENABLED", "true").lower() in ("1", "true", "yes"),
+            timeout=float(os.getenv("PREFLIGHT_TIMEOUT_SECONDS", "15")),
+            concurrency=int(os.getenv("PREFLIGHT_CONCURRENCY", "8")),
+            min_duration=float(os.getenv("PREFLIGHT_MIN_DURATION_SECONDS", "0.5")),
+            max_duration=float(os.getenv("PREFLIGHT_MAX_DURATION_HOURS", "24")) * 3600
+        )
+
+    def _command(self, url: str) -> List[str]:
+        return [
+            'ffprobe', '-v', 'error', '-hide_banner',
+            '-rw_timeout', str(int(self.timeout * 1000 * 1000)),
+            '-probesize', str(self.probesize),
+            '-print_format', 'json', '-show_format', '-show_streams',
+            url
+        ]
+
+    async def _run(self, url: str):
+        """Run ffprobe on a URL; returns (returncode, stdout, stderr)"""
+        process = await asyncio.create_subprocess_exec(
+            *self._command(url), stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=self.timeout + 5)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            raise
+        return process.returncode, stdout, stderr
+
+    def validate(self, path: str, data: Dict[str, Any]) -> PreflightResult:
+        """Check ffprobe's JSON for a usable video stream and a plausible duration"""
+        result = PreflightResult(path=path, ok=False, probed=True)
+        streams = data.get('streams') or []
+        video = next((s for s in streams if s.get('codec_type') == 'video'
+                      and not s.get('disposition', {}).get('attached_pic')), None)
+        result.audio_codecs = [s.get('codec_name') for s in streams
+                               if s.get('codec_type') == 'audio' and s.get('codec_name')]
+        result.format_name = data.get('format', {}).get('format_name')
+
+        if video is None:
+            result.reason = "No video stream"
+            return result
+        result.video_codec = video.get('codec_name')
+        result.width = int(video.get('width') or 0) or None
+        result.height = int(video.get('height') or 0) or None
+        duration = data.get('format', {}).get('duration') or video.get('duration')
+        result.duration = float(duration) if duration not in (None, 'N/A') else None
+
+        if not result.video_codec or result.video_codec == 'none':
+            result.reason = "Video codec is not supported by this FFmpeg build"
+        elif not result.width or not result.height:
+            result.reason = "Video stream has no frame size"
+        elif result.duration is None or result.duration < self.min_duration:
+            result.reason = "Video stream is empty or has no duration"
+        elif result.duration > self.max_duration:
+            result.reason = f"Implausible duration ({result.duration / 3600:.1f} hours)"
+        else:
+            result.ok = True
+        return result
+
+    async def probe(self, path: str, size: Optional[int] = None) -> PreflightResult:
+        """Probe one object in the source zone; inconclusive probes admit the file"""
+        # Import here to avoid circular imports
+        from .bunny_client import source_request
+
+        if size == 0:
+            return PreflightResult(path=path, ok=False, reason="File is empty")
+        if not self.enabled:
+            return PreflightResult(path=path, ok=True)
+
+        started = time.monotonic()
+        url, headers = source_request(path)
+        try:
+            async with authenticated_proxy(url, headers, self.timeout) as local_url:
+                returncode, stdout, stderr = await self._run(local_url)
+        except OSError as e:
+            logger.warning(f"Pre-flight probe unavailable, admitting {path} unchecked: {e}")
+            return PreflightResult(path=path, ok=True)
+        except asyncio.TimeoutError:
+            logger.warning(f"Pre-flight probe of {path} timed out, admitting it unchecked")
+            return PreflightResult(path=path, ok=True)
+        elapsed_ms = round((time.monotonic() - started) * 1000, 1)
+
+        if returncode != 0:
+            lines = stderr.decode(errors='replace').strip().splitlines()
+            message = lines[-1] if lines else f"ffprobe exited with {returncode}"
+            message = message[len(local_url) + 2:] if message.startswith(local_url + ': ') else message
+            if any(marker in message for marker in TRANSIENT_ERRORS):
+                logger.warning(f"Pre-flight probe of {path} could not reach storage ({message}), admitting it unchecked")
+                return PreflightResult(path=path, ok=True, elapsed_ms=elapsed_ms)
+            # 404s, 401s and containers ffprobe cannot parse
+            return PreflightResult(path=path, ok=False, probed=True, elapsed_ms=elapsed_ms,
+                                   reason=f"Unreadable source: {message}")
+        try:
+            result = self.validate(path, json.loads(stdout or b'{}'))
+        except (ValueError, TypeError) as e:
+            result = PreflightResult(path=path, ok=False, probed=True, reason=f"Unreadable probe output: {e}")
+        result.elapsed_ms = elapsed_ms
+        if not result.ok:
+            logger.info(f"Pre-flight rejected {path}: {result.reason}")
+        return result
+
+    async def probe_many(self, paths: List[str],
+                         sizes: Optional[Dict[str, Optional[int]]] = None) -> Dict[str, PreflightResult]:
+        """Probe several sources at once, at most `concurrency` at a time"""
+        semaphore = asyncio.Semaphore(max(self.concurrency, 1))
+        sizes = sizes or {}
+
+        async def bounded(path):
+            async with semaphore:
+                return await self.probe(path, sizes.get(path))
+
+        results = await asyncio.gather(*(bounded(path) for path in paths))
+        return dict(zip(paths, results))
+
+# Global instance
+remote_prober = RemoteProber.from_env()
+
+async def preflight_sources(paths: List[str], sizes: Optional[Dict[str, Optional[int]]] = None) -> Dict[str, PreflightResult]:
+    """Validate remote sources before they are queued"""
+    return await remote_prober.probe_many(paths, sizes)
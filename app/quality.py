@@ -0,0 +1,181 @@
+import os
+import re
+import time
+import asyncio
+import logging
+import subprocess
+from typing import Dict, List, Optional, Any, Tuple
+
+from .size_targeting import SizeTargetPredictor
+from .cpu_allocator import cpu_allocator, CpuAllocation
+
+logger = logging.getLogger(__name__)
+
+METRICS = ('ssim', 'psnr', 'vmaf')
+
+# Summary lines the ssim, psnr and libvmaf filters log when they finish
+METRIC_PATTERNS = {
+    'ssim': re.compile(r'SSIM .*All:([\d.]+)'),
+    'psnr': re.compile(r'PSNR .*average:([\d.]+|inf)'),
+    'vmaf': re.compile(r'VMAF score[:=]\s*([\d.]+)')
+}
+
+# The psnr filter reports identical frames as "inf"; JSON has no infinity, so
+# scores are capped at a value no lossy encode reaches
+PSNR_CAP = 100.0
+
+class QualityEvaluator:
+    """Scores encodes against their source with FFmpeg's SSIM, PSNR and VMAF filters
+
+    Scoring the whole title costs about as much as decoding it twice, so by
+    default only a few short segments spread over the title are compared
+    (the same spread size targeting samples). Each evaluation is a separate
+    FFmpeg process, so the queue can start the next encode meanwhile; it takes
+    a share of the cores from the CPU allocator like an encode, using at most
+    `threads` of them.
+    """
+
+    def __init__(self, enabled: bool = False, metrics: Tuple[str, ...] = METRICS, sample_count: int = 3,
+                 sample_seconds: float = 5.0, threads: int = 2, vmaf_model: Optional[str] = None,
+                 timeout: float = 1800.0):
+        self.enabled = enabled
+        self.metrics = tuple(m for m in metrics if m in METRICS)
+        self.sample_count = sample_count
+        self.sample_seconds = sample_seconds
+        self.threads = threads
+        self.vmaf_model = vmaf_model
+        self.timeout = timeout
+        self._has_vmaf: Optional[bool] = None
+
+    @classmethod
+    def from_env(cls) -> 'QualityEvaluator':
+        """Build from QUALITY_EVAL_ENABLED, QUALITY_METRICS, QUALITY_SAMPLE_COUNT/SECONDS and friends"""
+        return cls(
+            enabled=os.getenv("QUALITY_EVAL_ENABLED", "false").lower() in ("1", "true", "yes"),
+            metrics=tuple(m.strip().lower() for m in os.getenv("QUALITY_METRICS", "ssim,psnr,vmaf").split(',')),
+            sample_count=int(os.getenv("QUALITY_SAMPLE_COUNT", "3")),
+            sample_seconds=float(os.getenv("QUALITY_SAMPLE_SECONDS", "5")),
+            threads=int(os.getenv("QUALITY_EVAL_THREADS", "2")),
+            vmaf_model=os.getenv("QUALITY_VMAF_MODEL") or None,
+            timeout=float(os.getenv("QUALITY_EVAL_TIMEOUT_SECONDS", "1800"))
+        )
+
+    def has_vmaf(self) -> bool:
+        """Whether this FFmpeg build has the libvmaf filter (checked once)"""
+        if self._has_vmaf is None:
+            try:
+                result = subprocess.run(['ffmpeg', '-hide_banner', '-filters'],
+                                        capture_output=True, text=True, timeout=10)
+                self._has_vmaf = ' libvmaf ' in result.stdout
+            except Exception:
+                self._has_vmaf = False
+            if 'vmaf' in self.metrics and not self._has_vmaf:
+                logger.warning("FFmpeg has no libvmaf filter; quality evaluation reports SSIM and PSNR only")
+        return self._has_vmaf
+
+    def active_metrics(self) -> List[str]:
+        return [m for m in self.metrics if m != 'vmaf' or self.has_vmaf()]
+
+    def segments(self, duration: float) -> List[Tuple[float, float]]:
+        """(offset, length) pairs to compare; the whole title when sampling is off or it is short"""
+        if self.sample_count <= 0 or duration <= self.sample_count * self.sample_seconds:
+            return [(0.0, duration)]
+        predictor = SizeTargetPredictor(self.sample_count, self.sample_seconds)
+        return [(offset, min(self.sample_seconds, duration - offset))
+                for offset in predictor.sample_offsets(duration)]
+
+    def build_command(self, source: str, output: str, offset: float, length: float,
+                      width: int, height: int, metrics: List[str], threads: Optional[int] = None) -> List[str]:
+        """Decode the same span of both files and run every metric on one pass"""
+        threads = threads or self.threads
+        count = len(metrics)
+        # The encode is scaled onto the source's frame size in case the preset resized it
+        graph = [
+            f"[0:v]scale={width}:{height}:flags=bicubic,setpts=PTS-STARTPTS,split={count}"
+            + ''.join(f"[d{i}]" for i in range(count)),
+            f"[1:v]setpts=PTS-STARTPTS,split={count}" + ''.join(f"[r{i}]" for i in range(count))
+        ]
+        for i, metric in enumerate(metrics):
+            if metric == 'vmaf':
+                options = f"n_threads={threads}" + (f":model=path={self.vmaf_model}" if self.vmaf_model else "")
+                graph.append(f"[d{i}][r{i}]libvmaf={options}")
+            else:
+                graph.append(f"[d{i}][r{i}]{metric}")
+        return [
+            'ffmpeg', '-hide_banner', '-nostats', '-y',
+            '-ss', str(offset), '-t', str(length), '-i', output,
+            '-ss', str(offset), '-t', str(length), '-i', source,
+            '-filter_complex', ';'.join(graph),
+            '-filter_threads', str(threads),
+            '-an', '-f', 'null', '-'
+        ]
+
+    @staticmethod
+    def parse_scores(stderr: str) -> Dict[str, float]:
+        scores = {}
+        for metric, pattern in METRIC_PATTERNS.items():
+            matches = pattern.findall(stderr)
+            if matches:
+                value = matches[-1]
+                scores[metric] = PSNR_CAP if value == 'inf' else float(value)
+        return scores
+
+    async def _score_segment(self, source: str, output: str, offset: float, length: float,
+                             width: int, height: int, metrics: List[str],
+                             allocation: CpuAllocation) -> Dict[str, float]:
+        threads = min(self.threads, allocation.threads)
+        process = await asyncio.create_subprocess_exec(
+            *self.build_command(source, output, offset, length, width, height, metrics, threads),
+            stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE,
+            preexec_fn=cpu_allocator.get_preexec_fn(allocation)
+        )
+        try:
+            _, stderr = await asyncio.wait_for(process.communicate(), timeout=self.timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            process.kill()
+            await process.wait()
+            raise
+        text = stderr.decode(errors='replace')
+        if process.returncode != 0:
+            lines = text.strip().splitlines()
+            raise Exception(f"Quality evaluation failed: {lines[-1] if lines else process.returncode}")
+        scores = self.parse_scores(text)
+        if not scores:
+            raise Exception("Quality evaluation produced no scores")
+        return scores
+
+    async def evaluate(self, source: str, output: str, duration: float, width: int, height: int,
+                       job_id: Optional[str] = None) -> Dict[str, Any]:
+        """Length-weighted mean scores over the compared segments, plus what was compared"""
+        started = time.monotonic()
+        metrics = await asyncio.to_thread(self.active_metrics)
+        segments = self.segments(duration)
+
+        totals: Dict[str, float] = {}
+        weights: Dict[str, float] = {}
+        process_id = f"{job_id or output}/quality"
+        allocation = cpu_allocator.allocate(process_id)
+        try:
+            for offset, length in segments:
+                scores = await self._score_segment(source, output, offset, length, width, height,
+                                                   metrics, allocation)
+                for metric, value in scores.items():
+                    totals[metric] = totals.get(metric, 0.0) + value * length
+                    weights[metric] = weights.get(metric, 0.0) + length
+        finally:
+            cpu_allocator.release(process_id)
+
+        result = {metric: round(totals[metric] / weights[metric], 4) for metric in totals}
+        result.update(
+            segments=len(segments),
+            sampled_seconds=round(sum(length for _, length in segments), 2),
+            eval_seconds=round(time.monotonic() - started, 2)
+        )
+        return result
+
+# Global instance
+quality_evaluator = QualityEvaluator.from_env()
+
+async def evaluate_quality(source: str, output: str, duration: float, width: int, height: int) -> Dict[str, Any]:
+    """Score an encode against its source"""
+    return await quality_evaluator.evaluate(source, output, duration, width, height)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Speed, size and quality trade-offs of past encodes, from the job archive.
+
+    python -m app.quality_report --metric ssim --limit 2000 --json report.json
+
+Completed jobs that were scored (QUALITY_EVAL_ENABLED) are grouped by encoder
+and resolution tier, then by the preset and CRF they used. Each setting is
+reported with its mean encode speed (media seconds per wall second), output
+bitrate and quality score. Settings that no other setting beats on all three
+at once are on the frontier and marked with '*'.
+"""
+
+import sys
+import json
+import argparse
+from typing import Dict, List, Optional, Any, Tuple
+
+from dotenv import load_dotenv
+
+
+def collect_points(records, metric: str) -> Dict[Tuple[str, str], List[Dict[str, Any]]]:
+    """(encoder, tier) -> per-setting means over the scored completed records"""
+    # Import here to avoid circular imports
+    from .forecast import resolution_tier
+    from .queue_manager import JobStatus
+
+    samples: Dict[Tuple[str, str], Dict[Tuple[Any, Any], List[Tuple[float, float, float]]]] = {}
+    for record in records:
+        quality = record.quality or {}
+        score = quality.get(metric)
+        encode_seconds = dict(record.stage_seconds or ()).get('encode')
+        if (record.status != JobStatus.COMPLETED or score is None or not encode_seconds
+                or not record.media_duration or not record.file_size_after):
+            continue
+        group = (record.encoder or record.codec, resolution_tier(record.width, record.height) or 'unknown')
+        setting = (quality.get('preset'), quality.get('crf'))
+        samples.setdefault(group, {}).setdefault(setting, []).append((
+            record.media_duration / encode_seconds,
+            record.file_size_after * 8 / record.media_duration / 1000,
+            score
+        ))
+
+    groups = {}
+    for group, settings in samples.items():
+        points = []
+        for (preset, crf), values in settings.items():
+            count = len(values)
+            points.append({
+                'preset': preset,
+                'crf': crf,
+                'jobs': count,
+                'speed': round(sum(v[0] for v in values) / count, 3),
+                'bitrate_kbps': round(sum(v[1] for v in values) / count, 1),
+                'quality': round(sum(v[2] for v in values) / count, 4)
+            })
+        mark_frontier(points)
+        groups[group] = sorted(points, key=lambda p: (-p['quality'], p['bitrate_kbps']))
+    return groups
+
+
+def mark_frontier(points: List[Dict[str, Any]]):
+    """Flag points no other point matches or beats on speed, size and quality at once"""
+    def dominates(a, b):
+        no_worse = a['speed'] >= b['speed'] and a['bitrate_kbps'] <= b['bitrate_kbps'] and a['quality'] >= b['quality']
+        better = a['speed'] > b['speed'] or a['bitrate_kbps'] < b['bitrate_kbps'] or a['quality'] > b['quality']
+        return no_worse and better
+
+    for point in points:
+        point['frontier'] = not any(dominates(other, point) for other in points if other is not point)
+
+
+def print_report(groups: Dict[Tuple[str, str], List[Dict[str, Any]]], metric: str):
+    if not groups:
+        print("No scored completed jobs in the archive; set QUALITY_EVAL_ENABLED=true to collect them")
+        return
+    for (encoder, tier), points in sorted(groups.items()):
+        print(f"\n{encoder} @ {tier}")
+        print(f"  {'':1} {'preset':<10} {'crf':>4} {'jobs':>5} {'speed':>8} {'kbps':>9} {metric:>8}")
+        for p in points:
+            print(f"  {'*' if p['frontier'] else '':1} {str(p['preset'] or '-'):<10} {str(p['crf'] or '-'):>4} "
+                  f"{p['jobs']:>5} {p['speed']:>7.2f}x {p['bitrate_kbps']:>9.0f} {p['quality']:>8.3f}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Speed/size/quality frontiers per encoder and resolution tier")
+    parser.add_argument('--metric', choices=('vmaf', 'ssim', 'psnr'),
+                        help="Quality score to compare (default: VMAF when any job has it, else SSIM)")
+    parser.add_argument('--limit', type=int, default=5000, help="Newest archived jobs to read")
+    parser.add_argument('--json', help="Also write the report to this file")
+    args = parser.parse_args(argv)
+
+    # The archive location comes from the environment
+    load_dotenv()
+    from .job_history import JobHistory
+
+    records = JobHistory.from_env().query(limit=args.limit)
+    metric = args.metric or ('vmaf' if any((r.quality or {}).get('vmaf') for r in records) else 'ssim')
+    groups = collect_points(records, metric)
+    print_report(groups, metric)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump([
+                {'encoder': encoder, 'tier': tier, 'metric': metric, 'points': points}
+                for (encoder, tier), points in sorted(groups.items())
+            ], f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,6 +2,7 @@ import asyncio
 import json
 import logging
 import os
+import signal
 import threading
 import time
 from datetime import datetime
@@ -9,8 +10,20 @@ from enum import Enum
 from typing import Dict, List, Optional, Any, Callable
 from dataclasses import dataclass, asdict
 import uuid
+from collections import deque
 
-from .ffmpeg_worker import ffmpeg_worker
+from .ffmpeg_worker import ffmpeg_worker, FFMPEG_LOG_LINES
+from .forecast import QueueForecaster, FORECAST_SEED_JOBS
+from .job_history import JobHistory, JobRecord
+from .quality import quality_evaluator
+from .sidecars import sidecar_generator
+from .concurrency import concurrency_controller
+from .log_config import current_job_id
+from .cancellation import CancelToken, JobCancelled, current_cancel_token
+from .destinations import upload_destinations
+from .staging import staging_manager, estimate_output_size, staged_name, is_staged_name
+from .transfer_scheduler import transfer_scheduler
+from .watchdog import stall_watchdog
 
 logger = logging.getLogger(__name__)
 
@@ -36,23 +49,91 @@ class EncodingJob:
     file_size_before: Optional[int] = None
     file_size_after: Optional[int] = None
     remote_path: Optional[str] = None  # Store the original remote path for download
+    source_size: Optional[int] = None  # Size from the storage listing, used for staging admission
+    staging_volume: Optional[str] = None
+    target_size: Optional[int] = None  # Target output size in bytes (size-targeted mode)
+    target_bitrate: Optional[int] = None  # Target total bitrate in bps (size-targeted mode)
+    rate_control: Optional[Dict[str, Any]] = None  # Settings predicted from sample encodes
+    stage_attempts: Dict[str, int] = None  # Attempts per stage when the watchdog had to retry
+    checkpoints: List[str] = None  # Completed stages: 'downloaded', 'encoded', 'uploaded'
+    upload_path: Optional[str] = None
+    expected_source_sha256: Optional[str] = None  # Checksum reported by the storage listing
+    source_sha256: Optional[str] = None  # Computed while downloading
+    output_sha256: Optional[str] = None  # Computed while uploading
+    duplicate_of: Optional[str] = None  # Completed job with the same source and settings
+    stage_timings: Dict[str, List[float]] = None  # stage -> [start, end] epoch seconds of the last run
+    encoder: Optional[str] = None  # FFmpeg encoder that ran (or will run) the encode
+    media_duration: Optional[float] = None  # Probed before admission, or once the source is local
+    width: Optional[int] = None
+    height: Optional[int] = None
+    source_codecs: Optional[str] = None  # e.g. 'h264+aac', from the pre-flight probe
+    ffmpeg_log: deque = None  # Last diagnostic lines FFmpeg wrote to stderr
+    keep_source: bool = False  # The input is a caller's local file, never deleted by the queue
+    transfer_stats: Dict[str, Dict[str, Any]] = None  # stage -> bytes, seconds, mbps of its last attempt
+    destinations: Dict[str, Dict[str, Any]] = None  # destination -> path, status, attempts, error
+    encode_pid: Optional[int] = None  # Encode handed over by the previous process, to be re-attached
+    priority: int = 0  # Higher starts first; equal priorities keep submission order
+    quality: Optional[Dict[str, Any]] = None  # SSIM/PSNR/VMAF against the source, with the settings scored
+    cancel_token: Optional[CancelToken] = None  # Set by cancel_job; every stage and transfer thread checks it
+    sidecars: Optional[Dict[str, Any]] = None  # Poster, sprites and index made by the encode, and where they went
     
     def __post_init__(self):
         if self.progress is None:
             self.progress = {}
+        if self.stage_attempts is None:
+            self.stage_attempts = {}
+        if self.checkpoints is None:
+            self.checkpoints = []
+        if self.stage_timings is None:
+            self.stage_timings = {}
+        if self.transfer_stats is None:
+            self.transfer_stats = {}
+        if self.destinations is None:
+            self.destinations = {}
+        if self.ffmpeg_log is None:
+            self.ffmpeg_log = deque(maxlen=FFMPEG_LOG_LINES)
+        if self.cancel_token is None:
+            self.cancel_token = CancelToken()
 
 class JobQueue:
-    def __init__(self, max_concurrent_jobs: int = 1):
-        self.jobs: Dict[str, EncodingJob] = {}
+    def __init__(self, max_concurrent_jobs: int = 1, history: Optional[JobHistory] = None):
+        self.jobs: Dict[str, EncodingJob] = {}  # Pending and running jobs only
+        self.history = history or JobHistory.from_env()  # Finished jobs
         self.pending_jobs: List[str] = []
         self.running_jobs: List[str] = []
+        self.evaluating: set = set()  # Running jobs only waiting on quality scores (they free their slot)
         self.max_concurrent_jobs = max_concurrent_jobs
         self.is_processing = False
+        self.draining = False  # No new jobs start; running ones finish or reach a handover point
+        self.handing_over = False  # Cancelled tasks leave their jobs and files for the next process
+        self.state_path = os.getenv("QUEUE_STATE_PATH", "logs/queue_state.json")
         self.worker_thread = None
+        self.encode_timeout = float(os.getenv("ENCODE_TIMEOUT_SECONDS", "0")) or None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._wake: Optional[asyncio.Event] = None  # Set to look for work before the next poll
         self._lock = threading.Lock()
+        self.forecaster = QueueForecaster()
+        self._seed_forecast()
         
-    def add_job(self, input_file: str, output_file: str, codec: str) -> str:
-        """Add a new encoding job to the queue"""
+    def _seed_forecast(self):
+        """Warm the throughput model from the most recent archived jobs, oldest first"""
+        try:
+            records = self.history.query(limit=FORECAST_SEED_JOBS)
+        except Exception as e:
+            logger.warning(f"Could not seed throughput model from the job archive: {e}")
+            return
+        for record in reversed(records):
+            if record.status == JobStatus.COMPLETED and not record.duplicate_of:
+                self.forecaster.model.observe(record)
+        
+    def add_job(self, input_file: str, output_file: str, codec: str,
+                remote_path: Optional[str] = None, source_size: Optional[int] = None,
+                target_size: Optional[int] = None, target_bitrate: Optional[int] = None,
+                source_checksum: Optional[str] = None, upload_path: Optional[str] = None,
+                keep_source: bool = False, media_info: Optional[Dict[str, Any]] = None,
+                priority: int = 0) -> str:
+        """Add a new encoding job to the queue; `media_info` is what a pre-flight probe found"""
         job_id = str(uuid.uuid4())
         
         # Get input file size
@@ -70,12 +151,25 @@ class JobQueue:
             codec=codec,
             status=JobStatus.PENDING,
             created_at=datetime.now(),
-            file_size_before=file_size
+            file_size_before=file_size,
+            remote_path=remote_path,
+            source_size=source_size if source_size is not None else file_size,
+            target_size=target_size,
+            target_bitrate=target_bitrate,
+            expected_source_sha256=source_checksum,
+            upload_path=upload_path,
+            keep_source=keep_source,
+            priority=priority
         )
+        if media_info:
+            job.media_duration = media_info.get('duration')
+            job.width = media_info.get('width')
+            job.height = media_info.get('height')
+            job.source_codecs = media_info.get('codecs')
         
         with self._lock:
             self.jobs[job_id] = job
-            self.pending_jobs.append(job_id)
+            self._enqueue(job)
         
         logger.info(f"Added job {job_id} to queue: {input_file} -> {output_file}")
         
@@ -85,31 +179,69 @@ class JobQueue:
         
         return job_id
     
-    def get_job(self, job_id: str) -> Optional[EncodingJob]:
-        """Get job by ID"""
-        return self.jobs.get(job_id)
+    def _enqueue(self, job: EncodingJob):
+        """Insert a job into the pending list behind every job of equal or higher priority (caller holds the lock)"""
+        index = next(
+            (i for i, other in enumerate(self.pending_jobs) if self.jobs[other].priority < job.priority),
+            len(self.pending_jobs)
+        )
+        self.pending_jobs.insert(index, job.id)
+    
+    @property
+    def job_slots(self) -> int:
+        """Jobs that may run at once: fixed, or sized by the concurrency controller"""
+        return concurrency_controller.job_limit() if concurrency_controller.enabled else self.max_concurrent_jobs
+    
+    def get_job(self, job_id: str):
+        """Get an active EncodingJob, or the JobRecord of a finished one, by ID"""
+        return self.jobs.get(job_id) or self.history.get(job_id)
     
     def get_all_jobs(self) -> List[EncodingJob]:
-        """Get all jobs ordered by creation time"""
-        return sorted(self.jobs.values(), key=lambda x: x.created_at, reverse=True)
+        """Get active jobs ordered by creation time"""
+        return sorted(list(self.jobs.values()), key=lambda x: x.created_at, reverse=True)
     
     def get_queue_status(self) -> Dict[str, Any]:
         """Get current queue status"""
         with self._lock:
             pending_count = len(self.pending_jobs)
             running_count = len(self.running_jobs)
-            completed_count = len([j for j in self.jobs.values() if j.status == JobStatus.COMPLETED])
-            failed_count = len([j for j in self.jobs.values() if j.status == JobStatus.FAILED])
+            active_count = len(self.jobs)
+        counts, archived_count = self.history.get_counts()
+        forecast = self.get_forecast()
             
         return {
             'pending': pending_count,
             'running': running_count,
-            'completed': completed_count,
-            'failed': failed_count,
-            'total': len(self.jobs),
-            'is_processing': self.is_processing
+            'completed': counts[JobStatus.COMPLETED],
+            'failed': counts[JobStatus.FAILED],
+            'cancelled': counts[JobStatus.CANCELLED],
+            'total': active_count + sum(counts.values()),
+            'archived': archived_count,
+            'is_processing': self.is_processing,
+            'draining': self.draining,
+            'job_slots': self.job_slots,
+            'forecast': {key: forecast[key] for key in ('backlog_seconds', 'completion_at', 'jobs_per_hour')}
         }
     
+    def get_forecast(self) -> Dict[str, Any]:
+        """Per-job ETA and predicted output size, plus when the whole backlog should be done"""
+        with self._lock:
+            running = [self.jobs[job_id] for job_id in self.running_jobs if job_id in self.jobs]
+            pending = [self.jobs[job_id] for job_id in self.pending_jobs if job_id in self.jobs]
+        return self.forecaster.forecast(
+            running, pending, self.job_slots,
+            lambda job: job.encoder or ffmpeg_worker.predict_video_encoder(job.codec)
+        )
+    
+    def _retire(self, job: EncodingJob):
+        """Move a finished job out of the active set into the compact history (caller holds the lock)"""
+        self.jobs.pop(job.id, None)
+        if job.status == JobStatus.COMPLETED and not job.duplicate_of:
+            self.forecaster.model.observe(JobRecord.from_job(job))
+        for evicted_id in self.history.add(job):
+            # Jobs outside the window can still be retried from the archive, but from scratch
+            staging_manager.discard_retained(evicted_id)
+    
     def cancel_job(self, job_id: str) -> bool:
         """Cancel a job"""
         job = self.jobs.get(job_id)
@@ -123,46 +255,52 @@ class JobQueue:
                     self.pending_jobs.remove(job_id)
                 job.status = JobStatus.CANCELLED
                 job.completed_at = datetime.now()
+                self._retire(job)
                 logger.info(f"Cancelled pending job {job_id}")
                 return True
             elif job.status == JobStatus.RUNNING:
-                # Stop the running encoding
-                if job_id in self.running_jobs:
-                    success, message = ffmpeg_worker.stop_encoding()
-                    if success:
-                        job.status = JobStatus.CANCELLED
-                        job.completed_at = datetime.now()
-                        job.error_message = "Cancelled by user"
+                # Signal the token (transfer threads drop their sockets and child
+                # processes are told to stop) and cancel the job's task, which
+                # stops the encoder and cleans up without this call waiting for it
+                task = self._tasks.get(job_id)
+                if task and self._loop:
+                    job.status = JobStatus.CANCELLED
+                    job.completed_at = datetime.now()
+                    job.error_message = "Cancelled by user"
+                    job.cancel_token.cancel(job.error_message)
+                    self._loop.call_soon_threadsafe(task.cancel)
+                    # The slot is free for the next job now; staging space is
+                    # released once the task has removed the files
+                    if job_id in self.running_jobs:
                         self.running_jobs.remove(job_id)
-                        logger.info(f"Cancelled running job {job_id}")
-                        return True
-                    else:
-                        logger.error(f"Failed to cancel running job {job_id}: {message}")
-                        return False
+                    self.evaluating.discard(job_id)
+                    self._loop.call_soon_threadsafe(self._wake.set)
+                    logger.info(f"Cancelled running job {job_id}")
+                    return True
+                logger.error(f"Failed to cancel running job {job_id}: no running task")
+                return False
         
         return False
     
     def clear_completed_jobs(self) -> int:
-        """Clear all completed and failed jobs"""
+        """Clear all completed and failed jobs from view (they stay in the archive)"""
         with self._lock:
-            completed_job_ids = [
-                job_id for job_id, job in self.jobs.items() 
-                if job.status in [JobStatus.COMPLETED, JobStatus.FAILED, JobStatus.CANCELLED]
-            ]
+            completed_job_ids = self.history.clear()
             
             for job_id in completed_job_ids:
-                del self.jobs[job_id]
+                # Cleared jobs are only retried from scratch, so drop their artifacts
+                staging_manager.discard_retained(job_id)
             
             logger.info(f"Cleared {len(completed_job_ids)} completed jobs")
             return len(completed_job_ids)
     
     def start_processing(self):
-        """Start the job processing worker thread"""
+        """Start the job processing event loop in a worker thread"""
         if self.is_processing:
             return
         
         self.is_processing = True
-        self.worker_thread = threading.Thread(target=self._process_jobs, daemon=True)
+        self.worker_thread = threading.Thread(target=self._run_loop, daemon=True)
         self.worker_thread.start()
         logger.info("Started job queue processing")
     
@@ -172,40 +310,227 @@ class JobQueue:
         
         # Cancel any running jobs
         with self._lock:
-            for job_id in self.running_jobs.copy():
-                self.cancel_job(job_id)
+            running_job_ids = self.running_jobs.copy()
+        for job_id in running_job_ids:
+            self.cancel_job(job_id)
         
         logger.info("Stopped job queue processing")
     
-    def _process_jobs(self):
+    def _ready_for_handover(self, job: EncodingJob) -> bool:
+        """Whether a running job can be handed over without losing work: its encode runs detached"""
+        if job.progress.get('stage') == 'waiting':
+            return True  # Queued for a stage slot, nothing in flight
+        process = ffmpeg_worker.processes.get(job.id)
+        return ffmpeg_worker.handover_encodes and process is not None and process.returncode is None
+    
+    def drain(self, timeout: float = 0) -> bool:
+        """Stop admitting jobs and wait up to `timeout` seconds for running ones to finish or reach
+        a handover point; downloads and uploads run to completion. Returns whether the queue is ready
+        """
+        if not self.draining:
+            self.draining = True
+            logger.info("Draining job queue: no new jobs will start")
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                busy = [job_id for job_id in self.running_jobs if not self._ready_for_handover(self.jobs[job_id])]
+            if not busy or time.monotonic() >= deadline:
+                return not busy
+            time.sleep(1)
+    
+    def resume(self):
+        """Leave drain mode"""
+        self.draining = False
+        logger.info("Resumed admitting jobs")
+    
+    def handover(self, keep_encodes: bool = True) -> int:
+        """Save pending and running jobs for the next process and stop without cleaning up
+        
+        With `keep_encodes` (a reload) running encodes are left running, unless
+        HANDOVER_ENCODES is off, and re-attached by restore_state(); otherwise
+        they are stopped. Every other job resumes from its last checkpoint.
+        Returns the number of jobs saved.
+        """
+        self.draining = True
+        self.handing_over = True
+        ffmpeg_worker.handover = keep_encodes and ffmpeg_worker.handover_encodes
+        with self._lock:
+            entries = []
+            for job_id in self.running_jobs + self.pending_jobs:
+                job = self.jobs[job_id]
+                process = ffmpeg_worker.processes.get(job_id)
+                entries.append({
+                    'job': JobRecord.from_job(job).to_archive(),
+                    'rate_control': job.rate_control,
+                    'stage_attempts': job.stage_attempts,
+                    'encode_pid': process.pid if process is not None and ffmpeg_worker.handover else None
+                })
+        
+        if entries:
+            os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+            temp_path = self.state_path + '.tmp'
+            with open(temp_path, 'w') as f:
+                json.dump({'saved_at': time.time(), 'jobs': entries}, f)
+            os.replace(temp_path, self.state_path)
+        
+        # Cancel the tasks directly: cancel_job() would mark the jobs cancelled
+        self.is_processing = False
+        with self._lock:
+            tasks = list(self._tasks.values())
+        if self._loop:
+            for task in tasks:
+                self._loop.call_soon_threadsafe(task.cancel)
+        if self.worker_thread:
+            self.worker_thread.join(timeout=30)
+        logger.info(f"Handed over {len(entries)} job(s), "
+                    f"{sum(1 for e in entries if e['encode_pid'])} with a running encode, to {self.state_path}")
+        return len(entries)
+    
+    def restore_state(self) -> List[str]:
+        """Re-queue jobs a previous process handed over, running ones first
+        
+        Stray encoders writing into staging that were not handed over (e.g.
+        after a crash) are stopped. Returns the staged paths the restored jobs
+        still own, for the orphan sweep to keep.
+        """
+        entries = []
+        if os.path.exists(self.state_path):
+            try:
+                with open(self.state_path) as f:
+                    entries = json.load(f).get('jobs', [])
+            except (OSError, ValueError) as e:
+                logger.error(f"Could not read queue state {self.state_path}: {e}")
+            os.remove(self.state_path)
+        
+        keep = []
+        adopted = set()
+        with self._lock:
+            for entry in entries:
+                record = JobRecord.from_archive(entry['job'])
+                if record.id in self.jobs or self.history.get(record.id):
+                    continue
+                job = record.to_job()
+                job.status = JobStatus.PENDING
+                job.rate_control = entry.get('rate_control')
+                job.stage_attempts = entry.get('stage_attempts') or {}
+                if entry.get('encode_pid') and ffmpeg_worker.is_encoder_process(entry['encode_pid'], job.output_file):
+                    job.encode_pid = entry['encode_pid']
+                    adopted.add(job.encode_pid)
+                if 'downloaded' in job.checkpoints:
+                    keep.append(job.input_file)
+                if 'encoded' in job.checkpoints or job.encode_pid:
+                    keep.extend([job.output_file, ffmpeg_worker.log_path(job.output_file)])
+                    keep.extend(sidecar_generator.local_files(job.output_file))
+                self.jobs[job.id] = job
+                self.pending_jobs.append(job.id)
+        
+        output_dirs = [volume.output_dir for volume in staging_manager.volumes]
+        for pid, output_file in ffmpeg_worker.find_encoder_processes(output_dirs).items():
+            if pid not in adopted and is_staged_name(output_file):
+                logger.warning(f"Stopping stray FFmpeg process {pid} writing {output_file}")
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except OSError:
+                    pass
+        
+        if entries:
+            logger.info(f"Restored {len(self.pending_jobs)} job(s) from {self.state_path}, "
+                        f"re-attaching {len(adopted)} running encode(s)")
+            self.start_processing()
+        return keep
+    
+    def _run_loop(self):
+        """Worker thread entry point: one event loop supervises every running job"""
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._process_jobs())
+        finally:
+            self._loop.close()
+            self._loop = None
+    
+    async def _process_jobs(self):
         """Main job processing loop"""
+        self._wake = asyncio.Event()
+        concurrency_controller.bind()
+        controller = asyncio.create_task(concurrency_controller.run()) if concurrency_controller.enabled else None
         while self.is_processing:
             try:
-                # Check if we can start a new job
-                with self._lock:
-                    can_start_job = (
-                        len(self.running_jobs) < self.max_concurrent_jobs and 
-                        len(self.pending_jobs) > 0
-                    )
+                # Start as many jobs as there are free slots
+                while True:
+                    with self._lock:
+                        job = None
+                        busy = len(self.running_jobs) - len(self.evaluating)
+                        if not self.draining and busy < self.job_slots:
+                            job = self._admit_next_job()
+                        if job is None:
+                            break
+                        self.pending_jobs.remove(job.id)
+                        self.running_jobs.append(job.id)
                     
-                    if can_start_job:
-                        job_id = self.pending_jobs.pop(0)
-                        self.running_jobs.append(job_id)
-                        job = self.jobs[job_id]
+                    self._tasks[job.id] = asyncio.create_task(self._execute_job(job))
                 
-                if can_start_job:
-                    self._execute_job(job)
-                else:
-                    # No jobs to process, sleep briefly
-                    time.sleep(1)
+                # Sleep briefly before looking for more work (or until a slot is freed)
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=1)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
                     
             except Exception as e:
                 logger.error(f"Error in job processing loop: {e}")
-                time.sleep(5)  # Wait before retrying
+                await asyncio.sleep(5)  # Wait before retrying
+        
+        if controller:
+            controller.cancel()
+        # Let cancelled jobs finish their cleanup before the loop closes
+        if self._tasks:
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+    
+    def _admit_next_job(self) -> Optional[EncodingJob]:
+        """Pick the first pending job that fits in staging space (caller holds the lock)"""
+        for job_id in list(self.pending_jobs):
+            job = self.jobs[job_id]
+            # Local inputs are already on disk, so only the output needs room
+            source_bytes = 0 if os.path.exists(job.input_file) else job.source_size
+            output_bytes = self._estimate_output_bytes(job)
+
+            if not staging_manager.can_ever_fit(source_bytes, output_bytes):
+                self.pending_jobs.remove(job_id)
+                job.status = JobStatus.FAILED
+                job.error_message = "Not enough staging space on any volume for this file"
+                job.completed_at = datetime.now()
+                self._retire(job)
+                logger.error(f"Job {job_id} rejected: {job.error_message}")
+                continue
+
+            reservation = staging_manager.reserve(job_id, source_bytes, output_bytes)
+            if reservation:
+                job.staging_volume = reservation.volume.root
+                return job
+
+        return None
+
+    @staticmethod
+    def _estimate_output_bytes(job: EncodingJob) -> Optional[int]:
+        """Staging to reserve for the output: its bitrate cap x duration once pre-flight probed it"""
+        if job.target_size:
+            return estimate_output_size(job.target_size)
+        max_bitrate = job.target_bitrate
+        if not max_bitrate and job.width and job.height:
+            max_bitrate = ffmpeg_worker.get_optimized_settings(job.width, job.height)['max_bitrate']
+        if not job.media_duration and job.source_size is None:
+            # Nothing to go on: the staging manager falls back to its default source size
+            return None
+        return estimate_output_size(job.source_size, job.media_duration, max_bitrate)
     
-    def _execute_job(self, job: EncodingJob):
+    async def _execute_job(self, job: EncodingJob):
         """Execute a single encoding job with download/encode/upload workflow"""
+        # Every record logged by this task (and its transfer threads) carries the job ID
+        current_job_id.set(job.id)
+        current_cancel_token.set(job.cancel_token)
         logger.info(f"Starting job {job.id}: {job.input_file}")
+        evaluation = None
         
         try:
             # Update job status
@@ -213,17 +538,35 @@ class JobQueue:
             job.started_at = datetime.now()
             
             # Import here to avoid circular imports
-            from .bunny_client import download_file, upload_file
+            from .bunny_client import download_file, file_sha256
             
-            # Extract filename and create paths
-            filename = os.path.basename(job.input_file)
-            input_path = job.input_file  # This should be the local path
+            # Extract filename and create paths (from the remote path, since retried jobs
+            # already point at their staged, job-id-prefixed files)
+            filename = os.path.basename(job.remote_path or job.input_file)
             output_filename = f"{filename.rsplit('.', 1)[0]}.mp4"
+            if not job.upload_path:
+                job.upload_path = f"encoded/{output_filename}"
+            
+            # Drop checkpoints whose artifacts were garbage-collected since the last attempt
+            self._validate_checkpoints(job)
+            
+            # Stage downloads and outputs on the volume reserved at admission,
+            # prefixed with the job id so concurrent jobs never collide
+            reservation = staging_manager.reservations.get(job.id)
+            if reservation:
+                if not os.path.exists(job.input_file):
+                    job.input_file = os.path.join(reservation.volume.input_dir, staged_name(job.id, filename))
+                    staging_manager.track_paths(job.id, job.input_file)
+                if 'encoded' not in job.checkpoints and not job.encode_pid:
+                    job.output_file = os.path.join(reservation.volume.output_dir, staged_name(job.id, output_filename))
+                    staging_manager.track_paths(job.id, job.output_file)
+            
+            input_path = job.input_file  # This should be the local path
             output_path = job.output_file
             
             # Create directories if they don't exist
-            os.makedirs("./input", exist_ok=True)
-            os.makedirs("./output", exist_ok=True)
+            os.makedirs(os.path.dirname(input_path) or ".", exist_ok=True)
+            os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
             
             # Step 1: Download (if input_path doesn't exist locally)
             if not os.path.exists(input_path):
@@ -235,23 +578,119 @@ class JobQueue:
                     # Fallback: try to derive from input_file path
                     remote_path = job.input_file.replace("./input/", "")
                 
-                logger.info(f"Downloading {remote_path} to {input_path}")
-                download_file(remote_path, input_path)
+                async with concurrency_controller.slot('download', job):
+                    logger.info(f"Downloading {remote_path} to {input_path}")
+                    job.source_sha256 = await self._run_transfer(
+                        job, 'download', download_file, remote_path, input_path,
+                        total_bytes=job.source_size, expected_sha256=job.expected_source_sha256
+                    )
+                
+                # The same source was already encoded and uploaded with the same settings
+                duplicate = self._find_duplicate(job)
+                if duplicate:
+                    job.duplicate_of = duplicate.id
+                    job.output_sha256 = duplicate.output_sha256
+                    job.file_size_after = duplicate.file_size_after
+                    job.sidecars = duplicate.sidecars
+                    self._cleanup_files(self._staged_source(job))
+                    job.completed_at = datetime.now()
+                    job.status = JobStatus.COMPLETED
+                    logger.info(f"Job {job.id} is a duplicate of {duplicate.id}, skipping encode and upload")
+                    return
             
-            # Create progress callback
-            def progress_callback(progress_data):
-                job.progress = progress_data
+            if 'downloaded' not in job.checkpoints:
+                if job.source_size and os.path.getsize(input_path) != job.source_size:
+                    raise Exception(
+                        f"Source size mismatch: expected {job.source_size} bytes, "
+                        f"got {os.path.getsize(input_path)}"
+                    )
+                job.checkpoints.append('downloaded')
             
-            # Step 2: Run the encoding
-            success, message = ffmpeg_worker.run_ffmpeg(
-                input_path, 
-                output_path, 
-                job.codec,
-                progress_callback
-            )
+            # Duration and resolution drive the forecast and the encoder preset
+            if 'encoded' not in job.checkpoints and job.media_duration is None:
+                info = await ffmpeg_worker.probe_video_async(input_path)
+                job.media_duration, job.width, job.height = info['duration'], info['width'], info['height']
             
-            if not success:
-                raise Exception(f"Encoding failed: {message}")
+            if 'encoded' in job.checkpoints:
+                logger.info(f"Job {job.id}: reusing validated output {output_path}")
+            else:
+                # Adopted encodes are already running, so they take their slot without waiting
+                async with concurrency_controller.slot('encode', job, wait=not job.encode_pid):
+                    # Size-targeted mode: predict rate control from a few sample encodes
+                    if (job.target_size or job.target_bitrate) and not job.rate_control:
+                        job.progress = {'stage': 'sampling'}
+                        sampling_started = time.time()
+                        job.rate_control = await asyncio.to_thread(
+                            ffmpeg_worker.predict_target_settings,
+                            input_path, job.codec, job.target_size, job.target_bitrate,
+                            {'width': job.width, 'height': job.height, 'duration': job.media_duration},
+                            job.id
+                        )
+                        job.stage_timings['sampling'] = [sampling_started, time.time()]
+                
+                    # Step 2: Run the encoding, restarting it if the output time stops advancing
+                    async def encode_attempt(tracker):
+                        def progress_callback(progress_data):
+                            job.progress = progress_data
+                            seconds = ffmpeg_worker.time_to_seconds(progress_data.get('time', ''))
+                            if seconds:
+                                tracker.update(seconds)
+                    
+                        # Re-attach to the encode the previous process handed over, once
+                        if job.encode_pid:
+                            pid, job.encode_pid = job.encode_pid, None
+                            _, message = await ffmpeg_worker.adopt_ffmpeg_async(
+                                pid, output_path, job.codec, progress_callback,
+                                job_id=job.id, timeout=self.encode_timeout,
+                                total_duration=job.media_duration, stderr_tail=job.ffmpeg_log
+                            )
+                            # An encode that finished during the restart is as good as one we watched
+                            valid, reason = await ffmpeg_worker.validate_output_async(input_path, output_path)
+                            if valid:
+                                return
+                            logger.warning(f"Job {job.id}: handed-over encode is unusable ({message}; {reason}), encoding again")
+                    
+                        success, message = await ffmpeg_worker.run_ffmpeg_async(
+                            input_path, 
+                            output_path, 
+                            job.codec,
+                            progress_callback,
+                            job.rate_control,
+                            job_id=job.id,
+                            timeout=self.encode_timeout,
+                            media_info={'width': job.width, 'height': job.height, 'duration': job.media_duration},
+                            stderr_tail=job.ffmpeg_log,
+                            sidecars=sidecar_generator.enabled
+                        )
+                    
+                        if not success:
+                            raise Exception(f"Encoding failed: {message}")
+                
+                    job.encoder = ffmpeg_worker.get_backend(job.codec).name
+                
+                    # Encoder errors are deterministic, so only stalls are retried
+                    encode_started = time.time()
+                    try:
+                        await stall_watchdog.run_stage(job.id, 'encode', encode_attempt, retry_on_error=False,
+                                                       on_retry=self._retry_callback(job, 'encode'))
+                    finally:
+                        job.stage_timings['encode'] = [encode_started, time.time()]
+                
+                    valid, message = await ffmpeg_worker.validate_output_async(input_path, output_path)
+                    if not valid:
+                        raise Exception(f"Encoded output failed validation: {message}")
+                    job.checkpoints.append('encoded')
+                    
+                    # Hashed while the output is still in the page cache, so the first
+                    # upload already carries a checksum storage verifies
+                    job.output_sha256 = await asyncio.to_thread(file_sha256, output_path)
+                
+                    if sidecar_generator.enabled:
+                        job.sidecars = await self._finish_sidecars(job, output_path)
+                
+                    # Score the encode against the source while the output uploads
+                    if quality_evaluator.enabled and job.width and job.height and job.media_duration:
+                        evaluation = asyncio.create_task(self._evaluate_quality(job, input_path, output_path))
             
             # Calculate compression statistics
             if os.path.exists(input_path) and os.path.exists(output_path):
@@ -260,121 +699,307 @@ class JobQueue:
                 job.file_size_before = original_size
                 job.file_size_after = compressed_size
             
-            # Step 3: Upload the encoded file
-            upload_path = f"encoded/{output_filename}"
-            logger.info(f"Uploading {output_path} to {upload_path}")
-            upload_file(output_path, upload_path)
+            # Step 3: Upload the encoded file to every destination zone (a retry skips finished ones)
+            if not job.destinations:
+                job.destinations = upload_destinations.plan(job)
+            async with concurrency_controller.slot('upload', job):
+                logger.info(f"Uploading {output_path} to {', '.join(d['path'] for d in job.destinations.values())}")
+                job.output_sha256 = await self._run_transfer(
+                    job, 'upload', upload_destinations.upload, output_path, job.destinations,
+                    total_bytes=os.path.getsize(output_path), checksum=job.output_sha256
+                )
+                if job.sidecars and job.sidecars.get('files') and not job.sidecars.get('uploaded'):
+                    files = {name: sidecar_generator.local_path(output_path, name) for name in job.sidecars['files']}
+                    job.sidecars['uploaded'] = await self._run_transfer(
+                        job, 'sidecars', upload_destinations.upload_sidecars, files, job.destinations,
+                        total_bytes=sum(os.path.getsize(p) for p in files.values()) * len(job.destinations),
+                        direction='upload'
+                    )
+            job.checkpoints.append('uploaded')
+            
+            # Only the evaluation is left: it no longer counts against the job
+            # slots, so the next job's encode runs alongside it
+            if evaluation:
+                with self._lock:
+                    self.evaluating.add(job.id)
+                job.progress = {'stage': 'evaluating'}
+                await evaluation
             
             # Step 4: Cleanup local files
-            try:
-                if os.path.exists(input_path):
-                    os.remove(input_path)
-                if os.path.exists(output_path):
-                    os.remove(output_path)
-            except Exception as cleanup_error:
-                logger.warning(f"Cleanup warning: {cleanup_error}")
+            self._cleanup_files(self._staged_source(job), output_path, *sidecar_generator.local_files(output_path))
             
             # Update job status
             job.completed_at = datetime.now()
             job.status = JobStatus.COMPLETED
             logger.info(f"Job {job.id} completed successfully")
                 
+        except (asyncio.CancelledError, JobCancelled):
+            if self.handing_over and not job.cancel_token.cancelled:
+                # The next process resumes the job from the state file, keeping its files
+                logger.info(f"Job {job.id} handed over to the next process")
+                return
+            job.status = JobStatus.CANCELLED
+            job.error_message = job.error_message or "Cancelled"
+            job.completed_at = job.completed_at or datetime.now()
+            logger.info(f"Job {job.id} cancelled")
+            job.checkpoints.clear()
+            self._cleanup_files(self._staged_source(job), job.output_file,
+                                *sidecar_generator.local_files(job.output_file))
+        
         except Exception as e:
             job.status = JobStatus.FAILED
             job.error_message = str(e)
             job.completed_at = datetime.now()
             logger.error(f"Job {job.id} failed with exception: {e}")
             
-            # Cleanup on failure
-            try:
-                for cleanup_file in [input_path, output_path]:
-                    if 'cleanup_file' in locals() and os.path.exists(cleanup_file):
-                        os.remove(cleanup_file)
-            except:
-                pass
+            # Keep checkpointed artifacts so a retry resumes at the failed stage;
+            # anything past the last checkpoint is incomplete and removed
+            retained = []
+            if 'downloaded' in job.checkpoints:
+                if not job.keep_source:
+                    retained.append(job.input_file)
+            else:
+                self._cleanup_files(self._staged_source(job))
+            if 'encoded' in job.checkpoints:
+                retained.append(job.output_file)
+                retained.extend(sidecar_generator.local_files(job.output_file))
+            else:
+                self._cleanup_files(job.output_file, *sidecar_generator.local_files(job.output_file))
+            if retained:
+                staging_manager.retain(job.id, retained)
         
         finally:
+            if evaluation and not evaluation.done():
+                evaluation.cancel()
             # Remove from running jobs
             with self._lock:
+                self.evaluating.discard(job.id)
                 if job.id in self.running_jobs:
                     self.running_jobs.remove(job.id)
+                # Jobs that finished while the state was being saved are archived, not resumed
+                if not self.handing_over or job.status in (JobStatus.COMPLETED, JobStatus.FAILED):
+                    self._retire(job)
+            self._tasks.pop(job.id, None)
+            staging_manager.release(job.id)
     
-    def get_job_logs(self, limit: int = 100) -> List[Dict[str, Any]]:
-        """Get job logs for display"""
-        jobs = self.get_all_jobs()[:limit]
+    @staticmethod
+    async def _evaluate_quality(job: EncodingJob, input_path: str, output_path: str):
+        """Store quality scores and the settings they describe on the job; failures only log"""
+        settings = job.rate_control or ffmpeg_worker.get_optimized_settings(job.width, job.height)
+        try:
+            scores = await quality_evaluator.evaluate(
+                input_path, output_path, job.media_duration, job.width, job.height, job.id
+            )
+        except Exception as e:
+            logger.warning(f"Job {job.id}: quality evaluation failed: {e}")
+            job.quality = {'error': str(e)}
+            return
+        job.quality = {**scores, 'preset': settings.get('preset'), 'crf': settings.get('crf')}
+        logger.info(f"Job {job.id} quality: " + ', '.join(
+            f"{metric.upper()} {scores[metric]}" for metric in ('vmaf', 'ssim', 'psnr') if metric in scores
+        ))
+    
+    @staticmethod
+    async def _finish_sidecars(job: EncodingJob, output_path: str) -> Dict[str, Any]:
+        """Index what the encode wrote besides the output; a failure only logs, the MP4 still ships"""
+        try:
+            sidecars = await sidecar_generator.finish(output_path, job.media_duration or 0.0,
+                                                      job.width or 1920, job.height or 1080)
+        except Exception as e:
+            logger.warning(f"Job {job.id}: sidecars unavailable: {e}")
+            return {'error': str(e)}
+        logger.info(f"Job {job.id}: {len(sidecars['files'])} sidecar file(s), "
+                    f"{sidecars['keyframes']} keyframes, {sidecars['scenes']} scene cuts")
+        return sidecars
+    
+    @staticmethod
+    def _validate_checkpoints(job: EncodingJob):
+        """Forget checkpoints whose files no longer exist"""
+        if 'downloaded' in job.checkpoints and not os.path.exists(job.input_file):
+            job.checkpoints.remove('downloaded')
+        if 'encoded' in job.checkpoints and not os.path.exists(job.output_file):
+            job.checkpoints.remove('encoded')
+    
+    def retry_job(self, job_id: str) -> bool:
+        """Re-queue a failed or cancelled job; it resumes after its last checkpoint"""
+        record = self.history.get(job_id)
+        if not record or job_id in self.jobs:
+            return False
         
-        logs = []
-        for job in jobs:
-            log_entry = {
-                'id': job.id,
-                'input_file': os.path.basename(job.input_file),
-                'output_file': os.path.basename(job.output_file),
-                'codec': job.codec,
-                'status': job.status.value,
-                'created_at': job.created_at.strftime("%Y-%m-%d %H:%M:%S"),
-                'progress': job.progress,
-                'error_message': job.error_message
-            }
-            
-            if job.started_at:
-                log_entry['started_at'] = job.started_at.strftime("%Y-%m-%d %H:%M:%S")
-            
-            if job.completed_at:
-                log_entry['completed_at'] = job.completed_at.strftime("%Y-%m-%d %H:%M:%S")
-                
-                # Calculate duration
-                if job.started_at:
-                    duration = (job.completed_at - job.started_at).total_seconds()
-                    log_entry['duration'] = f"{duration:.1f}s"
-            
-            # Calculate compression ratio
-            if job.file_size_before and job.file_size_after:
-                ratio = (1 - job.file_size_after / job.file_size_before) * 100
-                log_entry['compression_ratio'] = f"{ratio:.1f}%"
-                log_entry['size_before'] = self._format_file_size(job.file_size_before)
-                log_entry['size_after'] = self._format_file_size(job.file_size_after)
+        with self._lock:
+            if record.status not in (JobStatus.FAILED, JobStatus.CANCELLED):
+                return False
             
-            logs.append(log_entry)
+            self.history.forget(job_id)
+            job = record.to_job()
+            self.jobs[job_id] = job
+            # The files are owned by the job again instead of the retention ledger
+            staging_manager.reclaim(job_id)
+            job.status = JobStatus.PENDING
+            job.error_message = None
+            job.started_at = None
+            job.completed_at = None
+            job.progress = {}
+            job.stage_attempts = {}
+            self._enqueue(job)
         
-        return logs
+        logger.info(f"Retrying job {job_id} from checkpoints {job.checkpoints or ['none']}")
+        
+        if not self.is_processing:
+            self.start_processing()
+        return True
+    
+    def _find_duplicate(self, job: EncodingJob) -> Optional[JobRecord]:
+        """A recently completed job that already produced this job's output from byte-identical source"""
+        if not job.source_sha256:
+            return None
+        return self.history.find(
+            lambda other: other.id != job.id and other.status == JobStatus.COMPLETED
+            and other.source_sha256 == job.source_sha256
+            and other.upload_path == job.upload_path
+            and other.codec == job.codec
+            and (other.target_size, other.target_bitrate) == (job.target_size, job.target_bitrate)
+        )
+    
+    async def _run_transfer(self, job: EncodingJob, stage: str, func, *args,
+                            total_bytes: Optional[int] = None, direction: Optional[str] = None, **kwargs):
+        """Run a blocking transfer under the stall watchdog, mirroring byte progress onto the job
+
+        `direction` is what the transfer scheduler files the stats under, when
+        it is not the stage name.
+        """
+        def on_progress(done_bytes):
+            job.progress = {'stage': stage, 'bytes': int(done_bytes)}
+            if total_bytes:
+                job.progress['percentage'] = round(min(done_bytes / total_bytes * 100, 100.0), 1)
+        
+        async def attempt(tracker):
+            # Stats cover the transfers of the attempt that ends the stage
+            transfer_scheduler.pop_stats(job.id, direction or stage)
+            return await stall_watchdog.run_in_thread(tracker, func, *args, on_progress=on_progress, **kwargs)
+        
+        started = time.time()
+        try:
+            return await stall_watchdog.run_stage(job.id, stage, attempt,
+                                                  on_retry=self._retry_callback(job, stage))
+        finally:
+            job.stage_timings[stage] = [started, time.time()]
+            stats = transfer_scheduler.pop_stats(job.id, direction or stage)
+            if stats:
+                job.transfer_stats[stage] = stats
     
     @staticmethod
-    def _format_file_size(size_bytes: int) -> str:
-        """Format file size in human readable format"""
-        if size_bytes == 0:
-            return "0 B"
+    def _retry_callback(job: EncodingJob, stage: str):
+        """Record a retried attempt on the job so the logs show why a stage restarted"""
+        def on_retry(attempt: int, reason: str):
+            job.stage_attempts[stage] = attempt + 1
+            job.progress = {'stage': stage, 'retrying': reason, 'attempt': attempt + 1}
+        return on_retry
+    
+    @staticmethod
+    def _staged_source(job: EncodingJob) -> Optional[str]:
+        """The job's input if the queue staged it; callers' own files are left alone"""
+        return None if job.keep_source else job.input_file
+    
+    @staticmethod
+    def _cleanup_files(*paths: str):
+        """Remove staged files, ignoring ones that were never created"""
+        for path in paths:
+            try:
+                if path and os.path.exists(path):
+                    os.remove(path)
+            except OSError as e:
+                logger.warning(f"Cleanup warning: {e}")
+    
+    def get_job_logs(self, limit: int = 100, offset: int = 0, archived: bool = False) -> List[Dict[str, Any]]:
+        """Get job logs for display: active jobs, then finished ones (from the archive when `archived`)"""
+        active = self.get_all_jobs()
+        logs = [
+            JobRecord.from_job(job).to_log_entry(progress=job.progress)
+            for job in active[offset:offset + limit]
+        ]
+        if logs:
+            estimates = self.get_forecast()['jobs']
+            for entry in logs:
+                estimate = estimates.get(entry['id'])
+                if estimate:
+                    entry['eta_seconds'] = estimate['eta_seconds']
+                    entry['predicted_size'] = estimate['predicted_size']
         
-        size = float(size_bytes)
-        for unit in ['B', 'KB', 'MB', 'GB']:
-            if size < 1024.0:
-                return f"{size:.1f} {unit}"
-            size /= 1024.0
+        remaining = limit - len(logs)
+        if remaining > 0:
+            history_offset = max(offset - len(active), 0)
+            if archived:
+                records = self.history.query(remaining, history_offset, exclude={job.id for job in active})
+            else:
+                records = self.history.recent()[history_offset:history_offset + remaining]
+            logs.extend(record.to_log_entry() for record in records)
         
-        return f"{size:.1f} TB"
+        return logs
 
 # Global queue instance
-encoding_queue = JobQueue(max_concurrent_jobs=1)
+encoding_queue = JobQueue(max_concurrent_jobs=int(os.getenv("MAX_CONCURRENT_JOBS", "1")))
 
-def add_encoding_job(input_file: str, output_file: str, codec: str) -> str:
+def add_encoding_job(input_file: str, output_file: str, codec: str,
+                     remote_path: Optional[str] = None, source_size: Optional[int] = None,
+                     target_size: Optional[int] = None, target_bitrate: Optional[int] = None,
+                     source_checksum: Optional[str] = None, upload_path: Optional[str] = None,
+                     keep_source: bool = False, media_info: Optional[Dict[str, Any]] = None,
+                     priority: int = 0) -> str:
     """Add a new encoding job to the global queue"""
-    return encoding_queue.add_job(input_file, output_file, codec)
+    return encoding_queue.add_job(input_file, output_file, codec, remote_path, source_size,
+                                  target_size, target_bitrate, source_checksum, upload_path, keep_source,
+                                  media_info, priority)
 
 def get_queue_status() -> Dict[str, Any]:
     """Get current queue status"""
     return encoding_queue.get_queue_status()
 
-def get_job_logs(limit: int = 100) -> List[Dict[str, Any]]:
+def get_queue_forecast() -> Dict[str, Any]:
+    """Get per-job ETAs, the backlog forecast and the learned throughput model"""
+    forecast = encoding_queue.get_forecast()
+    forecast['model'] = encoding_queue.forecaster.model.get_status()
+    return forecast
+
+def get_ffmpeg_log(job_id: str) -> Optional[List[str]]:
+    """Get the last FFmpeg stderr lines of a running or failed job"""
+    job = encoding_queue.get_job(job_id)
+    if job is None:
+        return None
+    return list(job.ffmpeg_log or ())
+
+def get_job_logs(limit: int = 100, offset: int = 0, archived: bool = False) -> List[Dict[str, Any]]:
     """Get job logs"""
-    return encoding_queue.get_job_logs(limit)
+    return encoding_queue.get_job_logs(limit, offset, archived)
 
 def cancel_job(job_id: str) -> bool:
     """Cancel a job"""
     return encoding_queue.cancel_job(job_id)
 
+def retry_job(job_id: str) -> bool:
+    """Retry a failed job from its last checkpoint"""
+    return encoding_queue.retry_job(job_id)
+
 def clear_completed_jobs() -> int:
     """Clear completed jobs"""
     return encoding_queue.clear_completed_jobs()
 
-def get_job(job_id: str) -> Optional[EncodingJob]:
+def get_job(job_id: str):
     """Get job by ID"""
     return encoding_queue.get_job(job_id)
+
+def drain_queue(timeout: float = 0) -> bool:
+    """Stop admitting jobs; True once every running job can be handed over"""
+    return encoding_queue.drain(timeout)
+
+def resume_queue():
+    """Start admitting jobs again after a drain"""
+    encoding_queue.resume()
+
+def handover_queue(keep_encodes: bool = True) -> int:
+    """Save the queue for the next process and stop, leaving encodes running unless `keep_encodes` is False"""
+    return encoding_queue.handover(keep_encodes)
+
+def restore_queue_state() -> List[str]:
+    """Re-queue jobs handed over by the previous process"""
+    return encoding_queue.restore_state()
@@ -0,0 +1,192 @@
+import os
+import re
+import glob
+import json
+import math
+import asyncio
+import logging
+from typing import Dict, List, Optional, Any, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Frames printed by the scene branch's metadata filter: a frame line, then its score
+SCENE_PATTERN = re.compile(r'pts_time:([\d.]+)\s+lavfi\.scene_score=([\d.]+)')
+
+
+def _escape(value: str) -> str:
+    """Escape a filter option value for use inside a filter graph string"""
+    for char in "\\':":
+        value = value.replace(char, '\\' + char)
+    for char in "\\'[],;":
+        value = value.replace(char, '\\' + char)
+    return value
+
+
+def _timestamp(seconds: float) -> str:
+    hours, rest = divmod(seconds, 3600)
+    minutes, rest = divmod(rest, 60)
+    return f"{int(hours):02d}:{int(minutes):02d}:{rest:06.3f}"
+
+
+class SidecarGenerator:
+    """Poster, scrub sprite sheets and a keyframe/scene index made by the encode itself
+
+    The decoded source frames are split inside the encode's filter graph, so
+    each artifact costs a downscale and a few JPEG writes rather than another
+    download and decode of the output. Files are staged next to the output
+    as '<output>.sidecar.<name>' and uploaded to '<upload path stem>/<name>'.
+    """
+
+    def __init__(self, enabled: bool = False, poster_position: float = 0.1, interval: float = 10.0,
+                 thumbnail_width: int = 160, columns: int = 10, rows: int = 10,
+                 scene_threshold: float = 0.3):
+        self.enabled = enabled
+        self.poster_position = poster_position
+        self.interval = interval
+        self.thumbnail_width = thumbnail_width
+        self.columns = columns
+        self.rows = rows
+        self.scene_threshold = scene_threshold
+
+    @classmethod
+    def from_env(cls) -> 'SidecarGenerator':
+        """Build from SIDECARS_ENABLED and the SIDECAR_* settings"""
+        return cls(
+            enabled=os.getenv("SIDECARS_ENABLED", "false").lower() in ("1", "true", "yes"),
+            poster_position=float(os.getenv("SIDECAR_POSTER_POSITION", "0.1")),
+            interval=float(os.getenv("SIDECAR_THUMBNAIL_INTERVAL", "10")),
+            thumbnail_width=int(os.getenv("SIDECAR_THUMBNAIL_WIDTH", "160")),
+            columns=int(os.getenv("SIDECAR_SPRITE_COLUMNS", "10")),
+            rows=int(os.getenv("SIDECAR_SPRITE_ROWS", "10")),
+            scene_threshold=float(os.getenv("SIDECAR_SCENE_THRESHOLD", "0.3"))
+        )
+
+    @staticmethod
+    def local_path(output_file: str, name: str) -> str:
+        return f"{output_file}.sidecar.{name}"
+
+    @staticmethod
+    def local_files(output_file: str) -> List[str]:
+        """Sidecar files staged for an output"""
+        return sorted(glob.glob(glob.escape(output_file) + '.sidecar.*'))
+
+    @staticmethod
+    def remote_prefix(upload_path: str) -> str:
+        """Where an output's sidecars go: a folder named after it, next to it"""
+        return upload_path.rsplit('.', 1)[0] + '/'
+
+    def thumbnail_size(self, width: int, height: int) -> Tuple[int, int]:
+        """Thumbnail frame size keeping the source's aspect ratio (even, as JPEG chroma needs)"""
+        thumb_height = max(2, int(round(self.thumbnail_width * height / width / 2)) * 2)
+        return self.thumbnail_width, thumb_height
+
+    def command_options(self, output_file: str, width: int, height: int,
+                        duration: Optional[float]) -> Dict[str, Any]:
+        """Filter graph and side outputs to merge into an encode's preset (see build_ffmpeg_command)
+
+        The encoder reads '[enc]', an untouched copy of the decoded video. The
+        poster is the first frame at poster_position of the title; sprites
+        tile one frame every `interval` seconds; the scene branch prints the
+        frames whose scene score passes the threshold and is discarded.
+        """
+        thumb_width, thumb_height = self.thumbnail_size(width, height)
+        offset = round((duration or 0) * self.poster_position, 3)
+        scenes_file = _escape(self.local_path(output_file, 'scenes.txt'))
+        graph = ';'.join([
+            "[0:v]split=4[enc][p][t][s]",
+            f"[p]select='isnan(prev_selected_t)*gte(t\\,{offset})'[poster]",
+            f"[t]fps=1/{self.interval},scale={thumb_width}:{thumb_height},tile={self.columns}x{self.rows}[sprites]",
+            f"[s]scale={thumb_width}:{thumb_height},select='gt(scene\\,{self.scene_threshold})',"
+            f"metadata=mode=print:file={scenes_file}[scenes]"
+        ])
+        return {
+            'filter_complex': graph,
+            'side_outputs': [
+                '-map', '[poster]', '-update', '1', '-q:v', '2', self.local_path(output_file, 'poster.jpg'),
+                '-map', '[sprites]', '-q:v', '4', self.local_path(output_file, 'sprite_%03d.jpg'),
+                '-map', '[scenes]', '-f', 'null', '-'
+            ],
+            'maps': ['-map', '[enc]', '-map', '0:a:0?']
+        }
+
+    @staticmethod
+    def parse_scenes(text: str) -> List[Dict[str, float]]:
+        return [
+            {'time': round(float(time), 3), 'score': round(float(score), 3)}
+            for time, score in SCENE_PATTERN.findall(text)
+        ]
+
+    @staticmethod
+    async def keyframes(output_file: str) -> List[float]:
+        """Keyframe times of the encoded video, from its packet flags (demuxed only, never decoded)"""
+        process = await asyncio.create_subprocess_exec(
+            'ffprobe', '-v', 'error', '-select_streams', 'v:0',
+            '-show_entries', 'packet=pts_time,flags', '-of', 'csv=p=0', output_file,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+        )
+        stdout, _ = await asyncio.wait_for(process.communicate(), timeout=120)
+        times = []
+        for line in stdout.decode(errors='replace').splitlines():
+            parts = line.strip().split(',')
+            if len(parts) >= 2 and parts[1].startswith('K') and parts[0] not in ('', 'N/A'):
+                times.append(round(float(parts[0]), 3))
+        return sorted(times)
+
+    def sprite_cues(self, sprites: List[str], duration: float, width: int, height: int) -> str:
+        """WebVTT track pointing each `interval` of the title at its tile (the usual scrub preview format)"""
+        thumb_width, thumb_height = self.thumbnail_size(width, height)
+        per_sheet = self.columns * self.rows
+        count = min(max(1, math.ceil(duration / self.interval)), len(sprites) * per_sheet)
+        lines = ['WEBVTT', '']
+        for i in range(count):
+            sheet, cell = divmod(i, per_sheet)
+            row, column = divmod(cell, self.columns)
+            start, end = i * self.interval, min((i + 1) * self.interval, duration)
+            lines.append(f"{_timestamp(start)} --> {_timestamp(end)}")
+            lines.append(f"{sprites[sheet]}#xywh={column * thumb_width},{row * thumb_height},"
+                         f"{thumb_width},{thumb_height}")
+            lines.append('')
+        return '\n'.join(lines)
+
+    async def finish(self, output_file: str, duration: float, width: int, height: int) -> Dict[str, Any]:
+        """Write the index and scrub track from what the encode left behind; returns the job's listing"""
+        scenes_path = self.local_path(output_file, 'scenes.txt')
+        scenes = []
+        if os.path.exists(scenes_path):
+            with open(scenes_path, errors='replace') as f:
+                scenes = self.parse_scenes(f.read())
+            os.remove(scenes_path)
+
+        prefix = self.local_path(output_file, '')
+        sprites = sorted(path[len(prefix):] for path in glob.glob(glob.escape(prefix) + 'sprite_*.jpg'))
+        poster = 'poster.jpg' if os.path.exists(self.local_path(output_file, 'poster.jpg')) else None
+        if not sprites and not poster:
+            raise Exception("Encode produced no sidecar images")
+
+        keyframes = await self.keyframes(output_file)
+        thumb_width, thumb_height = self.thumbnail_size(width, height)
+        index = {
+            'duration': duration,
+            'poster': poster,
+            'keyframes': keyframes,
+            'scenes': scenes,
+            'sprites': {
+                'files': sprites,
+                'interval': self.interval,
+                'columns': self.columns,
+                'rows': self.rows,
+                'width': thumb_width,
+                'height': thumb_height
+            }
+        }
+        with open(self.local_path(output_file, 'index.json'), 'w') as f:
+            json.dump(index, f)
+        if sprites:
+            with open(self.local_path(output_file, 'thumbnails.vtt'), 'w') as f:
+                f.write(self.sprite_cues(sprites, duration, width, height))
+
+        files = ([poster] if poster else []) + sprites + (['thumbnails.vtt'] if sprites else []) + ['index.json']
+        return {'files': files, 'keyframes': len(keyframes), 'scenes': len(scenes)}
+
+# Global instance
+sidecar_generator = SidecarGenerator.from_env()
@@ -0,0 +1,181 @@
+import os
+import math
+import logging
+from typing import Dict, Any, List, Optional, Tuple
+
+from .cancellation import JobCancelled, run_process
+from .cpu_allocator import cpu_allocator, CpuAllocation
+
+logger = logging.getLogger(__name__)
+
+# Audio is always re-encoded to AAC stereo at 128k (see FFmpegWorker.get_ffmpeg_preset)
+AUDIO_BITRATE_BPS = 128 * 1000
+
+# Rule of thumb for x264/x265/NVENC constant-quality modes (quality is on the x265 CRF
+# scale; each backend maps it onto its own): bitrate roughly halves
+# every 6 quality steps. Used until a second probe gives us a measured slope.
+DEFAULT_STEPS_PER_HALVING = 6.0
+
+MIN_QUALITY = 16
+MAX_QUALITY = 42
+
+
+class SizeTargetPredictor:
+    def __init__(self, sample_count: int = 3, sample_length: float = 4.0):
+        self.sample_count = sample_count
+        self.sample_length = sample_length
+
+    @staticmethod
+    def target_video_bitrate(duration: float, target_size: Optional[int] = None,
+                             target_bitrate: Optional[int] = None) -> Optional[int]:
+        """Video bitrate (bps) that hits a target file size or total bitrate after audio"""
+        if target_bitrate:
+            total_bps = target_bitrate
+        elif target_size and duration:
+            total_bps = target_size * 8 / duration
+        else:
+            return None
+        return max(int(total_bps - AUDIO_BITRATE_BPS), 50 * 1000)
+
+    def sample_offsets(self, duration: float) -> List[float]:
+        """Start times of the samples, spread evenly and skipping intros/credits"""
+        if duration <= self.sample_length * self.sample_count:
+            return [0.0]
+
+        start = duration * 0.05
+        end = duration * 0.95 - self.sample_length
+        if self.sample_count == 1 or end <= start:
+            return [max(start, 0.0)]
+
+        step = (end - start) / (self.sample_count - 1)
+        return [round(start + i * step, 2) for i in range(self.sample_count)]
+
+    def encode_sample(self, input_file: str, offset: float, length: float, backend,
+                      quality: int, preset: str, sample_path: str,
+                      allocation: Optional[CpuAllocation] = None) -> Optional[float]:
+        """Encode one video-only sample at constant quality and return its bitrate (bps)
+
+        CPU backends run with the threads (and pinning) of `allocation`.
+        """
+        threading_options = backend.threading_options(allocation) if allocation else {'input': [], 'encoder': []}
+        cmd = [
+            'ffmpeg', '-hide_banner', '-loglevel', 'error', '-y',
+            *threading_options['input'],
+            '-ss', str(offset), '-i', input_file, '-t', str(length),
+            '-map', '0:v:0', '-an',
+            '-c:v', backend.encoder, *backend.constant_quality(quality, preset),
+            *threading_options['encoder']
+        ]
+        cmd.extend(['-f', 'mp4', sample_path])
+
+        try:
+            result = run_process(cmd, timeout=max(60, length * 30),
+                                 preexec_fn=cpu_allocator.get_preexec_fn(allocation) if allocation else None)
+            if result.returncode != 0 or not os.path.exists(sample_path):
+                logger.warning(f"Sample encode at {offset}s failed: {result.stderr.strip()[-200:]}")
+                return None
+            size = os.path.getsize(sample_path)
+            return size * 8 / length if size else None
+        except JobCancelled:
+            raise
+        except Exception as e:
+            logger.warning(f"Sample encode at {offset}s failed: {e}")
+            return None
+        finally:
+            if os.path.exists(sample_path):
+                os.remove(sample_path)
+
+    def measure_bitrate(self, input_file: str, duration: float, backend, quality: int, preset: str,
+                        work_dir: str, allocation: Optional[CpuAllocation] = None) -> Tuple[Optional[float], List[float]]:
+        """Mean bitrate across all samples at one quality value"""
+        bitrates = []
+        for i, offset in enumerate(self.sample_offsets(duration)):
+            length = min(self.sample_length, duration - offset)
+            if length <= 0:
+                continue
+            sample_path = os.path.join(work_dir, f".sample_{os.getpid()}_{i}_{quality}.mp4")
+            bitrate = self.encode_sample(input_file, offset, length, backend,
+                                         quality, preset, sample_path, allocation)
+            if bitrate:
+                bitrates.append(bitrate)
+
+        if not bitrates:
+            return None, []
+        return sum(bitrates) / len(bitrates), bitrates
+
+    @staticmethod
+    def solve_quality(quality: int, bitrate: float, target: float, steps_per_halving: float) -> int:
+        """Quality value that moves the measured bitrate onto the target along the log-linear model"""
+        predicted = quality - steps_per_halving * math.log2(target / bitrate)
+        return int(min(max(round(predicted), MIN_QUALITY), MAX_QUALITY))
+
+    def predict(self, input_file: str, duration: float, backend,
+                base_settings: Dict[str, Any], target_size: Optional[int] = None,
+                target_bitrate: Optional[int] = None, work_dir: Optional[str] = None,
+                allocation: Optional[CpuAllocation] = None) -> Optional[Dict[str, Any]]:
+        """Predict rate-control settings that hit the target, in the shape of get_optimized_settings"""
+        target_bps = self.target_video_bitrate(duration, target_size, target_bitrate)
+        if not target_bps or not duration:
+            return None
+
+        work_dir = work_dir or os.path.dirname(os.path.abspath(input_file))
+        preset = base_settings['preset']
+        first_quality = int(base_settings['crf'])
+
+        first_bitrate, first_samples = self.measure_bitrate(
+            input_file, duration, backend, first_quality, preset, work_dir, allocation
+        )
+        if not first_bitrate:
+            logger.warning(f"Size targeting disabled for {input_file}: no samples could be encoded")
+            return None
+
+        steps_per_halving = DEFAULT_STEPS_PER_HALVING
+        quality = self.solve_quality(first_quality, first_bitrate, target_bps, steps_per_halving)
+        measured_bitrate = first_bitrate
+        sample_bitrates = first_samples
+
+        # A large jump leaves the rule-of-thumb slope unreliable, so measure again at the
+        # predicted point and refit the slope from the two measurements
+        if abs(quality - first_quality) >= 3:
+            second_bitrate, second_samples = self.measure_bitrate(
+                input_file, duration, backend, quality, preset, work_dir, allocation
+            )
+            if second_bitrate and second_bitrate != first_bitrate:
+                ratio = math.log2(first_bitrate / second_bitrate)
+                # Valid in both directions: a lower quality value costs bits, a higher one saves them
+                slope = (quality - first_quality) / ratio
+                if slope > 0:
+                    steps_per_halving = slope
+                    quality = self.solve_quality(first_quality, first_bitrate, target_bps, steps_per_halving)
+                measured_bitrate = second_bitrate
+                sample_bitrates = second_samples
+
+        avg_kbps = target_bps // 1000
+        settings = dict(base_settings)
+        settings.update({
+            'avg_bitrate': f"{avg_kbps}k",
+            'max_bitrate': f"{int(avg_kbps * 1.5)}k",
+            'crf': quality,
+            'target_video_bitrate': target_bps,
+            'predicted_size': int(duration * (target_bps + AUDIO_BITRATE_BPS) / 8),
+            'sample_bitrates': [int(b) for b in sample_bitrates],
+            'complexity_bitrate': int(measured_bitrate),
+            'steps_per_halving': round(steps_per_halving, 2)
+        })
+
+        logger.info(
+            f"Size target for {os.path.basename(input_file)}: {avg_kbps}k video, "
+            f"quality {first_quality} -> {quality} (samples at {int(first_bitrate) // 1000}k)"
+        )
+        return settings
+
+# Global instance
+size_predictor = SizeTargetPredictor()
+
+def predict_settings(input_file: str, duration: float, backend,
+                     base_settings: Dict[str, Any], target_size: Optional[int] = None,
+                     target_bitrate: Optional[int] = None, work_dir: Optional[str] = None,
+                     allocation: Optional[CpuAllocation] = None):
+    """Predict rate-control settings that hit a target size or bitrate with an encoder backend"""
+    return size_predictor.predict(input_file, duration, backend, base_settings,
+                                  target_size, target_bitrate, work_dir, allocation)
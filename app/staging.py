@@ -0,0 +1,340 @@
+import os
+import re
+import time
+import shutil
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Any, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Audio is always re-encoded to AAC stereo at 128k (see FFmpegWorker.get_ffmpeg_preset)
+AUDIO_BITRATE_BPS = 128 * 1000
+
+# Highest max_bitrate in FFmpegWorker.get_optimized_settings, used when the resolution is unknown
+DEFAULT_MAX_VIDEO_BITRATE_BPS = 3500 * 1000
+
+# Container overhead and rate-control overshoot allowance on top of the bitrate estimate
+OUTPUT_SIZE_MARGIN = 1.10
+
+# Staged files start with the first 8 hex digits of their job's id (see staged_name);
+# anything else in a staging directory was put there by someone else
+STAGED_NAME = re.compile(r'^[0-9a-f]{8}_')
+
+
+def parse_size(value: Optional[str]) -> Optional[int]:
+    """Parse a human readable size such as '512M', '2G' or '1048576' into bytes"""
+    if value is None:
+        return None
+    value = str(value).strip().upper()
+    if not value or value in ('0', 'NONE', 'UNLIMITED'):
+        return None
+
+    multipliers = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+    if value.endswith('B'):
+        value = value[:-1]
+    if value and value[-1] in multipliers:
+        return int(float(value[:-1]) * multipliers[value[-1]])
+    return int(float(value))
+
+
+def staged_name(job_id: str, filename: str) -> str:
+    """File name a job stages `filename` under, unique per job"""
+    return f"{job_id[:8]}_{filename}"
+
+
+def is_staged_name(path: str) -> bool:
+    """Whether a file in a staging directory follows the job naming scheme (and is ours to delete)"""
+    return bool(STAGED_NAME.match(os.path.basename(path)))
+
+
+def parse_bitrate(value) -> int:
+    """Bits per second from an FFmpeg-style rate ('1500k') or a plain number of bps"""
+    value = str(value).strip().lower()
+    if value.endswith('k'):
+        return int(float(value[:-1]) * 1000)
+    if value.endswith('m'):
+        return int(float(value[:-1]) * 1000 * 1000)
+    return int(float(value))
+
+
+def estimate_output_size(source_size: Optional[int], duration: Optional[float] = None,
+                         max_bitrate=None) -> int:
+    """Estimate the encoded output size from target bitrate x duration, capped by the source size
+
+    `max_bitrate` is the video rate cap, as in get_optimized_settings ('1500k') or in bps.
+    """
+    if duration:
+        video_bps = DEFAULT_MAX_VIDEO_BITRATE_BPS
+        if max_bitrate:
+            video_bps = parse_bitrate(max_bitrate)
+        estimate = int(duration * (video_bps + AUDIO_BITRATE_BPS) / 8 * OUTPUT_SIZE_MARGIN)
+        if source_size:
+            # Small, already well compressed sources can come out larger than the
+            # bitrate cap suggests, but never by more than the margin
+            return max(min(estimate, int(source_size * OUTPUT_SIZE_MARGIN)), 1)
+        return estimate
+
+    # Without a duration the source size is the only bound we have
+    return int((source_size or 0) * OUTPUT_SIZE_MARGIN)
+
+
+@dataclass
+class StagingVolume:
+    root: str
+    max_file_size: Optional[int] = None  # Only stage files up to this size here (e.g. tmpfs)
+
+    @property
+    def input_dir(self) -> str:
+        return os.path.join(self.root, "input")
+
+    @property
+    def output_dir(self) -> str:
+        return os.path.join(self.root, "output")
+
+    def free_bytes(self) -> int:
+        return shutil.disk_usage(self.root).free
+
+    def total_bytes(self) -> int:
+        return shutil.disk_usage(self.root).total
+
+
+@dataclass
+class StagingReservation:
+    job_id: str
+    volume: StagingVolume
+    source_bytes: int
+    output_bytes: int
+    paths: List[str] = field(default_factory=list)
+
+    @property
+    def total_bytes(self) -> int:
+        return self.source_bytes + self.output_bytes
+
+    def outstanding_bytes(self) -> int:
+        """Reserved bytes that have not been written to disk yet"""
+        written = 0
+        for path in self.paths:
+            # Downloads land in a '.part' file and are renamed once complete
+            for candidate in (path, path + ".part"):
+                try:
+                    if os.path.exists(candidate):
+                        written += os.path.getsize(candidate)
+                except OSError:
+                    pass
+        return max(self.total_bytes - written, 0)
+
+
+class StagingManager:
+    def __init__(self, volumes: List[StagingVolume], headroom_bytes: int = 0,
+                 default_source_size: int = 0, retention_budget: int = 0):
+        self.volumes = volumes
+        self.headroom_bytes = headroom_bytes
+        self.default_source_size = default_source_size
+        self.retention_budget = retention_budget
+        self.reservations: Dict[str, StagingReservation] = {}
+        # Checkpointed artifacts of failed jobs, oldest first: job_id -> (retained_at, paths)
+        self.retained: Dict[str, Tuple[float, List[str]]] = {}
+        self._lock = threading.Lock()
+
+        for volume in self.volumes:
+            os.makedirs(volume.input_dir, exist_ok=True)
+            os.makedirs(volume.output_dir, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> 'StagingManager':
+        """Build the manager from STAGING_VOLUMES ('path[:max_file_size],...'), e.g. '/dev/shm/encoder:1G,.'"""
+        spec = os.getenv("STAGING_VOLUMES", ".")
+        volumes = []
+        for entry in spec.split(','):
+            entry = entry.strip()
+            if not entry:
+                continue
+            root, _, limit = entry.partition(':')
+            volumes.append(StagingVolume(root=root, max_file_size=parse_size(limit) if limit else None))
+
+        return cls(
+            volumes or [StagingVolume(root=".")],
+            headroom_bytes=parse_size(os.getenv("STAGING_HEADROOM", "1G")) or 0,
+            default_source_size=parse_size(os.getenv("STAGING_DEFAULT_SOURCE_SIZE", "2G")) or 0,
+            retention_budget=parse_size(os.getenv("RETAINED_ARTIFACTS_BUDGET", "20G")) or 0
+        )
+
+    def _available_bytes(self, volume: StagingVolume) -> int:
+        """Free space on a volume minus headroom and bytes promised to admitted jobs"""
+        outstanding = sum(
+            r.outstanding_bytes() for r in self.reservations.values() if r.volume is volume
+        )
+        return volume.free_bytes() - outstanding - self.headroom_bytes
+
+    def _candidate_volumes(self, largest_file: int) -> List[StagingVolume]:
+        """Volumes that accept files of this size, size-limited (fast) volumes first"""
+        eligible = [v for v in self.volumes if v.max_file_size is None or largest_file <= v.max_file_size]
+        return sorted(eligible, key=lambda v: (v.max_file_size is None, v.max_file_size or 0))
+
+    def _budget(self, source_size: Optional[int], output_size: Optional[int]):
+        """Fill in defaults: an unknown source size (None) falls back to the configured default"""
+        if source_size is None:
+            source_size = self.default_source_size
+        if output_size is None:
+            output_size = estimate_output_size(source_size)
+        return source_size, output_size
+
+    def can_ever_fit(self, source_size: Optional[int], output_size: Optional[int] = None) -> bool:
+        """Whether a job of this size could be admitted on an otherwise empty node"""
+        source_size, output_size = self._budget(source_size, output_size)
+        needed = source_size + output_size + self.headroom_bytes
+        return any(
+            v.total_bytes() >= needed
+            for v in self._candidate_volumes(max(source_size, output_size))
+        )
+
+    def reserve(self, job_id: str, source_size: Optional[int], output_size: Optional[int] = None) -> Optional[StagingReservation]:
+        """Reserve staging space for a job, returning None if no volume currently has room"""
+        source_size, output_size = self._budget(source_size, output_size)
+
+        with self._lock:
+            existing = self.reservations.get(job_id)
+            if existing:
+                return existing
+
+            for volume in self._candidate_volumes(max(source_size, output_size)):
+                if self._available_bytes(volume) >= source_size + output_size:
+                    reservation = StagingReservation(job_id, volume, source_size, output_size)
+                    self.reservations[job_id] = reservation
+                    logger.info(
+                        f"Reserved {reservation.total_bytes} bytes on {volume.root} for job {job_id}"
+                    )
+                    return reservation
+
+        return None
+
+    def track_paths(self, job_id: str, *paths: str):
+        """Attribute staged files to a reservation so written bytes are not counted twice"""
+        with self._lock:
+            reservation = self.reservations.get(job_id)
+            if reservation:
+                reservation.paths.extend(p for p in paths if p not in reservation.paths)
+
+    def release(self, job_id: str):
+        """Release a job's reservation"""
+        with self._lock:
+            if self.reservations.pop(job_id, None):
+                logger.info(f"Released staging reservation for job {job_id}")
+
+    def is_staged(self, path: str) -> bool:
+        """Whether a path lives in one of our staging directories (and is ours to delete)"""
+        directory = os.path.dirname(os.path.abspath(path))
+        return any(
+            directory in (os.path.abspath(v.input_dir), os.path.abspath(v.output_dir))
+            for v in self.volumes
+        )
+
+    @staticmethod
+    def _size_of(paths: List[str]) -> int:
+        return sum(os.path.getsize(p) for p in paths if os.path.exists(p))
+
+    def retain(self, job_id: str, paths: List[str]):
+        """Keep a failed job's checkpointed artifacts for a retry, within the retention budget"""
+        staged = [p for p in paths if self.is_staged(p)]
+        if not staged:
+            return
+        with self._lock:
+            self.retained[job_id] = (time.time(), staged)
+            self._enforce_retention_budget()
+
+    def reclaim(self, job_id: str) -> List[str]:
+        """Take a job's artifacts back out of the retention ledger (the job is being retried)"""
+        with self._lock:
+            _, paths = self.retained.pop(job_id, (None, []))
+            return paths
+
+    def discard_retained(self, job_id: str):
+        """Delete a job's retained artifacts"""
+        for path in self.reclaim(job_id):
+            self._remove(path)
+
+    def _enforce_retention_budget(self):
+        """Delete the oldest retained artifacts until the total fits the budget (caller holds the lock)"""
+        total = sum(self._size_of(paths) for _, paths in self.retained.values())
+        for job_id in sorted(self.retained, key=lambda j: self.retained[j][0]):
+            if total <= self.retention_budget:
+                break
+            _, paths = self.retained.pop(job_id)
+            total -= self._size_of(paths)
+            for path in paths:
+                self._remove(path)
+            logger.info(f"Evicted retained artifacts of job {job_id} (retention budget exceeded)")
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+        except OSError as e:
+            logger.warning(f"Could not remove staging file {path}: {e}")
+
+    def sweep_orphans(self, keep: Optional[List[str]] = None) -> int:
+        """Remove staged files not owned by a live reservation (e.g. left behind by a crash)
+
+        Only files named by staged_name() are considered, so files a user put
+        in ./input or ./output themselves are left alone.
+        """
+        keep_paths = {os.path.abspath(p) for p in (keep or [])}
+        with self._lock:
+            for reservation in self.reservations.values():
+                keep_paths.update(os.path.abspath(p) for p in reservation.paths)
+            for _, paths in self.retained.values():
+                keep_paths.update(os.path.abspath(p) for p in paths)
+
+        removed = 0
+        for volume in self.volumes:
+            for directory in (volume.input_dir, volume.output_dir):
+                if not os.path.isdir(directory):
+                    continue
+                for name in os.listdir(directory):
+                    path = os.path.join(directory, name)
+                    if (not is_staged_name(name) or not os.path.isfile(path)
+                            or os.path.abspath(path) in keep_paths):
+                        continue
+                    try:
+                        os.remove(path)
+                        removed += 1
+                    except OSError as e:
+                        logger.warning(f"Could not remove orphaned staging file {path}: {e}")
+
+        if removed:
+            logger.info(f"Swept {removed} orphaned staging file(s)")
+        return removed
+
+    def get_status(self) -> List[Dict[str, Any]]:
+        """Get per-volume free space and reservation totals"""
+        with self._lock:
+            status = []
+            for volume in self.volumes:
+                reserved = [r for r in self.reservations.values() if r.volume is volume]
+                status.append({
+                    'root': volume.root,
+                    'max_file_size': volume.max_file_size,
+                    'free_bytes': volume.free_bytes(),
+                    'reserved_bytes': sum(r.total_bytes for r in reserved),
+                    'outstanding_bytes': sum(r.outstanding_bytes() for r in reserved),
+                    'jobs': len(reserved),
+                    'retained_bytes': sum(
+                        self._size_of([p for p in paths if p.startswith(volume.root)])
+                        for _, paths in self.retained.values()
+                    )
+                })
+            return status
+
+# Global instance
+staging_manager = StagingManager.from_env()
+
+def sweep_orphans(keep: Optional[List[str]] = None) -> int:
+    """Remove orphaned staging files"""
+    return staging_manager.sweep_orphans(keep)
+
+def get_staging_status() -> List[Dict[str, Any]]:
+    """Get staging volume status"""
+    return staging_manager.get_status()
@@ -0,0 +1,297 @@
+import os
+import time
+import shutil
+import logging
+import threading
+import subprocess
+from collections import deque
+from dataclasses import dataclass, field, asdict
+from typing import Dict, List, Optional, Any, Tuple
+
+from .ffmpeg_worker import ffmpeg_worker
+from .staging import staging_manager
+
+logger = logging.getLogger(__name__)
+
+GPU_QUERY_FIELDS = 'name,memory.total,memory.used,utilization.gpu,utilization.encoder,temperature.gpu'
+
+# How long to wait before asking nvidia-smi again after it was missing or failed
+GPU_RETRY_SECONDS = 300
+
+
+def _to_number(value: str) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        # nvidia-smi prints '[N/A]' or '[Not Supported]' for some fields
+        return None
+
+
+def read_cpu_times() -> Optional[Tuple[int, int]]:
+    """(busy, total) jiffies across all CPUs from /proc/stat"""
+    try:
+        with open('/proc/stat') as f:
+            values = [int(v) for v in f.readline().split()[1:]]
+    except (OSError, ValueError):
+        return None
+    # idle + iowait count as not busy; guest time is already included in user
+    idle = values[3] + (values[4] if len(values) > 4 else 0)
+    total = sum(values[:8])
+    return total - idle, total
+
+
+def read_memory() -> Optional[Dict[str, int]]:
+    """Total and available memory in bytes from /proc/meminfo"""
+    try:
+        info = {}
+        with open('/proc/meminfo') as f:
+            for line in f:
+                key, value = line.split(':', 1)
+                info[key] = int(value.split()[0]) * 1024
+        return {'total': info['MemTotal'], 'available': info['MemAvailable']}
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def read_disk_io() -> Optional[Tuple[int, int]]:
+    """Bytes read and written by whole block devices since boot"""
+    try:
+        devices = {
+            name for name in os.listdir('/sys/block')
+            if not name.startswith(('loop', 'ram', 'zram'))
+        }
+        read_bytes = written_bytes = 0
+        with open('/proc/diskstats') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) > 9 and parts[2] in devices:
+                    # Sectors are always 512 bytes in diskstats
+                    read_bytes += int(parts[5]) * 512
+                    written_bytes += int(parts[9]) * 512
+        return read_bytes, written_bytes
+    except (OSError, ValueError):
+        return None
+
+
+def read_pressure(resource: str) -> Optional[float]:
+    """Percent of the last 10 s some task was stalled on cpu, io or memory (Linux PSI)"""
+    try:
+        with open(f'/proc/pressure/{resource}') as f:
+            fields = dict(item.split('=', 1) for item in f.readline().split()[1:])
+        return float(fields['avg10'])
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def read_network_io() -> Optional[Tuple[int, int]]:
+    """Bytes received and sent on all non-loopback interfaces"""
+    try:
+        received = sent = 0
+        with open('/proc/net/dev') as f:
+            for line in f.readlines()[2:]:
+                name, data = line.split(':', 1)
+                if name.strip() == 'lo':
+                    continue
+                values = data.split()
+                received += int(values[0])
+                sent += int(values[8])
+        return received, sent
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+@dataclass
+class TelemetrySample:
+    timestamp: float
+    gpus: List[Dict[str, Any]] = field(default_factory=list)
+    cpu_percent: Optional[float] = None
+    load_average: Optional[List[float]] = None
+    cpu_pressure: Optional[float] = None
+    io_pressure: Optional[float] = None
+    memory_total: Optional[int] = None
+    memory_available: Optional[int] = None
+    disk_read_bps: Optional[float] = None
+    disk_write_bps: Optional[float] = None
+    network_rx_bps: Optional[float] = None
+    network_tx_bps: Optional[float] = None
+    staging: List[Dict[str, Any]] = field(default_factory=list)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class TelemetrySampler:
+    """Samples hardware stats on a background thread so request handlers never run subprocesses"""
+
+    def __init__(self, interval: float = 5.0, history_size: int = 720):
+        self.interval = interval
+        self.samples: deque = deque(maxlen=history_size)
+        self.gpu_available = False
+        self.nvenc_capabilities: Dict[str, bool] = {'hevc': False, 'h264': False}
+        self._next_gpu_probe = 0.0
+        self._previous: Dict[str, Any] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_env(cls) -> 'TelemetrySampler':
+        """Build the sampler from TELEMETRY_INTERVAL_SECONDS and TELEMETRY_HISTORY_SIZE"""
+        return cls(
+            interval=float(os.getenv("TELEMETRY_INTERVAL_SECONDS", "5")),
+            history_size=int(os.getenv("TELEMETRY_HISTORY_SIZE", "720"))
+        )
+
+    def start(self):
+        """Start sampling in a daemon thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="telemetry", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        # Probe the encoder list once, off the request path
+        self.nvenc_capabilities = ffmpeg_worker.get_nvenc_capabilities()
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                self.samples.append(self.sample())
+            except Exception as e:
+                logger.error(f"Telemetry sample failed: {e}")
+            self._stop.wait(max(self.interval - (time.monotonic() - started), 0.1))
+
+    def _sample_gpus(self) -> List[Dict[str, Any]]:
+        """Query nvidia-smi, backing off when it is missing so idle CPU-only hosts do not fork every interval"""
+        if time.monotonic() < self._next_gpu_probe:
+            return []
+        try:
+            result = subprocess.run(
+                ['nvidia-smi', f'--query-gpu={GPU_QUERY_FIELDS}', '--format=csv,noheader,nounits'],
+                capture_output=True, text=True, timeout=10
+            )
+            if result.returncode != 0:
+                raise Exception(result.stderr.strip() or f"exit code {result.returncode}")
+        except Exception as e:
+            if self.gpu_available or not self._next_gpu_probe:
+                logger.warning(f"nvidia-smi not available: {e}")
+            self.gpu_available = False
+            self._next_gpu_probe = time.monotonic() + GPU_RETRY_SECONDS
+            return []
+
+        gpus = []
+        for line in result.stdout.strip().split('\n'):
+            parts = [p.strip() for p in line.split(',')]
+            if len(parts) >= 6:
+                gpus.append({
+                    'name': parts[0],
+                    'memory_total_mb': _to_number(parts[1]),
+                    'memory_used_mb': _to_number(parts[2]),
+                    'utilization': _to_number(parts[3]),
+                    'encoder_utilization': _to_number(parts[4]),
+                    'temperature': _to_number(parts[5])
+                })
+        self.gpu_available = bool(gpus)
+        return gpus
+
+    def _rate(self, key: str, counters: Optional[Tuple[int, int]], now: float) -> Tuple[Optional[float], Optional[float]]:
+        """Per-second rates of a pair of monotonically increasing counters since the last sample"""
+        previous = self._previous.get(key)
+        self._previous[key] = (now, counters)
+        if counters is None or previous is None or previous[1] is None:
+            return None, None
+        elapsed = now - previous[0]
+        if elapsed <= 0:
+            return None, None
+        return tuple(round(max(c - p, 0) / elapsed, 1) for c, p in zip(counters, previous[1]))
+
+    def sample(self) -> TelemetrySample:
+        """Take one sample (blocking; called from the sampler thread)"""
+        now = time.monotonic()
+        sample = TelemetrySample(timestamp=time.time(), gpus=self._sample_gpus())
+
+        cpu = read_cpu_times()
+        previous_cpu = self._previous.get('cpu')
+        self._previous['cpu'] = cpu
+        if cpu and previous_cpu and cpu[1] > previous_cpu[1]:
+            sample.cpu_percent = round((cpu[0] - previous_cpu[0]) / (cpu[1] - previous_cpu[1]) * 100, 1)
+        if hasattr(os, 'getloadavg'):
+            sample.load_average = [round(v, 2) for v in os.getloadavg()]
+        sample.cpu_pressure = read_pressure('cpu')
+        sample.io_pressure = read_pressure('io')
+
+        memory = read_memory()
+        if memory:
+            sample.memory_total = memory['total']
+            sample.memory_available = memory['available']
+
+        sample.disk_read_bps, sample.disk_write_bps = self._rate('disk', read_disk_io(), now)
+        sample.network_rx_bps, sample.network_tx_bps = self._rate('network', read_network_io(), now)
+
+        for volume in staging_manager.volumes:
+            try:
+                usage = shutil.disk_usage(volume.root)
+                sample.staging.append({'root': volume.root, 'free': usage.free, 'total': usage.total})
+            except OSError:
+                pass
+
+        return sample
+
+    def latest(self) -> Optional[TelemetrySample]:
+        return self.samples[-1] if self.samples else None
+
+    def history(self, seconds: Optional[float] = None) -> List[TelemetrySample]:
+        """Samples from the last `seconds` (all retained samples when None)"""
+        samples = list(self.samples)
+        if seconds is None:
+            return samples
+        cutoff = time.time() - seconds
+        return [s for s in samples if s.timestamp >= cutoff]
+
+    def get_gpu_info(self) -> Dict[str, Any]:
+        """Latest GPU sample in the shape of FFmpegWorker.get_gpu_info"""
+        latest = self.latest()
+        if not latest or not latest.gpus:
+            return {'available': False, 'gpus': []}
+        return {
+            'available': True,
+            'gpus': [
+                {
+                    'name': gpu['name'],
+                    'memory_total': f"{gpu['memory_total_mb']:.0f} MB" if gpu['memory_total_mb'] is not None else "N/A",
+                    'memory_used': f"{gpu['memory_used_mb']:.0f} MB" if gpu['memory_used_mb'] is not None else "N/A",
+                    'utilization': f"{gpu['utilization']:.0f}%" if gpu['utilization'] is not None else "N/A"
+                }
+                for gpu in latest.gpus
+            ]
+        }
+
+# Global instance
+telemetry_sampler = TelemetrySampler.from_env()
+
+def start_telemetry():
+    """Start the background hardware sampler"""
+    telemetry_sampler.start()
+
+def get_gpu_info() -> Dict[str, Any]:
+    """Get the latest sampled GPU information"""
+    return telemetry_sampler.get_gpu_info()
+
+def get_nvenc_capabilities() -> Dict[str, bool]:
+    """Get the NVENC capabilities probed at startup"""
+    return dict(telemetry_sampler.nvenc_capabilities)
+
+def get_latest_telemetry() -> Optional[Dict[str, Any]]:
+    """Get the latest hardware sample"""
+    latest = telemetry_sampler.latest()
+    return latest.to_dict() if latest else None
+
+def get_telemetry(seconds: Optional[float] = None) -> Dict[str, Any]:
+    """Get the latest hardware sample and a short history for sparklines"""
+    return {
+        'interval': telemetry_sampler.interval,
+        'latest': get_latest_telemetry(),
+        'history': [s.to_dict() for s in telemetry_sampler.history(seconds)]
+    }
@@ -0,0 +1,300 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Any, Tuple
+
+from .cancellation import CancelToken, current_cancel_token
+from .log_config import current_job_id
+
+logger = logging.getLogger(__name__)
+
+# Lower is served first when transfers contend for a bucket: an upload is the
+# last stage of a job, so finishing it frees a job slot and its staging space
+PRIORITY = {'upload': 0, 'download': 1}
+
+# Bytes read or written per step; tokens are taken at this granularity
+CHUNK_SIZE = 64 * 1024
+
+# Seconds a host is paused after a 429 that did not say how long to back off
+DEFAULT_RETRY_AFTER = 5.0
+MAX_RETRY_AFTER = 120.0
+
+# Upper bound on a single wait so waiters re-check pauses and priorities regularly
+MAX_WAIT = 0.25
+
+# Finished-transfer stats kept for the queue to collect; transfers nobody collects
+# (abandoned by the stall watchdog, or run outside a queue stage) age out past this
+MAX_FINISHED_STATS = 256
+
+
+def _rate(mbps: Optional[float]) -> Optional[float]:
+    """Megabits per second to bytes per second (None for unlimited)"""
+    return mbps * 1000 * 1000 / 8 if mbps and mbps > 0 else None
+
+
+def _mbps(rate: Optional[float]) -> Optional[float]:
+    return round(rate * 8 / 1000 / 1000, 1) if rate else None
+
+
+class TokenBucket:
+    """Byte rate limit shared by transfer threads; waiters are served most urgent first
+
+    A rate of None only enforces pauses (e.g. after a 429). Tokens may go
+    negative: a chunk is admitted as soon as the bucket is not in debt, and the
+    debt is repaid before the next one, so the long-run rate holds.
+    """
+
+    def __init__(self, name: str, rate: Optional[float] = None):
+        self.name = name
+        self.rate = rate
+        self.capacity = max(rate, CHUNK_SIZE) if rate else 0.0  # About one second of burst
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.waiting: Dict[int, int] = {}  # priority -> threads waiting
+        self._cond = threading.Condition()
+
+    def _refill(self, now: float):
+        if self.rate:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, nbytes: int, priority: int, cancel_token: Optional[CancelToken] = None) -> float:
+        """Take `nbytes`, blocking while paused, in debt or behind more urgent waiters; returns seconds waited"""
+        started = time.monotonic()
+        with self._cond:
+            self.waiting[priority] = self.waiting.get(priority, 0) + 1
+            try:
+                while True:
+                    # A cancelled job stops waiting within MAX_WAIT, even behind a long pause
+                    if cancel_token:
+                        cancel_token.check()
+                    now = time.monotonic()
+                    self._refill(now)
+                    if now < self.paused_until:
+                        wait = self.paused_until - now
+                    elif any(count for p, count in self.waiting.items() if p < priority):
+                        wait = MAX_WAIT
+                    elif self.rate and self.tokens < 0:
+                        wait = -self.tokens / self.rate
+                    else:
+                        if self.rate:
+                            self.tokens -= nbytes
+                        return time.monotonic() - started
+                    self._cond.wait(min(wait, MAX_WAIT))
+            finally:
+                self.waiting[priority] -= 1
+                self._cond.notify_all()
+
+    def pause(self, seconds: float):
+        with self._cond:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self._cond.notify_all()
+
+    def get_status(self) -> Dict[str, Any]:
+        paused_for = self.paused_until - time.monotonic()
+        return {
+            'limit_mbps': _mbps(self.rate),
+            'paused_seconds': round(paused_for, 1) if paused_for > 0 else 0,
+            'waiting': {d: self.waiting.get(p, 0) for d, p in PRIORITY.items()}
+        }
+
+
+class Transfer:
+    """One attempt at moving one file; the transfer thread reports each chunk through consume()"""
+
+    def __init__(self, scheduler: 'TransferScheduler', direction: str, host: Optional[str],
+                 buckets: List[TokenBucket], total_bytes: Optional[int] = None):
+        self.scheduler = scheduler
+        self.direction = direction
+        self.host = host
+        self.priority = PRIORITY[direction]
+        self.buckets = buckets
+        self.total_bytes = total_bytes
+        self.job_id = current_job_id.get()
+        self.cancel_token = current_cancel_token.get()
+        self.bytes = 0
+        self.throttled_seconds = 0.0
+        self.started = time.monotonic()
+        self.finished: Optional[float] = None
+
+    def consume(self, nbytes: int):
+        """Account for a chunk, waiting until every bucket on the path has room for it"""
+        if self.cancel_token:
+            self.cancel_token.check()
+        for bucket in self.buckets:
+            self.throttled_seconds += bucket.acquire(nbytes, self.priority, self.cancel_token)
+        self.bytes += nbytes
+        self.scheduler._count(self.direction, nbytes)
+
+    def restart(self):
+        """Start the attempt over, e.g. when a retried request resends the body from the start
+
+        Bytes already taken from the buckets stay spent: they did cross the link.
+        """
+        self.bytes = 0
+        self.throttled_seconds = 0.0
+        self.started = time.monotonic()
+
+    @property
+    def seconds(self) -> float:
+        return (self.finished or time.monotonic()) - self.started
+
+    def get_stats(self) -> Dict[str, Any]:
+        seconds = self.seconds
+        return {
+            'bytes': self.bytes,
+            'seconds': round(seconds, 2),
+            'mbps': round(self.bytes * 8 / seconds / 1000 / 1000, 2) if seconds > 0 else None,
+            'throttled_seconds': round(self.throttled_seconds, 2)
+        }
+
+
+def combined_stats(transfers: List['Transfer']) -> Dict[str, Any]:
+    """Stats of transfers that made up one stage, side by side (a fan-out upload) or one after another
+
+    The rate is the bytes they moved together over the time from the first
+    start to the last finish.
+    """
+    if len(transfers) == 1:
+        return transfers[0].get_stats()
+    nbytes = sum(t.bytes for t in transfers)
+    seconds = max(t.started + t.seconds for t in transfers) - min(t.started for t in transfers)
+    return {
+        'bytes': nbytes,
+        'seconds': round(seconds, 2),
+        'mbps': round(nbytes * 8 / seconds / 1000 / 1000, 2) if seconds > 0 else None,
+        'throttled_seconds': round(sum(t.throttled_seconds for t in transfers), 2),
+        'transfers': len(transfers)
+    }
+
+
+class TransferScheduler:
+    """Shares the link between downloads and uploads
+
+    Every chunk passes through up to three token buckets: its direction's, its
+    storage host's and the global one. Hosts that answer 429 are paused for
+    their Retry-After. Uploads win contended buckets, so a backlog of downloads
+    never holds back the uploads that would complete jobs.
+    """
+
+    def __init__(self, total_mbps: Optional[float] = None, download_mbps: Optional[float] = None,
+                 upload_mbps: Optional[float] = None, host_mbps: Optional[float] = None,
+                 host_limits: Optional[Dict[str, float]] = None):
+        self.total = TokenBucket('total', _rate(total_mbps)) if _rate(total_mbps) else None
+        self.directions = {
+            direction: TokenBucket(direction, _rate(mbps))
+            for direction, mbps in (('download', download_mbps), ('upload', upload_mbps)) if _rate(mbps)
+        }
+        self.host_mbps = host_mbps
+        self.host_limits = host_limits or {}
+        # Created on first use; they exist even without a limit so a 429 can pause the host
+        self.hosts: Dict[str, TokenBucket] = {}
+        self.active: Dict[int, Transfer] = {}
+        # Transfers finished per (job ID, direction) since the queue last collected them
+        self.finished: 'OrderedDict[Tuple[str, str], List[Transfer]]' = OrderedDict()
+        self.bytes_moved = {'download': 0, 'upload': 0}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> 'TransferScheduler':
+        """Build from TRANSFER_MAX_*_MBPS and TRANSFER_HOST_LIMITS ('host=mbps,host=mbps')"""
+        host_limits = {}
+        for item in os.getenv("TRANSFER_HOST_LIMITS", "").split(','):
+            if '=' in item:
+                host, mbps = item.split('=', 1)
+                host_limits[host.strip()] = float(mbps)
+        return cls(
+            total_mbps=float(os.getenv("TRANSFER_MAX_TOTAL_MBPS", "0")),
+            download_mbps=float(os.getenv("TRANSFER_MAX_DOWNLOAD_MBPS", "0")),
+            upload_mbps=float(os.getenv("TRANSFER_MAX_UPLOAD_MBPS", "0")),
+            host_mbps=float(os.getenv("TRANSFER_MAX_HOST_MBPS", "0")),
+            host_limits=host_limits
+        )
+
+    def _host_bucket(self, host: str) -> TokenBucket:
+        with self._lock:
+            bucket = self.hosts.get(host)
+            if bucket is None:
+                bucket = self.hosts[host] = TokenBucket(host, _rate(self.host_limits.get(host, self.host_mbps)))
+            return bucket
+
+    def _count(self, direction: str, nbytes: int):
+        with self._lock:
+            self.bytes_moved[direction] += nbytes
+
+    @contextmanager
+    def transfer(self, direction: str, host: Optional[str], total_bytes: Optional[int] = None):
+        """Register a transfer for the duration of the block; yields the Transfer to consume() through"""
+        # Most specific limit first, so a transfer held back by its host does not tie up global tokens
+        buckets = [self._host_bucket(host)] if host else []
+        if direction in self.directions:
+            buckets.append(self.directions[direction])
+        if self.total:
+            buckets.append(self.total)
+
+        transfer = Transfer(self, direction, host, buckets, total_bytes)
+        with self._lock:
+            self.active[id(transfer)] = transfer
+        try:
+            # No new requests to a paused host
+            for bucket in buckets:
+                transfer.throttled_seconds += bucket.acquire(0, transfer.priority, transfer.cancel_token)
+            yield transfer
+        finally:
+            transfer.finished = time.monotonic()
+            with self._lock:
+                del self.active[id(transfer)]
+                if transfer.job_id:
+                    key = (transfer.job_id, direction)
+                    self.finished[key] = self.finished.pop(key, []) + [transfer]
+                    while len(self.finished) > MAX_FINISHED_STATS:
+                        self.finished.popitem(last=False)
+
+    def throttle(self, host: str, retry_after: Optional[str] = None):
+        """Pause every transfer to a host that answered 429, for its Retry-After (in seconds)"""
+        try:
+            seconds = min(float(retry_after), MAX_RETRY_AFTER) if retry_after else DEFAULT_RETRY_AFTER
+        except ValueError:
+            seconds = DEFAULT_RETRY_AFTER  # HTTP-date form
+        logger.warning(f"Storage host {host} is rate limiting, pausing its transfers for {seconds:.0f}s")
+        self._host_bucket(host).pause(seconds)
+
+    def pop_stats(self, job_id: str, direction: str) -> Optional[Dict[str, Any]]:
+        """Combined stats of a job's transfers in a direction since the last collection (removed once collected)"""
+        with self._lock:
+            transfers = self.finished.pop((job_id, direction), None)
+        return combined_stats(transfers) if transfers else None
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._lock:
+            active = list(self.active.values())
+            hosts = dict(self.hosts)
+            bytes_moved = dict(self.bytes_moved)
+        return {
+            'limits': {
+                'total_mbps': _mbps(self.total.rate) if self.total else None,
+                **{f"{d}_mbps": _mbps(self.directions[d].rate) if d in self.directions else None for d in PRIORITY},
+                'host_mbps': self.host_mbps or None
+            },
+            'buckets': {
+                bucket.name: bucket.get_status()
+                for bucket in [self.total, *self.directions.values(), *hosts.values()] if bucket
+            },
+            'active': [
+                {'job_id': t.job_id, 'direction': t.direction, 'host': t.host,
+                 'total_bytes': t.total_bytes, **t.get_stats()}
+                for t in active
+            ],
+            'bytes_moved': bytes_moved
+        }
+
+# Global instance
+transfer_scheduler = TransferScheduler.from_env()
+
+def get_transfer_status() -> Dict[str, Any]:
+    """Get transfer limits, active transfers and their throughput"""
+    return transfer_scheduler.get_status()
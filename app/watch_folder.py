@@ -0,0 +1,283 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from typing import Dict, List, Optional, Any, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (Length, LastChanged) of a file as the storage listing reports it
+Signature = Tuple[int, str]
+
+
+class FolderWatcher:
+    """Polls source prefixes and queues new or changed videos without anyone picking them
+
+    Every poll lists each folder under the prefixes and compares it with a
+    snapshot of what was already queued, keyed by path, Length and
+    LastChanged. A folder whose listing hashes the same as on the previous
+    poll is not diffed again, so an idle tree costs one listing per folder. A
+    new or changed file is only queued once its size and timestamp have held
+    still for the debounce period, so uploads still in progress are skipped.
+    """
+
+    def __init__(self, prefixes: List[str], interval: float = 60.0, debounce: float = 120.0,
+                 codec: str = 'x265', priority: int = 0, state_path: Optional[str] = None,
+                 ingest_existing: bool = False, concurrency: int = 8):
+        self.prefixes = [p.strip('/') for p in prefixes]
+        self.interval = interval
+        self.debounce = debounce
+        self.codec = codec
+        self.priority = priority
+        self.state_path = state_path
+        self.ingest_existing = ingest_existing
+        self.concurrency = concurrency
+        # folder -> {path: signature} of files already queued (or rejected) at that version
+        self.snapshot: Dict[str, Dict[str, Signature]] = {}
+        self.baselined = False  # Whether the snapshot ever covered the prefixes
+        # path -> (signature, monotonic time it was first seen with it) while debouncing
+        self.settling: Dict[str, Tuple[Signature, float]] = {}
+        self.fingerprints: Dict[str, str] = {}  # folder -> hash of its last listing
+        self.last_poll: Optional[float] = None
+        self.last_poll_seconds: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.queued = 0
+        self.rejected = 0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._load()
+
+    @classmethod
+    def from_env(cls) -> 'FolderWatcher':
+        """Build from WATCH_PREFIXES (comma-separated; empty disables watching) and WATCH_*"""
+        return cls(
+            prefixes=[p for p in os.getenv("WATCH_PREFIXES", "").split(',') if p.strip()],
+            interval=float(os.getenv("WATCH_INTERVAL_SECONDS", "60")),
+            debounce=float(os.getenv("WATCH_DEBOUNCE_SECONDS", "120")),
+            codec=os.getenv("WATCH_CODEC", "x265"),
+            priority=int(os.getenv("WATCH_PRIORITY", "0")),
+            state_path=os.getenv("WATCH_STATE_PATH", "logs/watch_state.json"),
+            ingest_existing=os.getenv("WATCH_INGEST_EXISTING", "false").lower() in ("1", "true", "yes"),
+            concurrency=int(os.getenv("WATCH_LIST_CONCURRENCY", "8"))
+        )
+
+    def _load(self):
+        if not self.state_path or not os.path.exists(self.state_path):
+            return
+        try:
+            with open(self.state_path) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not read watch snapshot {self.state_path}: {e}")
+            return
+        self.snapshot = {
+            folder: {path: (size, changed) for path, (size, changed) in files.items()}
+            for folder, files in data.get('folders', {}).items()
+        }
+        self.baselined = data.get('prefixes') == self.prefixes
+
+    def _save(self):
+        if not self.state_path:
+            return
+        os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+        temp_path = self.state_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({'prefixes': self.prefixes, 'folders': self.snapshot}, f)
+        os.replace(temp_path, self.state_path)
+
+    async def _walk(self) -> Dict[str, List[Dict[str, Any]]]:
+        """List every folder under the prefixes, level by level; returns folder -> video files"""
+        # Import here to avoid circular imports
+        from .bunny_client import list_files
+
+        semaphore = asyncio.Semaphore(max(self.concurrency, 1))
+
+        async def list_folder(folder):
+            async with semaphore:
+                return folder, await list_files(folder)
+
+        listings = {}
+        level = list(self.prefixes)
+        while level:
+            results = await asyncio.gather(*(list_folder(folder) for folder in level))
+            level = []
+            for folder, listing in results:
+                listings[folder] = listing['files']
+                level.extend(d['path'].strip('/') for d in listing['directories'])
+        return listings
+
+    @staticmethod
+    def _fingerprint(files: List[Dict[str, Any]]) -> str:
+        digest = hashlib.sha1()
+        for f in sorted(files, key=lambda f: f['path']):
+            digest.update(f"{f['path']}\0{f['size']}\0{f['last_modified']}\n".encode())
+        return digest.hexdigest()
+
+    def _diff(self, listings: Dict[str, List[Dict[str, Any]]], now: float) -> List[Dict[str, Any]]:
+        """Files that are new or changed since they were queued and have settled"""
+        ready = []
+        for folder, files in listings.items():
+            fingerprint = self._fingerprint(files)
+            pending_here = any(os.path.dirname(path) == folder for path in self.settling)
+            if self.fingerprints.get(folder) == fingerprint and not pending_here:
+                continue
+            self.fingerprints[folder] = fingerprint
+
+            known = self.snapshot.get(folder, {})
+            present = set()
+            for info in files:
+                path = info['path']
+                present.add(path)
+                signature = (info['size'], info['last_modified'])
+                if known.get(path) == signature:
+                    self.settling.pop(path, None)
+                    continue
+                seen = self.settling.get(path)
+                if seen is None or seen[0] != signature:
+                    # New, or still growing: restart its quiet period
+                    self.settling[path] = (signature, now)
+                elif now - seen[1] >= self.debounce and info['size'] > 0:
+                    ready.append(info)
+            # Deleted files are forgotten, so a re-upload under the same name is queued again
+            for path in [p for p in known if p not in present]:
+                del known[path]
+            for path in [p for p in self.settling if os.path.dirname(p) == folder and p not in present]:
+                del self.settling[path]
+
+        # Folders that disappeared
+        for folder in [f for f in self.snapshot if f not in listings]:
+            del self.snapshot[folder]
+            self.fingerprints.pop(folder, None)
+        return ready
+
+    def _record(self, info: Dict[str, Any]):
+        folder = os.path.dirname(info['path'])
+        self.snapshot.setdefault(folder, {})[info['path']] = (info['size'], info['last_modified'])
+        self.settling.pop(info['path'], None)
+
+    async def poll(self) -> int:
+        """List the prefixes once and queue whatever has settled; returns the number of jobs queued"""
+        # Import here to avoid circular imports
+        from .preflight import preflight_sources
+        from .queue_manager import add_encoding_job, encoding_queue
+
+        started = time.monotonic()
+        listings = await self._walk()
+
+        if not self.baselined:
+            self.baselined = True
+            if not self.ingest_existing:
+                # First run: what is already there counts as done
+                for files in listings.values():
+                    for info in files:
+                        self._record(info)
+                self._save()
+                logger.info(f"Watch snapshot initialised with {sum(len(f) for f in listings.values())} "
+                            f"existing file(s) under {', '.join(self.prefixes)}")
+                return 0
+            self._save()
+
+        ready = self._diff(listings, started)
+        # A file whose previous version is still queued or running is picked up once that job is gone
+        active = {job.remote_path for job in list(encoding_queue.jobs.values())}
+        ready = [info for info in ready if info['path'] not in active]
+
+        queued = 0
+        if ready:
+            preflight = await preflight_sources(
+                [info['path'] for info in ready], {info['path']: info['size'] for info in ready}
+            )
+            for info in ready:
+                path = info['path']
+                check = preflight[path]
+                self._record(info)
+                if not check.ok:
+                    self.rejected += 1
+                    logger.warning(f"Watch folder skipped {path}: {check.reason}")
+                    continue
+                filename = os.path.basename(path)
+                add_encoding_job(
+                    f"./input/{filename}", f"./output/{filename.rsplit('.', 1)[0]}.mp4", self.codec,
+                    remote_path=path,
+                    source_size=info['size'],
+                    source_checksum=info.get('checksum'),
+                    media_info=check.media_info(),
+                    priority=self.priority
+                )
+                queued += 1
+            self._save()
+            logger.info(f"Watch folder queued {queued} new or changed file(s)")
+
+        self.queued += queued
+        self.last_poll = time.time()
+        self.last_poll_seconds = round(time.monotonic() - started, 2)
+        return queued
+
+    def start(self):
+        """Poll in a daemon thread; does nothing without prefixes"""
+        if not self.prefixes or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="watch-folder", daemon=True)
+        self._thread.start()
+        logger.info(f"Watching {', '.join(self.prefixes)} every {self.interval:.0f}s")
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def scan_now(self):
+        """Poll immediately instead of at the next interval"""
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                asyncio.run(self.poll())
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"Watch folder poll failed: {e}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def get_status(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            'enabled': bool(self.prefixes),
+            'prefixes': self.prefixes,
+            'interval_seconds': self.interval,
+            'debounce_seconds': self.debounce,
+            'codec': self.codec,
+            'priority': self.priority,
+            'folders': len(self.fingerprints),
+            'tracked_files': sum(len(files) for files in self.snapshot.values()),
+            'settling': [
+                {'path': path, 'size': signature[0], 'quiet_seconds': round(now - since, 1)}
+                for path, (signature, since) in list(self.settling.items())
+            ],
+            'queued': self.queued,
+            'rejected': self.rejected,
+            'last_poll': self.last_poll,
+            'last_poll_seconds': self.last_poll_seconds,
+            'last_error': self.last_error
+        }
+
+# Global instance
+folder_watcher = FolderWatcher.from_env()
+
+def start_folder_watcher():
+    """Start polling the watched source prefixes"""
+    folder_watcher.start()
+
+def get_watch_status() -> Dict[str, Any]:
+    """Get watched prefixes, files waiting out the debounce and poll statistics"""
+    return folder_watcher.get_status()
+
+def scan_watch_folders():
+    """Poll the watched prefixes now"""
+    folder_watcher.scan_now()
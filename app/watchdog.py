@@ -0,0 +1,160 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from .cancellation import JobCancelled
+
+logger = logging.getLogger(__name__)
+
+
+class TransferAborted(Exception):
+    """Raised inside a transfer thread when the watchdog gives up on the attempt"""
+
+
+class StageFailed(Exception):
+    """A pipeline stage failed on every attempt"""
+
+
+class ProgressTracker:
+    """Progress of one attempt at one stage; updated from any thread"""
+
+    def __init__(self, job_id: str, stage: str, attempt: int):
+        self.job_id = job_id
+        self.stage = stage
+        self.attempt = attempt
+        self.value = 0.0
+        self.last_advance = time.monotonic()
+        self.abort_reason: Optional[str] = None
+        self._abort = threading.Event()
+        self._threads = 0
+        self._threads_lock = threading.Lock()
+
+    def update(self, value: float):
+        """Record progress (output seconds or bytes); raises once the attempt was aborted"""
+        if self._abort.is_set():
+            raise TransferAborted(self.abort_reason or "Aborted")
+        if value > self.value:
+            self.value = value
+            self.last_advance = time.monotonic()
+
+    def stalled_for(self) -> float:
+        return time.monotonic() - self.last_advance
+
+    def abort(self, reason: str):
+        self.abort_reason = reason
+        self._abort.set()
+
+    @property
+    def aborted(self) -> bool:
+        return self._abort.is_set()
+
+
+class StallWatchdog:
+    def __init__(self, stall_timeout: float = 120.0, max_attempts: int = 3,
+                 backoff_seconds: float = 10.0, poll_interval: float = 1.0):
+        self.stall_timeout = stall_timeout
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.poll_interval = poll_interval
+        self.trackers: Dict[str, ProgressTracker] = {}
+
+    @classmethod
+    def from_env(cls) -> 'StallWatchdog':
+        """Build the watchdog from STALL_TIMEOUT_SECONDS, STAGE_MAX_ATTEMPTS and RETRY_BACKOFF_SECONDS"""
+        return cls(
+            stall_timeout=float(os.getenv("STALL_TIMEOUT_SECONDS", "120")),
+            max_attempts=int(os.getenv("STAGE_MAX_ATTEMPTS", "3")),
+            backoff_seconds=float(os.getenv("RETRY_BACKOFF_SECONDS", "10"))
+        )
+
+    async def run_in_thread(self, tracker: ProgressTracker, func: Callable, *args,
+                            on_progress: Optional[Callable[[float], None]] = None, **kwargs) -> Any:
+        """Run a blocking transfer in the default executor, reporting progress to the tracker"""
+        def progress_callback(value):
+            tracker.update(value)
+            if on_progress:
+                on_progress(value)
+
+        def run():
+            with tracker._threads_lock:
+                tracker._threads += 1
+            try:
+                return func(*args, progress_callback=progress_callback, **kwargs)
+            finally:
+                with tracker._threads_lock:
+                    tracker._threads -= 1
+
+        return await asyncio.to_thread(run)
+
+    async def _stop_attempt(self, task: asyncio.Task, tracker: ProgressTracker, reason: str):
+        """Abort a stalled attempt and wait (bounded) for its transfer thread to let go of files"""
+        tracker.abort(reason)
+        task.cancel()
+        try:
+            await task
+        except BaseException:
+            pass
+
+        # Threads notice the abort on their next chunk, or when their socket read times out
+        deadline = time.monotonic() + self.stall_timeout
+        while tracker._threads and time.monotonic() < deadline:
+            await asyncio.sleep(0.5)
+
+    async def run_stage(self, job_id: str, stage: str,
+                        attempt_factory: Callable[[ProgressTracker], Awaitable[Any]],
+                        retry_on_error: bool = True,
+                        on_retry: Optional[Callable[[int, str], None]] = None) -> Any:
+        """Run a stage, restarting it with backoff when it stops making progress"""
+        reason = None
+        for attempt in range(1, self.max_attempts + 1):
+            tracker = ProgressTracker(job_id, stage, attempt)
+            self.trackers[job_id] = tracker
+            task = asyncio.create_task(attempt_factory(tracker))
+            try:
+                while True:
+                    done, _ = await asyncio.wait({task}, timeout=self.poll_interval)
+                    if done:
+                        return task.result()
+                    if tracker.stalled_for() > self.stall_timeout:
+                        reason = f"no progress for {int(tracker.stalled_for())}s"
+                        logger.warning(f"Job {job_id} {stage} stalled ({reason}), attempt {attempt}/{self.max_attempts}")
+                        await self._stop_attempt(task, tracker, reason)
+                        break
+            except (asyncio.CancelledError, JobCancelled):
+                # The job itself was cancelled: never retried
+                tracker.abort("Cancelled")
+                task.cancel()
+                raise
+            except Exception as e:
+                if not retry_on_error:
+                    raise
+                reason = str(e)
+                logger.warning(f"Job {job_id} {stage} failed ({reason}), attempt {attempt}/{self.max_attempts}")
+            finally:
+                if self.trackers.get(job_id) is tracker:
+                    del self.trackers[job_id]
+
+            if attempt < self.max_attempts:
+                if on_retry:
+                    on_retry(attempt, reason)
+                await asyncio.sleep(self.backoff_seconds * 2 ** (attempt - 1))
+
+        raise StageFailed(f"{stage.capitalize()} failed after {self.max_attempts} attempts: {reason}")
+
+    def get_status(self) -> Dict[str, Any]:
+        """Get per-job stage progress as seen by the watchdog"""
+        return {
+            job_id: {
+                'stage': tracker.stage,
+                'attempt': tracker.attempt,
+                'progress': tracker.value,
+                'idle_seconds': round(tracker.stalled_for(), 1)
+            }
+            for job_id, tracker in list(self.trackers.items())
+        }
+
+# Global instance
+stall_watchdog = StallWatchdog.from_env()
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+Load test for the HTTP API and dashboard endpoints.
+
+Runs the real FastAPI app in a child process against an in-process Bunny storage
+stand-in (benchmarks.fake_bunny), seeds a synthetic job history, then simulates
+operators with the same request pattern as the UI:
+
+  logs       GET /logs, then poll /api/queue/status + /api/queue/logs (logs.html)
+  archive    like logs, with the archived history shown
+  dashboard  GET /, then navigate folders through /browse (dashboard.html)
+  mixed      half of each
+
+    python -m benchmarks.api_load --scenario mixed --clients 50 --history 5000 \\
+        --duration 30 --report api.json
+
+Reports p50/p99 latency per endpoint, event-loop lag inside the server and
+server CPU time per request (including subprocesses such as nvidia-smi).
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+
+from .fake_bunny import FakeBunnyServer, FakeBunnyStorage, FaultConfig
+from .pipeline_load import ACCESS_KEY, DEST_ZONE, SOURCE_ZONE, configure_environment, summarize
+
+logger = logging.getLogger(__name__)
+
+# How often logs.html refreshes
+LOGS_POLL_INTERVAL = 2.0
+# Think time between folder clicks on the dashboard
+BROWSE_INTERVAL = 5.0
+# Event-loop lag probe period inside the server
+LAG_PROBE_INTERVAL = 0.05
+
+
+def seed_storage(storage: FakeBunnyStorage, folders: int, files_per_folder: int) -> List[str]:
+    """Create a folder tree of small placeholder videos and return the folder paths"""
+    paths = ['']
+    for i in range(folders):
+        folder = f"shows/season_{i:03d}"
+        paths.append(folder)
+        for j in range(files_per_folder):
+            storage.put_local_file(SOURCE_ZONE, f"{folder}/episode_{j:04d}.mp4", b'\0' * 1024)
+    return paths
+
+
+def seed_history(queue, history: int):
+    """Fill the queue's history (window and archive) with finished jobs that look like real ones"""
+    from datetime import datetime, timedelta
+    from app.queue_manager import EncodingJob, JobStatus
+
+    now = datetime.now()
+    statuses = [JobStatus.COMPLETED] * 8 + [JobStatus.FAILED, JobStatus.CANCELLED]
+    for i in range(history):
+        created = now - timedelta(minutes=history - i)
+        status = random.choice(statuses)
+        job = EncodingJob(
+            id=f"{i:08d}-0000-4000-8000-{random.getrandbits(48):012x}",
+            input_file=f"./input/episode_{i:05d}.mkv",
+            output_file=f"./output/episode_{i:05d}.mp4",
+            codec=random.choice(['hevc_nvenc', 'h264_nvenc', 'x265']),
+            status=status,
+            created_at=created,
+            started_at=created + timedelta(seconds=5),
+            completed_at=created + timedelta(seconds=50),
+            progress={'frame': 9000, 'fps': 180.0, 'time': '00:05:00.00', 'speed': '6.0x'},
+            error_message="Encoding failed: FFmpeg exited with code 1" if status == JobStatus.FAILED else None,
+            file_size_before=random.randint(200, 2000) * 1024 * 1024,
+            file_size_after=random.randint(50, 400) * 1024 * 1024,
+            remote_path=f"shows/episode_{i:05d}.mkv",
+            checkpoints=['downloaded', 'encoded', 'uploaded'] if status == JobStatus.COMPLETED else ['downloaded'],
+            source_sha256=f"{random.getrandbits(256):064x}",
+            stage_timings={'download': [0.0, 5.0], 'encode': [5.0, 45.0], 'upload': [45.0, 50.0]}
+        )
+        queue.history.add(job)
+
+
+def serve(args):
+    """Child process: run the app with a seeded history and an event-loop lag probe"""
+    os.makedirs("logs", exist_ok=True)
+    configure_environment(args.storage_host, args.staging_root)
+
+    import uvicorn
+    from app.main import app
+    from app.queue_manager import encoding_queue
+
+    seed_history(encoding_queue, args.history)
+    lag_samples: List[float] = []
+
+    async def probe_lag():
+        while True:
+            expected = time.perf_counter() + LAG_PROBE_INTERVAL
+            await asyncio.sleep(LAG_PROBE_INTERVAL)
+            lag_samples.append(max(time.perf_counter() - expected, 0.0))
+
+    @app.on_event("startup")
+    async def start_lag_probe():
+        asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, lag_samples.clear)
+        asyncio.create_task(probe_lag())
+
+    @app.on_event("shutdown")
+    async def write_stats():
+        with open(args.stats_file, 'w') as f:
+            json.dump({'lag_samples': lag_samples}, f)
+
+    uvicorn.run(app, host='127.0.0.1', port=args.port, log_level='warning', access_log=False)
+
+
+def process_cpu_seconds(pid: int) -> Optional[float]:
+    """User + system CPU of a process and its waited-for children, from /proc (Linux)"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # Fields after the parenthesised command name; utime is field 14
+            fields = f.read().rsplit(')', 1)[1].split()
+        ticks = sum(int(value) for value in fields[11:15])
+        return ticks / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class LoadClient:
+    """One simulated operator with its own connection pool"""
+
+    def __init__(self, base_url: str, folders: List[str], results: Dict[str, List[float]],
+                 errors: Dict[str, int], poll_interval: float, browse_interval: float):
+        self.base_url = base_url
+        self.folders = folders
+        self.results = results
+        self.errors = errors
+        self.poll_interval = poll_interval
+        self.browse_interval = browse_interval
+        self.archived = False
+
+    async def request(self, session: aiohttp.ClientSession, label: str, path: str):
+        started = time.perf_counter()
+        try:
+            async with session.get(self.base_url + path) as response:
+                await response.read()
+                if response.status >= 400:
+                    self.errors[label] = self.errors.get(label, 0) + 1
+                    return
+        except aiohttp.ClientError:
+            self.errors[label] = self.errors.get(label, 0) + 1
+            return
+        self.results.setdefault(label, []).append(time.perf_counter() - started)
+
+    async def run_logs(self, session: aiohttp.ClientSession, deadline: float):
+        await self.request(session, 'GET /logs', '/logs')
+        while time.monotonic() < deadline:
+            await self.request(session, 'GET /api/queue/status', '/api/queue/status')
+            if self.archived:
+                await self.request(session, 'GET /api/queue/logs?archived', '/api/queue/logs?archived=true')
+            else:
+                await self.request(session, 'GET /api/queue/logs', '/api/queue/logs')
+            await asyncio.sleep(self.poll_interval)
+
+    async def run_dashboard(self, session: aiohttp.ClientSession, deadline: float):
+        await self.request(session, 'GET /', '/')
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.browse_interval)
+            folder = random.choice(self.folders)
+            await self.request(session, 'GET /browse', f"/browse?path={folder}")
+
+    async def run(self, scenario: str, deadline: float):
+        # Spread client start times so polls do not arrive in lockstep
+        await asyncio.sleep(random.uniform(0, max(self.poll_interval, 0.1)))
+        async with aiohttp.ClientSession() as session:
+            if scenario in ('logs', 'archive'):
+                self.archived = scenario == 'archive'
+                await self.run_logs(session, deadline)
+            else:
+                await self.run_dashboard(session, deadline)
+
+
+async def drive_load(args, base_url: str, folders: List[str]) -> Dict[str, Any]:
+    results: Dict[str, List[float]] = {}
+    errors: Dict[str, int] = {}
+    deadline = time.monotonic() + args.duration
+
+    clients = []
+    for i in range(args.clients):
+        scenario = args.scenario
+        if scenario == 'mixed':
+            scenario = 'logs' if i % 2 == 0 else 'dashboard'
+        client = LoadClient(base_url, folders, results, errors, args.poll_interval, args.browse_interval)
+        clients.append(client.run(scenario, deadline))
+
+    started = time.monotonic()
+    await asyncio.gather(*clients)
+    return {'results': results, 'errors': errors, 'elapsed': time.monotonic() - started}
+
+
+async def wait_until_ready(base_url: str, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(base_url + '/health') as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+    raise Exception(f"Server at {base_url} did not become ready within {timeout}s")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def run(args) -> Dict[str, Any]:
+    work_dir = tempfile.mkdtemp(prefix='encoder-api-load-')
+    storage = FakeBunnyStorage(
+        os.path.join(work_dir, 'storage'),
+        FaultConfig(latency_ms=args.storage_latency_ms,
+                    access_keys={SOURCE_ZONE: ACCESS_KEY, DEST_ZONE: ACCESS_KEY})
+    )
+    folders = seed_storage(storage, args.folders, args.files_per_folder)
+    server = FakeBunnyServer(storage).start()
+
+    port = free_port()
+    stats_file = os.path.join(work_dir, 'server_stats.json')
+    staging_root = os.path.join(work_dir, 'staging')
+    os.makedirs(staging_root)
+    child = subprocess.Popen([
+        sys.executable, '-m', 'benchmarks.api_load', '--serve',
+        '--port', str(port), '--history', str(args.history),
+        '--storage-host', server.address, '--staging-root', staging_root, '--stats-file', stats_file
+    ])
+    base_url = f"http://127.0.0.1:{port}"
+
+    try:
+        asyncio.run(wait_until_ready(base_url))
+        print(f"Server ready with {args.history} jobs in history; "
+              f"{args.clients} '{args.scenario}' clients for {args.duration}s...")
+
+        # Only measure the load phase: reset the lag probe and snapshot CPU
+        os.kill(child.pid, signal.SIGUSR1)
+        cpu_before = process_cpu_seconds(child.pid)
+        load = asyncio.run(drive_load(args, base_url, folders))
+        cpu_after = process_cpu_seconds(child.pid)
+    finally:
+        child.send_signal(signal.SIGTERM)
+        try:
+            child.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            child.kill()
+        server.stop()
+
+    lag_samples = []
+    if os.path.exists(stats_file):
+        with open(stats_file) as f:
+            lag_samples = json.load(f)['lag_samples']
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+    requests_done = sum(len(v) for v in load['results'].values())
+    cpu_seconds = cpu_after - cpu_before if cpu_before is not None and cpu_after is not None else None
+    return {
+        'config': {
+            'scenario': args.scenario,
+            'clients': args.clients,
+            'history': args.history,
+            'duration': args.duration,
+            'poll_interval': args.poll_interval,
+            'browse_interval': args.browse_interval,
+            'folders': args.folders,
+            'files_per_folder': args.files_per_folder,
+            'storage_latency_ms': args.storage_latency_ms
+        },
+        'requests': requests_done,
+        'requests_per_second': round(requests_done / load['elapsed'], 2) if load['elapsed'] else 0.0,
+        'errors': load['errors'],
+        'endpoints': {
+            label: dict(summarize([v * 1000 for v in values]), count=len(values))
+            for label, values in sorted(load['results'].items())
+        },
+        'event_loop_lag_ms': summarize([v * 1000 for v in lag_samples]),
+        'server_cpu_seconds': round(cpu_seconds, 3) if cpu_seconds is not None else None,
+        'cpu_ms_per_request': round(cpu_seconds * 1000 / requests_done, 3) if cpu_seconds is not None and requests_done else None
+    }
+
+
+def print_report(report: Dict[str, Any]):
+    print(f"{report['requests']} requests, {report['requests_per_second']} req/s, errors: {report['errors'] or 'none'}")
+    print(f"{'endpoint':<26}{'count':>8}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for label, stats in report['endpoints'].items():
+        print(f"{label:<26}{stats['count']:>8}{stats['p50']:>10}{stats['p99']:>10}{stats['max']:>10}")
+    lag = report['event_loop_lag_ms']
+    print(f"Event-loop lag: p50 {lag['p50']} ms  p99 {lag['p99']} ms  max {lag['max']} ms")
+    if report['cpu_ms_per_request'] is not None:
+        print(f"Server CPU: {report['server_cpu_seconds']}s total, {report['cpu_ms_per_request']} ms/request")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP API and dashboard load test")
+    parser.add_argument('--scenario', default='mixed', choices=['logs', 'archive', 'dashboard', 'mixed'])
+    parser.add_argument('--clients', type=int, default=20)
+    parser.add_argument('--history', type=int, default=1000, help="Finished jobs seeded into the queue")
+    parser.add_argument('--duration', type=float, default=30.0)
+    parser.add_argument('--poll-interval', type=float, default=LOGS_POLL_INTERVAL,
+                        help="Seconds between status polls (0 = as fast as possible)")
+    parser.add_argument('--browse-interval', type=float, default=BROWSE_INTERVAL)
+    parser.add_argument('--folders', type=int, default=20)
+    parser.add_argument('--files-per-folder', type=int, default=50)
+    parser.add_argument('--storage-latency-ms', type=float, default=20.0)
+    parser.add_argument('--report', help="Write the report as JSON to this path")
+    # Internal: child server process
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--storage-host', help=argparse.SUPPRESS)
+    parser.add_argument('--staging-root', help=argparse.SUPPRESS)
+    parser.add_argument('--stats-file', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    report = run(args)
+    print_report(report)
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Local Bunny storage stand-in for offline testing and benchmarks.
+
+Implements the subset of the Bunny Storage API used by app/bunny_client.py:
+directory listing JSON, GET (with Range), PUT (with the Checksum header) and
+DELETE, backed by a local directory with one sub-directory per storage zone.
+Latency, bandwidth and failures can be injected to reproduce bad days.
+
+    python -m benchmarks.fake_bunny --root /tmp/fake-bunny --port 8089 \\
+        --latency-ms 40 --bandwidth-mbps 400 --failure-rate 0.02
+
+Point the client at it with BUNNY_STORAGE_SCHEME=http and
+SOURCE_/DEST_BUNNY_STORAGE_HOST=127.0.0.1:8089.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+
+@dataclass
+class FaultConfig:
+    latency_ms: float = 0.0  # Added before every response
+    bandwidth_mbps: float = 0.0  # Per-transfer throughput cap, 0 = unlimited
+    failure_rate: float = 0.0  # Probability of answering 503 instead of serving
+    stall_rate: float = 0.0  # Probability of a GET hanging forever halfway through
+    truncate_rate: float = 0.0  # Probability of a GET closing the connection halfway through
+    access_keys: Dict[str, str] = field(default_factory=dict)  # zone -> required AccessKey
+
+
+@dataclass
+class FakeStorageStats:
+    requests: int = 0
+    injected_failures: int = 0
+    bytes_served: int = 0
+    bytes_received: int = 0
+
+
+class FakeBunnyStorage:
+    def __init__(self, root: str, faults: Optional[FaultConfig] = None):
+        self.root = os.path.abspath(root)
+        self.faults = faults or FaultConfig()
+        self.stats = FakeStorageStats()
+        os.makedirs(self.root, exist_ok=True)
+
+        self.app = web.Application(client_max_size=0)
+        self.app.router.add_route('GET', '/{zone}/{path:.*}', self.handle_get)
+        self.app.router.add_route('PUT', '/{zone}/{path:.*}', self.handle_put)
+        self.app.router.add_route('DELETE', '/{zone}/{path:.*}', self.handle_delete)
+
+    def _local_path(self, zone: str, path: str) -> str:
+        local = os.path.abspath(os.path.join(self.root, zone, path))
+        if not local.startswith(os.path.join(self.root, zone)):
+            raise web.HTTPBadRequest(text="Invalid path")
+        return local
+
+    async def _before_request(self, request: web.Request):
+        """Apply auth, latency and injected failures shared by every route"""
+        self.stats.requests += 1
+        zone = request.match_info['zone']
+        required_key = self.faults.access_keys.get(zone)
+        if required_key and request.headers.get('AccessKey') != required_key:
+            raise web.HTTPUnauthorized(text='{"HttpCode":401,"Message":"Unauthorized"}',
+                                       content_type='application/json')
+        if self.faults.latency_ms:
+            await asyncio.sleep(self.faults.latency_ms / 1000)
+        if random.random() < self.faults.failure_rate:
+            self.stats.injected_failures += 1
+            raise web.HTTPServiceUnavailable(text="Injected failure")
+
+    async def _throttle(self, started: float, transferred: int):
+        """Sleep long enough to keep a transfer under the bandwidth cap"""
+        if not self.faults.bandwidth_mbps:
+            return
+        expected = transferred * 8 / (self.faults.bandwidth_mbps * 1_000_000)
+        elapsed = time.monotonic() - started
+        if expected > elapsed:
+            await asyncio.sleep(expected - elapsed)
+
+    @staticmethod
+    def _checksum(path: str) -> Optional[str]:
+        sidecar = path + '.sha256'
+        if os.path.exists(sidecar):
+            with open(sidecar) as f:
+                return f.read().strip()
+        return None
+
+    def _describe(self, zone: str, directory: str, name: str) -> Dict:
+        """Listing entry in Bunny's format"""
+        full_path = os.path.join(directory, name)
+        stat = os.stat(full_path)
+        relative_dir = os.path.relpath(directory, os.path.join(self.root, zone))
+        is_directory = os.path.isdir(full_path)
+        return {
+            'Guid': str(uuid.uuid5(uuid.NAMESPACE_URL, full_path)),
+            'StorageZoneName': zone,
+            'Path': f"/{zone}/" + ('' if relative_dir == '.' else relative_dir + '/'),
+            'ObjectName': name,
+            'Length': 0 if is_directory else stat.st_size,
+            'LastChanged': datetime.fromtimestamp(stat.st_mtime, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3],
+            'IsDirectory': is_directory,
+            'Checksum': None if is_directory else self._checksum(full_path),
+            'DateCreated': datetime.fromtimestamp(stat.st_ctime, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3]
+        }
+
+    async def handle_get(self, request: web.Request) -> web.StreamResponse:
+        await self._before_request(request)
+        zone, path = request.match_info['zone'], request.match_info['path']
+        local = self._local_path(zone, path)
+
+        # A trailing slash (or the zone root) lists a directory
+        if path == '' or path.endswith('/'):
+            if not os.path.isdir(local):
+                return web.json_response([])
+            entries = [
+                self._describe(zone, local, name)
+                for name in sorted(os.listdir(local)) if not name.endswith('.sha256')
+            ]
+            return web.json_response(entries)
+
+        if not os.path.isfile(local):
+            raise web.HTTPNotFound(text='{"HttpCode":404,"Message":"Object Not Found"}',
+                                   content_type='application/json')
+
+        size = os.path.getsize(local)
+        start, end = 0, size - 1
+        status = 200
+        range_header = request.headers.get('Range')
+        if range_header and range_header.startswith('bytes='):
+            first, _, last = range_header[6:].split(',')[0].partition('-')
+            if first:
+                start = int(first)
+                end = min(int(last), size - 1) if last else size - 1
+            else:
+                # Suffix range: the last N bytes
+                start = max(size - int(last), 0)
+            if start > end or start >= size:
+                raise web.HTTPRequestRangeNotSatisfiable(headers={'Content-Range': f"bytes */{size}"})
+            status = 206
+
+        response = web.StreamResponse(status=status, headers={
+            'Content-Length': str(end - start + 1),
+            'Content-Type': 'application/octet-stream',
+            'Accept-Ranges': 'bytes'
+        })
+        if status == 206:
+            response.headers['Content-Range'] = f"bytes {start}-{end}/{size}"
+        await response.prepare(request)
+
+        stall = random.random() < self.faults.stall_rate
+        truncate = random.random() < self.faults.truncate_rate
+        halfway = start + (end - start + 1) // 2
+        started = time.monotonic()
+        sent = 0
+        with open(local, 'rb') as f:
+            f.seek(start)
+            position = start
+            while position <= end:
+                if (stall or truncate) and position >= halfway:
+                    self.stats.injected_failures += 1
+                    if stall:
+                        await asyncio.sleep(3600)
+                    request.transport.close()
+                    return response
+                chunk = f.read(min(CHUNK_SIZE, end - position + 1))
+                if not chunk:
+                    break
+                await response.write(chunk)
+                position += len(chunk)
+                sent += len(chunk)
+                self.stats.bytes_served += len(chunk)
+                await self._throttle(started, sent)
+
+        await response.write_eof()
+        return response
+
+    async def handle_put(self, request: web.Request) -> web.Response:
+        await self._before_request(request)
+        zone, path = request.match_info['zone'], request.match_info['path']
+        local = self._local_path(zone, path)
+        os.makedirs(os.path.dirname(local), exist_ok=True)
+
+        sha256 = hashlib.sha256()
+        partial = local + '.uploading'
+        started = time.monotonic()
+        received = 0
+        with open(partial, 'wb') as f:
+            async for chunk in request.content.iter_chunked(CHUNK_SIZE):
+                f.write(chunk)
+                sha256.update(chunk)
+                received += len(chunk)
+                self.stats.bytes_received += len(chunk)
+                await self._throttle(started, received)
+
+        digest = sha256.hexdigest().upper()
+        expected = request.headers.get('Checksum')
+        if expected and expected.upper() != digest:
+            os.remove(partial)
+            return web.json_response({'HttpCode': 400, 'Message': 'Checksum mismatch'}, status=400)
+
+        os.replace(partial, local)
+        with open(local + '.sha256', 'w') as f:
+            f.write(digest)
+        return web.json_response({'HttpCode': 201, 'Message': 'File uploaded.'}, status=201)
+
+    async def handle_delete(self, request: web.Request) -> web.Response:
+        await self._before_request(request)
+        local = self._local_path(request.match_info['zone'], request.match_info['path'])
+        if not os.path.exists(local):
+            raise web.HTTPNotFound(text='{"HttpCode":404,"Message":"Object Not Found"}',
+                                   content_type='application/json')
+        os.remove(local)
+        if os.path.exists(local + '.sha256'):
+            os.remove(local + '.sha256')
+        return web.json_response({'HttpCode': 200, 'Message': 'File deleted successfuly.'})
+
+    def put_local_file(self, zone: str, path: str, data: bytes):
+        """Seed the store directly (with its checksum) without going through HTTP"""
+        local = self._local_path(zone, path)
+        os.makedirs(os.path.dirname(local), exist_ok=True)
+        with open(local, 'wb') as f:
+            f.write(data)
+        with open(local + '.sha256', 'w') as f:
+            f.write(hashlib.sha256(data).hexdigest().upper())
+
+
+class FakeBunnyServer:
+    """Runs the fake storage on its own event loop thread, for use inside other programs"""
+
+    def __init__(self, storage: FakeBunnyStorage, host: str = '127.0.0.1', port: int = 0):
+        self.storage = storage
+        self.host = host
+        self.port = port
+        self._loop = None
+        self._runner = None
+        self._ready = threading.Event()
+        self._thread = None
+
+    @property
+    def address(self) -> str:
+        return f"{self.host}:{self.port}"
+
+    def start(self) -> 'FakeBunnyServer':
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self._ready.wait(timeout=10)
+        return self
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._runner = web.AppRunner(self.storage.app, access_log=None)
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, self.host, self.port)
+        self._loop.run_until_complete(site.start())
+        self.port = site._server.sockets[0].getsockname()[1]
+        self._ready.set()
+        self._loop.run_forever()
+
+    def stop(self):
+        if self._loop:
+            asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result(timeout=10)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Bunny storage stand-in")
+    parser.add_argument('--root', default='./fake-bunny', help="Directory holding one folder per storage zone")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--bandwidth-mbps', type=float, default=0.0)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--stall-rate', type=float, default=0.0)
+    parser.add_argument('--truncate-rate', type=float, default=0.0)
+    parser.add_argument('--access-key', action='append', default=[], metavar='ZONE=KEY',
+                        help="Require an AccessKey for a zone (repeatable)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    faults = FaultConfig(
+        latency_ms=args.latency_ms,
+        bandwidth_mbps=args.bandwidth_mbps,
+        failure_rate=args.failure_rate,
+        stall_rate=args.stall_rate,
+        truncate_rate=args.truncate_rate,
+        access_keys=dict(entry.split('=', 1) for entry in args.access_key)
+    )
+    storage = FakeBunnyStorage(args.root, faults)
+    logger.info(f"Fake Bunny storage serving {storage.root} on http://{args.host}:{args.port}")
+    web.run_app(storage.app, host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
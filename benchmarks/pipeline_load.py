@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+End-to-end pipeline load test against the local Bunny storage stand-in.
+
+Starts benchmarks.fake_bunny in-process, seeds the source zone with N copies of
+a synthetic clip, pushes them through the real JobQueue (download -> encode ->
+upload) and reports throughput, per-stage utilization and latency percentiles.
+
+    python -m benchmarks.pipeline_load --jobs 20 --parallel 2 --codec x265 \\
+        --latency-ms 30 --bandwidth-mbps 200 --failure-rate 0.01 --report load.json
+
+Requires ffmpeg/ffprobe on PATH (or --source pointing at an existing clip).
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+from .fake_bunny import FakeBunnyServer, FakeBunnyStorage, FaultConfig
+
+SOURCE_ZONE = "source-zone"
+DEST_ZONE = "dest-zone"
+ACCESS_KEY = "load-test-key"
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile (0 for an empty list)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        'p50': round(percentile(values, 50), 3),
+        'p90': round(percentile(values, 90), 3),
+        'p99': round(percentile(values, 99), 3),
+        'max': round(max(values), 3) if values else 0.0
+    }
+
+
+def make_synthetic_source(path: str, duration: float, resolution: str):
+    """Render a test pattern with audio, so the encode does representative work"""
+    cmd = [
+        'ffmpeg', '-hide_banner', '-loglevel', 'error', '-y',
+        '-f', 'lavfi', '-i', f"testsrc2=size={resolution}:rate=30:duration={duration}",
+        '-f', 'lavfi', '-i', f"sine=frequency=440:duration={duration}",
+        '-c:v', 'libx264', '-preset', 'ultrafast', '-crf', '18',
+        '-c:a', 'aac', '-shortest', path
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0 or not os.path.exists(path):
+        raise Exception(f"Could not generate synthetic source: {result.stderr.strip()[-300:]}")
+
+
+def configure_environment(address: str, staging_root: str):
+    """Point the app at the fake storage before any app module reads its configuration"""
+    os.environ.update({
+        'BUNNY_STORAGE_SCHEME': 'http',
+        'SOURCE_BUNNY_API_KEY': ACCESS_KEY,
+        'SOURCE_BUNNY_STORAGE_ZONE': SOURCE_ZONE,
+        'SOURCE_BUNNY_STORAGE_HOST': address,
+        'DEST_BUNNY_API_KEY': ACCESS_KEY,
+        'DEST_BUNNY_STORAGE_ZONE': DEST_ZONE,
+        'DEST_BUNNY_STORAGE_HOST': address,
+        'STAGING_VOLUMES': staging_root,
+        'STAGING_HEADROOM': '0',
+        'JOB_ARCHIVE_PATH': os.path.join(os.path.dirname(staging_root), 'job_history.jsonl')
+    })
+    # Short backoffs keep injected failures from dominating the run; still overridable
+    os.environ.setdefault('RETRY_BACKOFF_SECONDS', '1')
+    os.environ.setdefault('STALL_TIMEOUT_SECONDS', '30')
+
+
+def run_load(args) -> Dict[str, Any]:
+    work_dir = tempfile.mkdtemp(prefix='encoder-load-')
+    storage_root = os.path.join(work_dir, 'storage')
+    staging_root = os.path.join(work_dir, 'staging')
+    os.makedirs(staging_root)
+
+    faults = FaultConfig(
+        latency_ms=args.latency_ms,
+        bandwidth_mbps=args.bandwidth_mbps,
+        failure_rate=args.failure_rate,
+        stall_rate=args.stall_rate,
+        truncate_rate=args.truncate_rate,
+        access_keys={SOURCE_ZONE: ACCESS_KEY, DEST_ZONE: ACCESS_KEY}
+    )
+    storage = FakeBunnyStorage(storage_root, faults)
+    server = FakeBunnyServer(storage).start()
+    configure_environment(server.address, staging_root)
+
+    # Imported late: these modules read their configuration at import time
+    from app.queue_manager import JobQueue
+
+    try:
+        source = args.source
+        if not source:
+            source = os.path.join(work_dir, 'synthetic.mp4')
+            print(f"Generating {args.duration}s {args.resolution} synthetic source...")
+            make_synthetic_source(source, args.duration, args.resolution)
+        with open(source, 'rb') as f:
+            data = f.read()
+
+        jobs = []
+        for i in range(args.jobs):
+            name = f"load/clip_{i:04d}.mp4"
+            storage.put_local_file(SOURCE_ZONE, name, data)
+            jobs.append(name)
+
+        queue = JobQueue(max_concurrent_jobs=args.parallel)
+        print(f"Running {args.jobs} jobs ({len(data) / 1024 / 1024:.1f} MB each), {args.parallel} in parallel...")
+        started = time.time()
+        for name in jobs:
+            queue.add_job(
+                f"./input/{os.path.basename(name)}", f"./output/{os.path.basename(name)}", args.codec,
+                remote_path=name, source_size=len(data),
+                source_checksum=storage._checksum(os.path.join(storage_root, SOURCE_ZONE, name))
+            )
+
+        # Finished jobs leave queue.jobs for the history
+        while queue.jobs:
+            if args.timeout and time.time() - started > args.timeout:
+                print("Timed out waiting for jobs", file=sys.stderr)
+                break
+            time.sleep(0.5)
+            print(f"\r  {args.jobs - len(queue.jobs)}/{args.jobs} finished", end='', flush=True)
+        print()
+        wall = time.time() - started
+        queue.stop_processing()
+
+        return build_report(queue.history.query(limit=args.jobs), wall, args, storage, len(data))
+    finally:
+        server.stop()
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def build_report(jobs, wall: float, args, storage: FakeBunnyStorage, source_bytes: int) -> Dict[str, Any]:
+    """Summarise the finished JobRecords of a run"""
+    from app.queue_manager import JobStatus
+
+    completed = [j for j in jobs if j.status == JobStatus.COMPLETED]
+    latencies = [j.completed_at - j.created_at for j in completed if j.completed_at]
+    queue_waits = [j.started_at - j.created_at for j in completed if j.started_at]
+
+    stage_durations: Dict[str, List[float]] = {}
+    for job in jobs:
+        for stage, seconds in job.stage_seconds or ():
+            stage_durations.setdefault(stage, []).append(seconds)
+
+    stages = {}
+    for stage, durations in stage_durations.items():
+        stages[stage] = {
+            'seconds': summarize(durations),
+            # Share of the available job slots this stage kept busy over the run
+            'utilization': round(sum(durations) / (wall * args.parallel), 3) if wall else 0.0
+        }
+
+    return {
+        'config': {
+            'jobs': args.jobs,
+            'parallel': args.parallel,
+            'codec': args.codec,
+            'latency_ms': args.latency_ms,
+            'bandwidth_mbps': args.bandwidth_mbps,
+            'failure_rate': args.failure_rate,
+            'stall_rate': args.stall_rate,
+            'truncate_rate': args.truncate_rate,
+            'source_bytes': source_bytes
+        },
+        'wall_seconds': round(wall, 2),
+        'completed': len(completed),
+        'failed': sum(j.status == JobStatus.FAILED for j in jobs),
+        'errors': sorted({j.error_message for j in jobs if j.status == JobStatus.FAILED and j.error_message}),
+        'jobs_per_minute': round(len(completed) / wall * 60, 2) if wall else 0.0,
+        'source_mb_per_second': round(len(completed) * source_bytes / 1024 / 1024 / wall, 2) if wall else 0.0,
+        'retried_stages': sum(sum(a - 1 for _, a in j.stage_attempts or ()) for j in jobs),
+        'latency_seconds': summarize(latencies),
+        'queue_wait_seconds': summarize(queue_waits),
+        'stages': stages,
+        'storage': {
+            'requests': storage.stats.requests,
+            'injected_failures': storage.stats.injected_failures,
+            'bytes_served': storage.stats.bytes_served,
+            'bytes_received': storage.stats.bytes_received
+        }
+    }
+
+
+def print_report(report: Dict[str, Any]):
+    print(f"Completed {report['completed']}/{report['config']['jobs']} jobs in {report['wall_seconds']}s "
+          f"({report['failed']} failed, {report['retried_stages']} stage retries)")
+    print(f"Throughput: {report['jobs_per_minute']} jobs/min, {report['source_mb_per_second']} MB/s of source")
+    latency = report['latency_seconds']
+    print(f"End-to-end latency: p50 {latency['p50']}s  p90 {latency['p90']}s  p99 {latency['p99']}s  max {latency['max']}s")
+    print(f"Queue wait: p50 {report['queue_wait_seconds']['p50']}s  p99 {report['queue_wait_seconds']['p99']}s")
+    for stage, stats in report['stages'].items():
+        seconds = stats['seconds']
+        print(f"  {stage:<10} util {stats['utilization'] * 100:5.1f}%  "
+              f"p50 {seconds['p50']}s  p99 {seconds['p99']}s  max {seconds['max']}s")
+    for error in report['errors']:
+        print(f"  error: {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end pipeline load test")
+    parser.add_argument('--jobs', type=int, default=10)
+    parser.add_argument('--parallel', type=int, default=int(os.getenv("MAX_CONCURRENT_JOBS", "1")))
+    parser.add_argument('--codec', default='x265',
+                        choices=['x265', 'x265_fast', 'x264', 'svtav1', 'hevc_nvenc', 'h264_nvenc', 'auto'])
+    parser.add_argument('--source', help="Clip to copy into the source zone instead of a synthetic one")
+    parser.add_argument('--duration', type=float, default=10.0, help="Synthetic clip length in seconds")
+    parser.add_argument('--resolution', default='1280x720', help="Synthetic clip resolution")
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--bandwidth-mbps', type=float, default=0.0)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--stall-rate', type=float, default=0.0)
+    parser.add_argument('--truncate-rate', type=float, default=0.0)
+    parser.add_argument('--timeout', type=float, default=0.0, help="Give up after this many seconds")
+    parser.add_argument('--report', help="Write the report as JSON to this path")
+    parser.add_argument('--keep', action='store_true', help="Keep the temporary storage and staging directories")
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    report = run_load(args)
+    print_report(report)
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import hashlib
+import contextvars
+from types import SimpleNamespace
+
+import pytest
+from aiohttp import web
+
+from app import bunny_client
+from app.log_config import current_job_id
+from app.transfer_scheduler import transfer_scheduler
+from benchmarks.fake_bunny import FakeBunnyServer, FakeBunnyStorage
+
+DATA = bytes(range(256)) * 1024  # Several transfer chunks
+
+
+class FlakyStorage(FakeBunnyStorage):
+    """Answers the first PUT with a 503 after taking the whole body, like an overloaded edge"""
+
+    def __init__(self, root):
+        super().__init__(root)
+        self.put_bodies = []
+
+    async def handle_put(self, request):
+        if not self.put_bodies:
+            self.put_bodies.append(len(await request.read()))
+            raise web.HTTPServiceUnavailable(text="Try again")
+        response = await super().handle_put(request)
+        self.put_bodies.append(self.stats.bytes_received)
+        return response
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    monkeypatch.setattr(bunny_client, 'STORAGE_SCHEME', 'http')
+    store = FlakyStorage(str(tmp_path / 'storage'))
+    server = FakeBunnyServer(store).start()
+    yield store, SimpleNamespace(name='dest', api_key='key', zone='zone', host=server.address)
+    server.stop()
+
+
+def test_upload_retry_resends_the_whole_body(storage, tmp_path):
+    store, destination = storage
+    path = tmp_path / 'out.mp4'
+    path.write_bytes(DATA)
+    progress = []
+
+    def upload():
+        current_job_id.set('job-retry')
+        return bunny_client.upload_file(str(path), 'show/out.mp4', progress.append, destination=destination)
+
+    digest = contextvars.copy_context().run(upload)
+
+    assert digest == hashlib.sha256(DATA).hexdigest()
+    assert store.put_bodies == [len(DATA), len(DATA)]
+    assert (tmp_path / 'storage' / 'zone' / 'show' / 'out.mp4').read_bytes() == DATA
+    assert progress[-1] == len(DATA) and 0 in progress
+    assert transfer_scheduler.pop_stats('job-retry', 'upload')['bytes'] == len(DATA)
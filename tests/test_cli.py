@@ -0,0 +1,57 @@
+import csv
+import json
+
+import pytest
+
+from app.cli import format_eta, load_manifest, write_results
+
+
+def write(tmp_path, name, text):
+    path = tmp_path / name
+    path.write_text(text)
+    return str(path)
+
+
+def test_json_list_of_paths_and_entries(tmp_path):
+    path = write(tmp_path, 'm.json', json.dumps(['show/a.mp4', {'path': ' show/b.mp4 ', 'codec': 'x264'}]))
+    assert load_manifest(path) == [{'path': 'show/a.mp4'}, {'path': 'show/b.mp4', 'codec': 'x264'}]
+
+
+def test_json_jobs_object(tmp_path):
+    path = write(tmp_path, 'm.JSON', json.dumps({'jobs': [{'path': 'a.mp4', 'target_size_mb': 50}]}))
+    assert load_manifest(path) == [{'path': 'a.mp4', 'target_size_mb': 50}]
+
+
+def test_csv_with_header_drops_empty_columns(tmp_path):
+    path = write(tmp_path, 'm.csv', 'path, codec,destination\nshow/a.mp4,x265,\nshow/b.mp4,,out/b.mp4\n')
+    assert load_manifest(path) == [
+        {'path': 'show/a.mp4', 'codec': 'x265'},
+        {'path': 'show/b.mp4', 'destination': 'out/b.mp4'}
+    ]
+
+
+def test_csv_without_header_is_one_path_per_line(tmp_path):
+    path = write(tmp_path, 'm.txt', 'show/a.mp4\n\nshow/b.mp4\n')
+    assert [e['path'] for e in load_manifest(path)] == ['show/a.mp4', 'show/b.mp4']
+
+
+def test_entry_without_path_is_rejected(tmp_path):
+    path = write(tmp_path, 'm.json', json.dumps(['a.mp4', {'codec': 'x265'}]))
+    with pytest.raises(ValueError, match='entry 2'):
+        load_manifest(path)
+
+
+@pytest.mark.parametrize('seconds, text', [(None, '—'), (59, '0m59s'), (754, '12m34s'), (3 * 3600 + 120, '3h02m')])
+def test_format_eta(seconds, text):
+    assert format_eta(seconds) == text
+
+
+def test_write_results_csv_and_json(tmp_path):
+    rows = [{'path': 'a.mp4', 'job_id': 'j', 'status': 'completed', 'extra': 'ignored'}]
+    write_results(str(tmp_path / 'r.csv'), rows)
+    with open(tmp_path / 'r.csv', newline='') as f:
+        written = list(csv.DictReader(f))
+    assert written[0]['path'] == 'a.mp4' and 'extra' not in written[0]
+
+    write_results(str(tmp_path / 'r.json'), rows)
+    assert json.loads((tmp_path / 'r.json').read_text()) == rows
@@ -0,0 +1,117 @@
+import uuid
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from app.forecast import MovingAverage, QueueForecaster, ThroughputModel, resolution_tier, SMOOTHING
+from app.job_history import JobRecord
+from app.queue_manager import EncodingJob, JobStatus
+
+
+@pytest.mark.parametrize('width, height, tier', [
+    (640, 360, '360p'), (1280, 720, '720p'), (1920, 800, '1080p'), (1920, 1080, '1080p'),
+    (3840, 2160, '2160p'), (None, 1080, None)
+])
+def test_resolution_tier(width, height, tier):
+    assert resolution_tier(width, height) == tier
+
+
+def test_moving_average_replaces_prior_then_smooths():
+    average = MovingAverage()
+    average.update(10)
+    average.update(20)
+    assert average.value == pytest.approx(10 + SMOOTHING * 10)
+    assert average.samples == 2
+
+
+def completed_record(**fields):
+    defaults = dict(id=str(uuid.uuid4()), status=JobStatus.COMPLETED, encoder='libx265', width=1920,
+                    height=1080, media_duration=600, source_size=1000 * 1000 * 1000, file_size_after=200 * 1000 * 1000,
+                    stage_seconds=(('download', 50.0), ('encode', 300.0), ('upload', 20.0)))
+    defaults.update(fields)
+    return JobRecord(**defaults)
+
+
+def test_model_learns_from_completed_jobs():
+    model = ThroughputModel()
+    model.observe(completed_record(transfer_mbps=(('upload', 80.0),)))
+    assert model.speed('libx265', '1080p') == pytest.approx(2.0)
+    assert model.bitrate('libx265', '1080p', 1920, 1080) == pytest.approx(200 * 1000 * 1000 * 8 / 600)
+    # Download from bytes over stage time, upload from the scheduler's measurement
+    assert model.bandwidth('download') == pytest.approx(20 * 1000 * 1000)
+    assert model.bandwidth('upload') == pytest.approx(10 * 1000 * 1000)
+    assert model.output_size_from_size('libx265', 500) == 100
+
+
+def test_fan_out_upload_rate_is_learned_per_copy():
+    model = ThroughputModel()
+    model.observe(completed_record(transfer_mbps=(('upload', 160.0),),
+                                   destinations={'main': {'status': 'uploaded'}, 'backup': {'status': 'uploaded'}}))
+    assert model.bandwidth('upload') == pytest.approx(10 * 1000 * 1000)
+
+
+def make_job(**fields):
+    defaults = dict(id=str(uuid.uuid4()), input_file='./input/a.mp4', output_file='./output/a.mp4', codec='x265',
+                    status=JobStatus.PENDING, created_at=datetime.now(), width=1920, height=1080,
+                    media_duration=600, source_size=1000 * 1000 * 1000)
+    defaults.update(fields)
+    return EncodingJob(**defaults)
+
+
+def test_estimate_job_sums_remaining_stages():
+    model = ThroughputModel()
+    model.observe(completed_record())
+    forecaster = QueueForecaster(model)
+
+    fresh = forecaster.estimate_job(make_job(), 'libx265')
+    assert fresh['stage_seconds'] == {'download': 50.0, 'encode': 300.0, 'upload': 20.0}
+    assert fresh['predicted_size'] == 200 * 1000 * 1000
+
+    downloaded = forecaster.estimate_job(make_job(checkpoints=['downloaded']), 'libx265')
+    assert 'download' not in downloaded['stage_seconds']
+    assert downloaded['remaining_seconds'] == 320.0
+
+
+def test_estimate_job_follows_a_running_encode():
+    forecaster = QueueForecaster(ThroughputModel())
+    job = make_job(status=JobStatus.RUNNING, checkpoints=['downloaded'],
+                   progress={'stage': 'encode', 'time': '00:05:00.00', 'speed': '3.0x'})
+    assert forecaster.estimate_job(job, 'libx265')['stage_seconds']['encode'] == 100.0
+
+
+class FixedForecaster(QueueForecaster):
+    """Forecaster whose per-job estimates are given, to test the slot scheduling alone"""
+
+    def __init__(self, seconds):
+        super().__init__(ThroughputModel())
+        self.seconds = seconds
+
+    def estimate_job(self, job, encoder):
+        return {'remaining_seconds': self.seconds[job.id], 'stage_seconds': {}, 'predicted_size': 0}
+
+
+def jobs(*ids):
+    return [SimpleNamespace(id=job_id) for job_id in ids]
+
+
+def test_forecast_fills_slots_in_queue_order():
+    forecaster = FixedForecaster({'r1': 100, 'r2': 30, 'p1': 50, 'p2': 10, 'p3': 40})
+    result = forecaster.forecast(jobs('r1', 'r2'), jobs('p1', 'p2', 'p3'), slots=2, encoder_for=lambda job: 'x265')
+    etas = {job_id: estimate['eta_seconds'] for job_id, estimate in result['jobs'].items()}
+    # Each pending job takes the slot that frees first: r2's at 30, then p1's at 80, then p2's at 90
+    assert etas == {'r1': 100, 'r2': 30, 'p1': 80, 'p2': 90, 'p3': 130}
+    assert result['backlog_seconds'] == 130
+    assert result['jobs_per_hour'] == round(2 * 3600 / (100 / 3), 1)
+
+
+def test_forecast_uses_idle_slots_first():
+    forecaster = FixedForecaster({'r1': 100, 'p1': 50, 'p2': 10})
+    result = forecaster.forecast(jobs('r1'), jobs('p1', 'p2'), slots=3, encoder_for=lambda job: 'x265')
+    assert result['jobs']['p1']['eta_seconds'] == 50
+    assert result['jobs']['p2']['eta_seconds'] == 10
+
+
+def test_forecast_of_an_empty_queue():
+    result = FixedForecaster({}).forecast([], [], slots=2, encoder_for=lambda job: 'x265')
+    assert result == {'jobs': {}, 'backlog_seconds': 0.0, 'completion_at': None, 'jobs_per_hour': None}
@@ -0,0 +1,106 @@
+import json
+import uuid
+from datetime import datetime
+
+from app.job_history import JobHistory, JobRecord
+from app.queue_manager import EncodingJob, JobStatus
+
+
+def make_job(status=JobStatus.COMPLETED, **fields):
+    return EncodingJob(id=str(uuid.uuid4()), input_file='./input/a.mp4', output_file='./output/a.mp4',
+                       codec='x265', status=status, created_at=datetime.now(), **fields)
+
+
+def test_window_evicts_oldest(tmp_path):
+    history = JobHistory(window_size=2, archive_path=str(tmp_path / 'history.jsonl'))
+    jobs = [make_job() for _ in range(3)]
+    evicted = [history.add(job) for job in jobs]
+    assert evicted == [[], [], [jobs[0].id]]
+    assert [r.id for r in history.recent()] == [jobs[2].id, jobs[1].id]
+    counts, archived = history.get_counts()
+    assert counts[JobStatus.COMPLETED] == 2 and archived == 3
+
+
+def test_get_reads_evicted_jobs_through_the_offset_index(tmp_path):
+    history = JobHistory(window_size=1, archive_path=str(tmp_path / 'history.jsonl'))
+    job = make_job(status=JobStatus.FAILED, error_message='boom', checkpoints=['downloaded'],
+                   source_sha256='ab' * 32)
+    history.add(job)
+    history.add(make_job())
+
+    record = history.get(job.id)
+    assert record.status == JobStatus.FAILED
+    assert record.error_message == 'boom'
+    assert record.checkpoints == ['downloaded']
+    assert record.source_sha256 == 'ab' * 32
+    assert history.get('unknown') is None
+
+
+def test_reopened_archive_returns_latest_state(tmp_path):
+    path = str(tmp_path / 'history.jsonl')
+    history = JobHistory(window_size=10, archive_path=path)
+    job = make_job(status=JobStatus.FAILED)
+    history.add(job)
+    history.add(make_job())
+    job.status = JobStatus.COMPLETED
+    history.add(job)
+
+    reopened = JobHistory(window_size=10, archive_path=path)
+    assert reopened.window == {}
+    assert reopened.get(job.id).status == JobStatus.COMPLETED
+    assert reopened.get_counts()[1] == 3
+
+
+def test_index_catches_up_with_lines_it_missed_and_rebuilds_when_damaged(tmp_path):
+    path = tmp_path / 'history.jsonl'
+    history = JobHistory(window_size=1, archive_path=str(path))
+    first, second = make_job(), make_job(status=JobStatus.FAILED)
+    history.add(first)
+    # Written behind the index's back, as if the process died before updating it
+    with open(path, 'a') as f:
+        f.write(json.dumps(JobRecord.from_job(second).to_archive(), separators=(',', ':')) + '\n')
+
+    reopened = JobHistory(window_size=1, archive_path=str(path))
+    assert reopened.get(second.id).status == JobStatus.FAILED
+    assert reopened.get_counts()[1] == 2
+
+    (tmp_path / 'history.jsonl.idx').write_bytes(b'not a database' * 100)
+    rebuilt = JobHistory(window_size=1, archive_path=str(path))
+    assert rebuilt.get(first.id).id == first.id
+    assert rebuilt.get_counts()[1] == 2
+
+
+def test_query_pages_newest_first_one_entry_per_job(tmp_path):
+    history = JobHistory(window_size=1, archive_path=str(tmp_path / 'history.jsonl'))
+    first, second, third = make_job(), make_job(), make_job()
+    for job in (first, second, third):
+        history.add(job)
+    first.status = JobStatus.CANCELLED
+    history.add(first)
+
+    assert [r.id for r in history.query(limit=10)] == [first.id, third.id, second.id]
+    assert [r.id for r in history.query(limit=1, offset=1)] == [third.id]
+    assert history.query(limit=10)[0].status == JobStatus.CANCELLED
+
+
+def test_without_archive_only_the_window_is_kept():
+    history = JobHistory(window_size=1, archive_path=None)
+    first, second = make_job(), make_job()
+    history.add(first)
+    history.add(second)
+    assert history.get(first.id) is None
+    assert history.get(second.id).id == second.id
+
+
+def test_record_round_trips_to_a_job(tmp_path):
+    history = JobHistory(window_size=1, archive_path=str(tmp_path / 'history.jsonl'))
+    job = make_job(status=JobStatus.FAILED, remote_path='show/a.mp4', source_size=1234, priority=5,
+                   checkpoints=['downloaded', 'encoded'], destinations={'main': {'status': 'failed'}})
+    history.add(job)
+    history.add(make_job())
+
+    restored = history.get(job.id).to_job()
+    assert (restored.id, restored.remote_path, restored.source_size, restored.priority) == \
+        (job.id, 'show/a.mp4', 1234, 5)
+    assert restored.checkpoints == ['downloaded', 'encoded']
+    assert restored.destinations == {'main': {'status': 'failed'}}
@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from app.listing import ListingCache, MAX_PAGE_SIZE
+
+LISTING = {
+    'directories': [{'name': 'Zeta', 'path': 'show/Zeta/'}, {'name': 'alpha', 'path': 'show/alpha/'}],
+    'files': [
+        {'name': 'b.mp4', 'size': 5, 'last_modified': '2024-01-02'},
+        {'name': 'A.mkv', 'size': 9, 'last_modified': '2024-01-01'},
+        {'name': 'c.mp4', 'size': 1, 'last_modified': ''},
+    ]
+}
+
+
+@pytest.fixture
+def listed(monkeypatch):
+    calls = []
+
+    async def list_files(path):
+        calls.append(path)
+        return LISTING
+
+    monkeypatch.setattr('app.bunny_client.list_files', list_files)
+    return calls
+
+
+def names(page):
+    return [row[1] for row in page['rows']]
+
+
+def test_sort_orders_keep_directories_first(listed):
+    cache = ListingCache()
+    assert names(asyncio.run(cache.page('show'))) == ['alpha', 'Zeta', 'A.mkv', 'b.mp4', 'c.mp4']
+    assert names(asyncio.run(cache.page('show', order='desc'))) == ['Zeta', 'alpha', 'c.mp4', 'b.mp4', 'A.mkv']
+    assert names(asyncio.run(cache.page('show', sort='size'))) == ['alpha', 'Zeta', 'c.mp4', 'b.mp4', 'A.mkv']
+    assert names(asyncio.run(cache.page('show', sort='date', order='desc'))) == \
+        ['Zeta', 'alpha', 'b.mp4', 'A.mkv', 'c.mp4']
+    assert asyncio.run(cache.page('show', sort='bogus'))['sort'] == 'name'
+
+
+def test_filter_is_case_insensitive_and_counts_matches(listed):
+    page = asyncio.run(ListingCache().page('show', query=' MP4 '))
+    assert names(page) == ['b.mp4', 'c.mp4']
+    assert (page['total'], page['files'], page['directories'], page['query']) == (2, 3, 2, 'MP4')
+
+
+def test_only_unfiltered_sort_orders_are_cached(listed):
+    cache = ListingCache()
+
+    async def browse():
+        for query in ('b', 'b.', 'b.m', 'b.mp', 'b.mp4'):
+            await cache.page('show', sort='size', query=query)
+        await cache.page('show', sort='name')
+
+    asyncio.run(browse())
+    assert set(cache._entries['show'][2]) == {('size', False), ('name', False)}
+
+
+def test_pages_are_sliced(listed):
+    cache = ListingCache()
+    page = asyncio.run(cache.page('/show/', offset=3, limit=2))
+    assert (page['path'], page['parent'], names(page), page['total']) == ('show', '', ['b.mp4', 'c.mp4'], 5)
+    assert names(asyncio.run(cache.page('show', offset=-5, limit=0))) == ['alpha']
+    assert asyncio.run(cache.page('show', limit=10 ** 6))['rows'] == asyncio.run(cache.page('show', limit=MAX_PAGE_SIZE))['rows']
+
+
+def test_listing_is_fetched_once_while_fresh(listed):
+    cache = ListingCache(ttl=60)
+
+    async def browse():
+        await asyncio.gather(*(cache.page('show') for _ in range(5)))
+        await cache.get('show')
+        await cache.get('show', refresh=True)
+
+    asyncio.run(browse())
+    assert listed == ['show', 'show']
+
+
+def test_least_recently_used_folders_are_dropped(listed):
+    cache = ListingCache(max_folders=2)
+
+    async def browse():
+        for folder in ('a', 'b', 'a', 'c'):
+            await cache.get(folder)
+
+    asyncio.run(browse())
+    assert list(cache._entries) == ['a', 'c']
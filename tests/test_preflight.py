@@ -0,0 +1,118 @@
+import asyncio
+import json
+
+import aiohttp
+import pytest
+
+from app.preflight import PreflightResult, RemoteProber, authenticated_proxy
+from benchmarks.fake_bunny import FakeBunnyServer, FakeBunnyStorage, FaultConfig
+
+DATA = bytes(range(256)) * 4
+
+
+@pytest.fixture
+def storage(tmp_path):
+    store = FakeBunnyStorage(str(tmp_path), FaultConfig(access_keys={'zone': 'secret'}))
+    store.put_local_file('zone', 'show/a.mp4', DATA)
+    server = FakeBunnyServer(store).start()
+    yield f"http://{server.address}/zone"
+    server.stop()
+
+
+async def fetch(url, headers=None):
+    async with aiohttp.ClientSession() as session:
+        async with session.get(url, headers=headers or {}) as response:
+            return response.status, response.headers.get('Content-Range'), await response.read()
+
+
+def test_proxy_adds_the_key_and_passes_ranges_through(storage):
+    async def run():
+        async with authenticated_proxy(f"{storage}/show/a.mp4", {'AccessKey': 'secret'}, 5) as url:
+            assert url.startswith('http://127.0.0.1:') and url.endswith('/a.mp4') and 'secret' not in url
+            return await fetch(url), await fetch(url, {'Range': 'bytes=1000-'})
+
+    (status, _, body), (range_status, content_range, tail) = asyncio.run(run())
+    assert (status, body) == (200, DATA)
+    assert (range_status, content_range, tail) == (206, f"bytes 1000-1023/{len(DATA)}", DATA[1000:])
+
+
+def test_proxy_forwards_storage_errors(storage):
+    async def run():
+        async with authenticated_proxy(f"{storage}/show/a.mp4", {'AccessKey': 'wrong'}, 5) as url:
+            unauthorised = await fetch(url)
+        async with authenticated_proxy(f"{storage}/show/missing.mp4", {'AccessKey': 'secret'}, 5) as url:
+            missing = await fetch(url)
+            wrong_token = await fetch(url.rsplit('/', 2)[0] + '/guess/missing.mp4')
+        async with authenticated_proxy("http://127.0.0.1:9/zone/a.mp4", {'AccessKey': 'secret'}, 5) as url:
+            unreachable = await fetch(url)
+        return unauthorised[0], missing[0], wrong_token[0], unreachable[0]
+
+    assert asyncio.run(run()) == (401, 404, 404, 502)
+
+
+def test_ffprobe_never_sees_the_key(monkeypatch):
+    prober = RemoteProber()
+    seen = []
+
+    async def run(url):
+        seen.append((url, prober._command(url)))
+        return 0, json.dumps({
+            'format': {'duration': '12.5', 'format_name': 'mov,mp4'},
+            'streams': [{'codec_type': 'video', 'codec_name': 'h264', 'width': 1280, 'height': 720},
+                        {'codec_type': 'audio', 'codec_name': 'aac'}]
+        }).encode(), b''
+
+    monkeypatch.setattr(prober, '_run', run)
+    monkeypatch.setattr('app.bunny_client.source_request',
+                        lambda path: (f"http://storage.example/zone/{path}", {'AccessKey': 'secret'}))
+    result = asyncio.run(prober.probe('show/a.mp4', 100))
+
+    assert result.ok and result.codecs == 'h264+aac' and result.duration == 12.5
+    (url, cmd), = seen
+    assert url.startswith('http://127.0.0.1:') and cmd[-1] == url
+    assert not any('secret' in arg or 'AccessKey' in arg for arg in cmd)
+
+
+def test_inconclusive_probes_admit_the_file(monkeypatch):
+    prober = RemoteProber()
+
+    async def run(url):
+        return 1, b'', f"{url}: Server returned 5XX Server Error reply\n".encode()
+
+    monkeypatch.setattr(prober, '_run', run)
+    result = asyncio.run(prober.probe('show/a.mp4'))
+    assert result.ok and not result.probed
+
+
+def test_unreadable_sources_are_rejected_without_the_url(monkeypatch):
+    prober = RemoteProber()
+
+    async def run(url):
+        return 1, b'', f"{url}: Server returned 404 Not Found\n".encode()
+
+    monkeypatch.setattr(prober, '_run', run)
+    result = asyncio.run(prober.probe('show/a.mp4'))
+    assert not result.ok and result.reason == "Unreadable source: Server returned 404 Not Found"
+
+
+def test_empty_and_disabled():
+    assert asyncio.run(RemoteProber().probe('a.mp4', 0)).reason == "File is empty"
+    assert asyncio.run(RemoteProber(enabled=False).probe('a.mp4', 10)) == PreflightResult(path='a.mp4', ok=True)
+
+
+@pytest.mark.parametrize('data, reason', [
+    ({'streams': [{'codec_type': 'audio', 'codec_name': 'aac'}]}, "No video stream"),
+    ({'streams': [{'codec_type': 'video', 'codec_name': 'h264', 'width': 0, 'height': 0}],
+      'format': {'duration': '10'}}, "Video stream has no frame size"),
+    ({'streams': [{'codec_type': 'video', 'codec_name': 'h264', 'width': 64, 'height': 64}],
+      'format': {'duration': 'N/A'}}, "Video stream is empty or has no duration"),
+    ({'streams': [{'codec_type': 'video', 'codec_name': 'h264', 'width': 64, 'height': 64}],
+      'format': {'duration': str(30 * 3600)}}, "Implausible duration (30.0 hours)"),
+    ({'streams': [{'codec_type': 'video', 'codec_name': 'mjpeg', 'width': 64, 'height': 64,
+                   'disposition': {'attached_pic': 1}},
+                  {'codec_type': 'video', 'codec_name': 'hevc', 'width': 64, 'height': 64}],
+      'format': {'duration': '10'}}, None),
+])
+def test_validate(data, reason):
+    result = RemoteProber().validate('a.mp4', data)
+    assert (result.ok, result.reason) == (reason is None, reason)
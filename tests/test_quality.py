@@ -0,0 +1,89 @@
+import json
+import asyncio
+
+import pytest
+
+from app.cpu_allocator import cpu_allocator
+from app.quality import QualityEvaluator, PSNR_CAP
+
+STDERR = """
+[Parsed_ssim_2 @ 0x55] SSIM Y:0.981234 (17.26) U:0.990000 (20.00) V:0.989000 (19.59) All:0.984512 (18.11)
+[Parsed_psnr_3 @ 0x56] PSNR y:41.20 u:45.10 v:44.90 average:42.351234 min:38.10 max:49.20
+[Parsed_libvmaf_4 @ 0x57] VMAF score: 93.412345
+"""
+
+
+def test_parse_scores():
+    assert QualityEvaluator.parse_scores(STDERR) == {'ssim': 0.984512, 'psnr': 42.351234, 'vmaf': 93.412345}
+
+
+def test_parse_scores_handles_identical_frames_and_missing_metrics():
+    scores = QualityEvaluator.parse_scores("[Parsed_psnr_0 @ 0x1] PSNR y:inf u:inf v:inf average:inf min:inf max:inf")
+    assert scores == {'psnr': PSNR_CAP}
+    # Scores end up in job logs and the archive, both JSON
+    assert json.loads(json.dumps(scores, allow_nan=False)) == scores
+    assert QualityEvaluator.parse_scores("Conversion failed!") == {}
+
+
+def test_short_titles_are_compared_whole():
+    evaluator = QualityEvaluator(sample_count=3, sample_seconds=5)
+    assert evaluator.segments(12.0) == [(0.0, 12.0)]
+    assert QualityEvaluator(sample_count=0).segments(600.0) == [(0.0, 600.0)]
+
+
+def test_long_titles_are_sampled_in_order_and_in_range():
+    evaluator = QualityEvaluator(sample_count=3, sample_seconds=5)
+    segments = evaluator.segments(600.0)
+    assert len(segments) == 3
+    assert [offset for offset, _ in segments] == sorted(offset for offset, _ in segments)
+    assert all(0 <= offset and offset + length <= 600.0 and length == 5 for offset, length in segments)
+
+
+def test_build_command_runs_every_metric_in_one_pass():
+    evaluator = QualityEvaluator(threads=4, vmaf_model='/models/vmaf.json')
+    cmd = evaluator.build_command('src.mkv', 'out.mp4', 30.0, 5.0, 1920, 1080, ['ssim', 'vmaf'], threads=2)
+    graph = cmd[cmd.index('-filter_complex') + 1]
+    assert '[0:v]scale=1920:1080:flags=bicubic,setpts=PTS-STARTPTS,split=2[d0][d1]' in graph
+    assert '[d0][r0]ssim' in graph
+    assert '[d1][r1]libvmaf=n_threads=2:model=path=/models/vmaf.json' in graph
+    assert cmd[cmd.index('-filter_threads') + 1] == '2'
+    # The encode is the distorted input, the source the reference
+    assert cmd.index('out.mp4') < cmd.index('src.mkv')
+
+
+def test_vmaf_is_dropped_without_libvmaf():
+    evaluator = QualityEvaluator(metrics=('ssim', 'vmaf', 'bogus'))
+    evaluator._has_vmaf = False
+    assert evaluator.active_metrics() == ['ssim']
+
+
+def test_evaluate_weights_segments_by_length_and_releases_its_cores(monkeypatch):
+    evaluator = QualityEvaluator(metrics=('ssim', 'psnr'), sample_count=2, sample_seconds=10)
+    monkeypatch.setattr(evaluator, 'segments', lambda duration: [(0.0, 10.0), (50.0, 30.0)])
+    scores = {0.0: {'ssim': 0.90, 'psnr': 40.0}, 50.0: {'ssim': 0.98, 'psnr': 44.0}}
+    seen = []
+
+    async def score(source, output, offset, length, width, height, metrics, allocation):
+        seen.append((offset, metrics, allocation.job_id in cpu_allocator.allocations))
+        return scores[offset]
+
+    monkeypatch.setattr(evaluator, '_score_segment', score)
+    result = asyncio.run(evaluator.evaluate('src.mkv', 'out.mp4', 600.0, 1280, 720, job_id='job'))
+
+    assert result['ssim'] == pytest.approx((0.90 * 10 + 0.98 * 30) / 40)
+    assert result['psnr'] == pytest.approx(43.0)
+    assert (result['segments'], result['sampled_seconds']) == (2, 40.0)
+    assert seen == [(0.0, ['ssim', 'psnr'], True), (50.0, ['ssim', 'psnr'], True)]
+    assert 'job/quality' not in cpu_allocator.allocations
+
+
+def test_failed_evaluation_releases_its_cores(monkeypatch):
+    evaluator = QualityEvaluator(metrics=('ssim',))
+
+    async def score(*args):
+        raise Exception("Quality evaluation failed")
+
+    monkeypatch.setattr(evaluator, '_score_segment', score)
+    with pytest.raises(Exception, match='failed'):
+        asyncio.run(evaluator.evaluate('src.mkv', 'out.mp4', 5.0, 1280, 720, job_id='job'))
+    assert 'job/quality' not in cpu_allocator.allocations
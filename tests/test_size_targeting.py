@@ -0,0 +1,44 @@
+import pytest
+
+from app.size_targeting import SizeTargetPredictor, AUDIO_BITRATE_BPS
+
+
+def predictor_measuring(bitrates):
+    """Predictor whose sample encodes return a fixed bitrate per quality value"""
+    predictor = SizeTargetPredictor()
+    measured = []
+
+    def measure_bitrate(input_file, duration, backend, quality, preset, work_dir, allocation=None):
+        measured.append(quality)
+        return bitrates[quality], [bitrates[quality]]
+
+    predictor.measure_bitrate = measure_bitrate
+    return predictor, measured
+
+
+@pytest.mark.parametrize('first_bps, target_bps, second_quality, second_bps, expected_quality', [
+    # Target below the first measurement: the prediction raises the quality value
+    (4_000_000, 2_500_000, 32, 4_000_000 / 2 ** (4 / 12), 36),
+    # Target above the first measurement: the prediction lowers the quality value
+    (1_000_000, 1_500_000, 24, 1_000_000 * 2 ** (4 / 12), 21),
+])
+def test_predict_refits_slope_in_both_directions(first_bps, target_bps, second_quality, second_bps,
+                                                 expected_quality):
+    predictor, measured = predictor_measuring({28: first_bps, second_quality: second_bps})
+    settings = predictor.predict('/tmp/in.mkv', 600, backend=None, base_settings={'preset': 'medium', 'crf': 28},
+                                 target_bitrate=target_bps + AUDIO_BITRATE_BPS, work_dir='/tmp')
+
+    assert measured == [28, second_quality]
+    assert settings['steps_per_halving'] == pytest.approx(12)
+    assert settings['crf'] == expected_quality
+
+
+def test_predict_keeps_default_slope_when_measurements_disagree_with_the_model():
+    # Lowering the quality value made the file smaller: keep the rule-of-thumb prediction
+    predictor, measured = predictor_measuring({28: 1_000_000, 24: 900_000})
+    settings = predictor.predict('/tmp/in.mkv', 600, backend=None, base_settings={'preset': 'medium', 'crf': 28},
+                                 target_bitrate=1_500_000 + AUDIO_BITRATE_BPS, work_dir='/tmp')
+
+    assert measured == [28, 24]
+    assert settings['steps_per_halving'] == 6.0
+    assert settings['crf'] == 24
@@ -0,0 +1,134 @@
+import os
+
+import pytest
+
+from app.staging import (
+    StagingManager, StagingVolume, estimate_output_size, is_staged_name, parse_bitrate, parse_size,
+    staged_name, AUDIO_BITRATE_BPS, OUTPUT_SIZE_MARGIN
+)
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('512M', 512 * 1024 ** 2),
+    ('2G', 2 * 1024 ** 3),
+    ('1.5gb', int(1.5 * 1024 ** 3)),
+    ('1048576', 1048576),
+    (' 10k ', 10 * 1024),
+    (None, None),
+    ('', None),
+    ('0', None),
+    ('unlimited', None),
+])
+def test_parse_size(value, expected):
+    assert parse_size(value) == expected
+
+
+@pytest.mark.parametrize('value, expected', [('1500k', 1500000), ('2.5M', 2500000), (800000, 800000)])
+def test_parse_bitrate(value, expected):
+    assert parse_bitrate(value) == expected
+
+
+def test_estimate_output_size_uses_bitrate_and_duration():
+    estimate = estimate_output_size(None, duration=100, max_bitrate='1500k')
+    assert estimate == int(100 * (1500000 + AUDIO_BITRATE_BPS) / 8 * OUTPUT_SIZE_MARGIN)
+
+
+def test_estimate_output_size_is_capped_by_source():
+    source = 10 * 1024 ** 2
+    assert estimate_output_size(source, duration=3600, max_bitrate='3500k') == int(source * OUTPUT_SIZE_MARGIN)
+    # A low cap on a large source comes out well under the source size
+    assert estimate_output_size(1024 ** 3, duration=60, max_bitrate='1000k') < 1024 ** 3 // 10
+
+
+def test_estimate_output_size_falls_back_to_source_size():
+    assert estimate_output_size(1000) == int(1000 * OUTPUT_SIZE_MARGIN)
+    assert estimate_output_size(None) == 0
+
+
+def test_staged_names():
+    name = staged_name('0123abcd-ffff-4000-8000-000000000000', 'movie.mp4')
+    assert name == '0123abcd_movie.mp4'
+    assert is_staged_name(os.path.join('input', name))
+    assert not is_staged_name('input/movie.mp4')
+    assert not is_staged_name('input/holiday_2019.mp4')
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    monkeypatch.setattr(StagingVolume, 'free_bytes', lambda self: 1000)
+    monkeypatch.setattr(StagingVolume, 'total_bytes', lambda self: 5000)
+    return StagingManager([StagingVolume(root=str(tmp_path))], headroom_bytes=100,
+                          default_source_size=300, retention_budget=10)
+
+
+def test_reserve_counts_outstanding_bytes(manager):
+    first = manager.reserve('a', 400, 100)
+    assert first is not None and first.total_bytes == 500
+    # 1000 free - 100 headroom - 500 promised leaves 400
+    assert manager.reserve('b', 300, 200) is None
+    assert manager.reserve('b', 300, 100) is not None
+    assert manager.reserve('a', 1, 1) is first
+
+
+def test_reserve_subtracts_bytes_already_written(manager):
+    reservation = manager.reserve('a', 400, 100)
+    path = os.path.join(manager.volumes[0].input_dir, staged_name('aaaaaaaa', 'x.mp4'))
+    with open(path + '.part', 'wb') as f:
+        f.write(b'\0' * 150)
+    manager.track_paths('a', path)
+    assert reservation.outstanding_bytes() == 350
+
+
+def test_reserve_defaults_unknown_source_size(manager):
+    reservation = manager.reserve('a', None)
+    assert reservation.source_bytes == 300
+    assert reservation.output_bytes == estimate_output_size(300)
+
+
+def test_release_frees_space(manager):
+    manager.reserve('a', 800, 100)
+    assert manager.reserve('b', 100, 0) is None
+    manager.release('a')
+    assert manager.reserve('b', 100, 0) is not None
+
+
+def test_can_ever_fit(manager):
+    assert manager.can_ever_fit(2000, 2000)
+    assert not manager.can_ever_fit(3000, 3000)
+
+
+def _write(directory, name, size):
+    path = os.path.join(directory, name)
+    with open(path, 'wb') as f:
+        f.write(b'\0' * size)
+    return path
+
+
+def test_retain_evicts_oldest_over_budget(manager):
+    output_dir = manager.volumes[0].output_dir
+    old = _write(output_dir, 'aaaaaaaa_a.mp4', 6)
+    new = _write(output_dir, 'bbbbbbbb_b.mp4', 6)
+    manager.retain('a', [old])
+    manager.retain('b', [new])
+    assert 'a' not in manager.retained and not os.path.exists(old)
+    assert manager.reclaim('b') == [new] and os.path.exists(new)
+
+
+def test_retain_ignores_files_outside_staging(manager, tmp_path):
+    outside = _write(str(tmp_path), 'aaaaaaaa_user.mp4', 1)
+    manager.retain('a', [outside])
+    assert manager.retained == {}
+
+
+def test_sweep_orphans_only_removes_unowned_staged_files(manager):
+    input_dir = manager.volumes[0].input_dir
+    orphan = _write(input_dir, 'cccccccc_orphan.mp4', 1)
+    kept = _write(input_dir, 'dddddddd_kept.mp4', 1)
+    owned = _write(input_dir, 'eeeeeeee_owned.mp4', 1)
+    user = _write(input_dir, 'user_file.mp4', 1)
+    manager.reserve('e', 1, 1)
+    manager.track_paths('e', owned)
+
+    assert manager.sweep_orphans(keep=[kept]) == 1
+    assert not os.path.exists(orphan)
+    assert all(os.path.exists(p) for p in (kept, owned, user))
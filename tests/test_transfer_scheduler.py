@@ -0,0 +1,127 @@
+import threading
+import time
+
+import pytest
+
+from app.cancellation import CancelToken, JobCancelled
+from app.log_config import current_job_id
+from app.transfer_scheduler import (
+    TokenBucket, TransferScheduler, CHUNK_SIZE, DEFAULT_RETRY_AFTER, MAX_FINISHED_STATS, MAX_RETRY_AFTER, PRIORITY
+)
+
+
+def test_unlimited_bucket_never_waits():
+    bucket = TokenBucket('test')
+    assert bucket.acquire(10 * CHUNK_SIZE, PRIORITY['download']) < 0.05
+
+
+def test_bucket_admits_one_chunk_into_debt_then_repays_it():
+    rate = 10 * CHUNK_SIZE
+    bucket = TokenBucket('test', rate)
+    assert bucket.acquire(rate, PRIORITY['download']) < 0.05  # The burst
+    assert bucket.acquire(rate // 5, PRIORITY['download']) < 0.05  # Not in debt yet
+    waited = bucket.acquire(CHUNK_SIZE, PRIORITY['download'])
+    assert 0.15 < waited < 0.5
+
+
+def test_paused_bucket_waits_out_the_pause():
+    bucket = TokenBucket('test')
+    bucket.pause(0.3)
+    assert 0.25 < bucket.acquire(CHUNK_SIZE, PRIORITY['upload']) < 0.6
+
+
+def test_cancelled_transfer_stops_waiting():
+    bucket = TokenBucket('test')
+    bucket.pause(30)
+    token = CancelToken()
+    threading.Timer(0.1, token.cancel).start()
+    started = time.monotonic()
+    with pytest.raises(JobCancelled):
+        bucket.acquire(CHUNK_SIZE, PRIORITY['download'], token)
+    assert time.monotonic() - started < 1
+    assert bucket.waiting[PRIORITY['download']] == 0
+
+
+def test_downloads_wait_behind_uploads():
+    bucket = TokenBucket('test')
+    bucket.waiting[PRIORITY['upload']] = 1  # An upload is queued on the bucket
+    admitted = threading.Event()
+    thread = threading.Thread(target=lambda: (bucket.acquire(CHUNK_SIZE, PRIORITY['download']), admitted.set()))
+    thread.start()
+    assert not admitted.wait(0.3)
+    with bucket._cond:
+        bucket.waiting[PRIORITY['upload']] = 0
+        bucket._cond.notify_all()
+    assert admitted.wait(1)
+    thread.join()
+
+
+def run_transfer(scheduler, job_id, direction='download', nbytes=CHUNK_SIZE):
+    token = current_job_id.set(job_id)
+    try:
+        with scheduler.transfer(direction, 'storage.example', nbytes) as transfer:
+            transfer.consume(nbytes)
+    finally:
+        current_job_id.reset(token)
+
+
+def test_transfer_stats_are_collected_once():
+    scheduler = TransferScheduler()
+    run_transfer(scheduler, 'job', 'upload')
+    stats = scheduler.pop_stats('job', 'upload')
+    assert stats['bytes'] == CHUNK_SIZE
+    assert scheduler.pop_stats('job', 'upload') is None
+    assert scheduler.bytes_moved == {'download': 0, 'upload': CHUNK_SIZE}
+    assert scheduler.active == {}
+
+
+def test_transfers_of_one_stage_are_combined():
+    scheduler = TransferScheduler()
+    branches = [threading.Thread(target=run_transfer, args=(scheduler, 'job', 'upload', (i + 1) * CHUNK_SIZE))
+                for i in range(2)]
+    for thread in branches:
+        thread.start()
+    for thread in branches:
+        thread.join()
+    run_transfer(scheduler, 'job', 'upload', CHUNK_SIZE)
+
+    stats = scheduler.pop_stats('job', 'upload')
+    assert stats['bytes'] == 4 * CHUNK_SIZE
+    assert stats['transfers'] == 3
+    assert scheduler.pop_stats('job', 'upload') is None
+
+
+def test_uncollected_stats_are_bounded():
+    scheduler = TransferScheduler()
+    for i in range(MAX_FINISHED_STATS + 10):
+        run_transfer(scheduler, f'job-{i}')
+    assert len(scheduler.finished) == MAX_FINISHED_STATS
+    assert scheduler.pop_stats('job-0', 'download') is None
+    assert scheduler.pop_stats(f'job-{MAX_FINISHED_STATS + 9}', 'download') is not None
+
+
+def test_transfers_outside_a_job_keep_no_stats():
+    scheduler = TransferScheduler()
+    run_transfer(scheduler, None)
+    assert scheduler.finished == {}
+
+
+@pytest.mark.parametrize('retry_after, seconds', [
+    ('2', 2), (None, DEFAULT_RETRY_AFTER), ('Wed, 21 Oct 2015 07:28:00 GMT', DEFAULT_RETRY_AFTER),
+    ('3600', MAX_RETRY_AFTER)
+])
+def test_throttle_pauses_the_host(retry_after, seconds):
+    scheduler = TransferScheduler()
+    scheduler.throttle('storage.example', retry_after)
+    paused_for = scheduler.hosts['storage.example'].paused_until - time.monotonic()
+    assert seconds - 1 < paused_for <= seconds
+
+
+def test_limits_from_env(monkeypatch):
+    monkeypatch.setenv('TRANSFER_MAX_UPLOAD_MBPS', '80')
+    monkeypatch.setenv('TRANSFER_HOST_LIMITS', 'a.example=8, b.example=16')
+    scheduler = TransferScheduler.from_env()
+    assert scheduler.total is None and list(scheduler.directions) == ['upload']
+    assert scheduler.directions['upload'].rate == 10 * 1000 * 1000
+    assert scheduler._host_bucket('b.example').rate == 2 * 1000 * 1000
+    assert scheduler._host_bucket('c.example').rate is None
@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+
+from app.preflight import PreflightResult
+from app.watch_folder import FolderWatcher
+
+
+def info(path, size=100, changed='2024-01-01T00:00:00'):
+    return {'path': path, 'size': size, 'last_modified': changed}
+
+
+@pytest.fixture
+def watcher(tmp_path):
+    return FolderWatcher(['in'], debounce=10, state_path=str(tmp_path / 'watch.json'))
+
+
+def test_new_file_is_ready_once_it_settles(watcher):
+    listing = {'in': [info('in/a.mp4')]}
+    assert watcher._diff(listing, now=0) == []
+    assert watcher._diff(listing, now=5) == []
+    assert watcher._diff(listing, now=10) == [info('in/a.mp4')]
+
+
+def test_growing_file_restarts_its_quiet_period(watcher):
+    watcher._diff({'in': [info('in/a.mp4', 100)]}, now=0)
+    assert watcher._diff({'in': [info('in/a.mp4', 200)]}, now=8) == []
+    assert watcher._diff({'in': [info('in/a.mp4', 200)]}, now=15) == []
+    assert watcher._diff({'in': [info('in/a.mp4', 200)]}, now=18) == [info('in/a.mp4', 200)]
+
+
+def test_empty_files_are_never_ready(watcher):
+    watcher._diff({'in': [info('in/a.mp4', 0)]}, now=0)
+    assert watcher._diff({'in': [info('in/a.mp4', 0)]}, now=60) == []
+
+
+def test_recorded_files_are_skipped_until_they_change(watcher):
+    watcher._record(info('in/a.mp4'))
+    assert watcher._diff({'in': [info('in/a.mp4')]}, now=0) == []
+    assert watcher._diff({'in': [info('in/a.mp4')]}, now=60) == []
+    changed = info('in/a.mp4', changed='2024-02-01T00:00:00')
+    watcher._diff({'in': [changed]}, now=100)
+    assert watcher._diff({'in': [changed]}, now=110) == [changed]
+
+
+def test_deleted_files_and_folders_are_forgotten(watcher):
+    watcher._record(info('in/a.mp4'))
+    watcher._record(info('in/sub/b.mp4'))
+    watcher._diff({'in': [], 'in/sub': [info('in/sub/b.mp4')]}, now=0)
+    assert watcher.snapshot['in'] == {}
+    watcher._diff({'in': []}, now=1)
+    assert 'in/sub' not in watcher.snapshot
+
+
+def test_unchanged_folders_are_not_diffed_again(watcher):
+    listing = {'in': [info('in/a.mp4')]}
+    watcher._record(info('in/a.mp4'))
+    watcher._diff(listing, now=0)
+    # Had the folder been diffed, the file missing from the snapshot would start settling
+    watcher.snapshot['in'].clear()
+    assert watcher._diff(listing, now=1) == []
+    assert watcher.settling == {}
+
+
+def test_snapshot_survives_a_restart(watcher):
+    watcher._record(info('in/a.mp4'))
+    watcher._save()
+    reloaded = FolderWatcher(['in'], debounce=10, state_path=watcher.state_path)
+    assert reloaded.baselined
+    assert reloaded.snapshot == {'in': {'in/a.mp4': (100, '2024-01-01T00:00:00')}}
+    # A different set of prefixes starts over with a new baseline
+    assert not FolderWatcher(['other'], state_path=watcher.state_path).baselined
+
+
+def test_poll_baselines_then_queues_settled_files(watcher, monkeypatch):
+    listings = {'in': [info('in/old.mp4')]}
+    queued = []
+
+    async def walk():
+        return listings
+
+    async def preflight(paths, sizes):
+        return {path: PreflightResult(path=path, ok=not path.endswith('bad.mp4'), reason='No video stream')
+                for path in paths}
+
+    monkeypatch.setattr(watcher, '_walk', walk)
+    monkeypatch.setattr('app.preflight.preflight_sources', preflight)
+    monkeypatch.setattr('app.queue_manager.add_encoding_job', lambda *args, **kwargs: queued.append((args, kwargs)))
+
+    assert asyncio.run(watcher.poll()) == 0
+    listings['in'] += [info('in/new.mp4'), info('in/bad.mp4')]
+    assert asyncio.run(watcher.poll()) == 0
+    for path in ('in/new.mp4', 'in/bad.mp4'):
+        signature, _ = watcher.settling[path]
+        watcher.settling[path] = (signature, 0)
+    assert asyncio.run(watcher.poll()) == 1
+
+    (args, kwargs), = queued
+    assert args == ('./input/new.mp4', './output/new.mp4', 'x265')
+    assert kwargs['remote_path'] == 'in/new.mp4' and kwargs['source_size'] == 100
+    assert watcher.rejected == 1
+    assert set(watcher.snapshot['in']) == {'in/old.mp4', 'in/new.mp4', 'in/bad.mp4'}
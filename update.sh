@@ -34,9 +34,24 @@ sudo -u "$APP_USER" /opt/video-encoder/venv/bin/pip install -r requirements.txt
 echo "🔄 Running migrations..."
 # sudo -u "$APP_USER" /opt/video-encoder/venv/bin/python manage.py migrate
 
-# Restart service
-echo "🔄 Restarting service..."
-systemctl restart "$SERVICE_NAME"
+# Hand over to the new version: reload drains the queue (running encodes keep going)
+# and the service re-executes the new code in place, which re-attaches to them
+echo "🔄 Draining and reloading service..."
+HEALTH_URL="http://localhost:8000/health"
+OLD_START=$(curl -s --max-time 5 "$HEALTH_URL" | grep -o '"started_at":[0-9.]*')
+if [ -n "$OLD_START" ] && systemctl is-active --quiet "$SERVICE_NAME"; then
+    systemctl reload "$SERVICE_NAME"
+    # Wait for the drain (DRAIN_TIMEOUT_SECONDS, 600 by default) and the new version to answer
+    for _ in $(seq 1 660); do
+        NEW_START=$(curl -s --max-time 5 "$HEALTH_URL" | grep -o '"started_at":[0-9.]*')
+        if [ -n "$NEW_START" ] && [ "$NEW_START" != "$OLD_START" ]; then
+            break
+        fi
+        sleep 1
+    done
+else
+    systemctl restart "$SERVICE_NAME"
+fi
 
 # Wait a moment and check status
 sleep 5